@@ -119,21 +119,37 @@ namespace IntelliInspect.Backend.Controllers
                 var fastApiUrl = $"http://127.0.0.1:8000/simulate";
 
                 using var httpClient = new HttpClient { Timeout = TimeSpan.FromMinutes(60) };
-                using var stream = await httpClient.GetStreamAsync(fastApiUrl);
+                using var request = new HttpRequestMessage(HttpMethod.Get, fastApiUrl);
+
+                // A reconnecting EventSource sends the id of the last event it got;
+                // the ML service resumes the simulation after it
+                if (Request.Headers.TryGetValue("Last-Event-ID", out var lastEventId))
+                {
+                    request.Headers.TryAddWithoutValidation("Last-Event-ID", lastEventId.ToString());
+                }
+
+                using var response = await httpClient.SendAsync(
+                    request,
+                    HttpCompletionOption.ResponseHeadersRead,
+                    HttpContext.RequestAborted
+                );
+                response.EnsureSuccessStatusCode();
+                using var stream = await response.Content.ReadAsStreamAsync();
                 using var reader = new StreamReader(stream);
                 using var writer = new StreamWriter(Response.Body);
 
-                while (!reader.EndOfStream)
+                // The ML service already writes SSE: pass its lines through unchanged
+                // (id: and data: fields, blank line ending each event)
+                string? line;
+                while ((line = await reader.ReadLineAsync()) != null)
                 {
-                    var line = await reader.ReadLineAsync();
-                    if (!string.IsNullOrWhiteSpace(line))
+                    await writer.WriteAsync(line + "\n");
+                    if (line.Length == 0)
                     {
-                        // Wrap properly for SSE
-                        await writer.WriteLineAsync($"data: {line}\n");
-                        await writer.WriteLineAsync(); // Empty line to terminate event
                         await writer.FlushAsync();
                     }
                 }
+                await writer.FlushAsync();
             }
             catch (Exception ex)
             {
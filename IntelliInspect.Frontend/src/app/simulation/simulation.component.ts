@@ -106,6 +106,11 @@ export class SimulationComponent implements OnInit, OnDestroy {
   errorMessage = '';
   eventSource: EventSource | null = null;
 
+  // Dropped connections retried in a row before giving up; each retry
+  // sends the last event id, so the stream resumes where it stopped
+  private readonly maxReconnects = 3;
+  private reconnects = 0;
+
   predictionData: SimulationData[] = [];
 
   stats = {
@@ -129,6 +134,7 @@ export class SimulationComponent implements OnInit, OnDestroy {
     this.eventSource = new EventSource(`http://localhost:5230/api/session/simulate`);
 
     this.eventSource.onmessage = (event) => {
+      this.reconnects = 0;
       try {
         const raw = event.data.trim();
         const jsonString = raw.startsWith("data:") ? raw.substring(5).trim() : raw;
@@ -170,6 +176,10 @@ export class SimulationComponent implements OnInit, OnDestroy {
 
     this.eventSource.onerror = (error) => {
       console.error('EventSource error:', error);
+      if (this.eventSource?.readyState === EventSource.CONNECTING && this.reconnects < this.maxReconnects) {
+        this.reconnects++;
+        return;
+      }
       this.simulationError = true;
       this.errorMessage = 'Connection error - check if backend is running';
       this.eventSource?.close();
@@ -198,6 +208,7 @@ export class SimulationComponent implements OnInit, OnDestroy {
   }
 
   private resetSimulation(): void {
+    this.reconnects = 0;
     this.simulationCompleted = false;
     this.simulationError = false;
     this.errorMessage = '';
@@ -0,0 +1,176 @@
+import asyncio
+import io
+import json
+
+import numpy as np
+import pandas as pd
+
+from dataset_cache import to_float32_block
+from instrumentation import get_logger, metrics
+from parallel_scoring import PARALLEL_MIN_ROWS, scoring_engine
+from simulation import labels_and_confidence
+
+# Input is cut into chunks of at most this many rows / bytes; each chunk is
+# parsed and scored with one predict_proba call (or one per shard), so
+# memory stays bounded by the chunk size whatever the input size. A full
+# chunk is large enough for the scoring engine to shard across its pool;
+# the byte cap only cuts it short for rows wider than 4 KiB of text
+PREDICT_CHUNK_ROWS = PARALLEL_MIN_ROWS
+PREDICT_CHUNK_BYTES = 256 * 1024 * 1024
+
+# Block size used when reading an input file from storage
+READ_BLOCK_SIZE = 1024 * 1024
+
+INPUT_FORMATS = ("csv", "ndjson")
+OUTPUT_FORMATS = ("ndjson", "csv")
+
+logger = get_logger(__name__)
+
+
+async def iter_file_blocks(path: str, block_size: int = READ_BLOCK_SIZE):
+    """Async iterator over the raw bytes of a file, read in a worker thread"""
+    with open(path, "rb") as f:
+        while True:
+            block = await asyncio.to_thread(f.read, block_size)
+            if not block:
+                return
+            yield block
+
+
+async def iter_line_chunks(byte_blocks, max_rows: int = PREDICT_CHUNK_ROWS,
+                           max_bytes: int = PREDICT_CHUNK_BYTES, header_lines: int = 0):
+    """
+    Regroup a stream of byte blocks into lists of complete, non-empty lines.
+
+    A list is emitted as soon as it holds `max_rows` lines or `max_bytes`
+    bytes, so the caller can score it while the rest is still arriving.
+    The first list holds `header_lines` more lines, so a CSV header does
+    not cost its chunk a row.
+    """
+    remainder = b""
+    lines, size = [], 0
+    limit = max_rows + header_lines
+
+    async for block in byte_blocks:
+        if not block:
+            continue
+        parts = (remainder + block).split(b"\n")
+        remainder = parts.pop()
+        for line in parts:
+            if not line.strip():
+                continue
+            lines.append(line)
+            size += len(line) + 1
+            if len(lines) >= limit or size >= max_bytes:
+                yield lines
+                lines, size, limit = [], 0, max_rows
+
+    if remainder.strip():
+        lines.append(remainder)
+    if lines:
+        yield lines
+
+
+def parse_chunk(lines: list, input_format: str, header: bytes = None) -> pd.DataFrame:
+    """Parse a list of raw lines (CSV rows under `header`, or NDJSON records)"""
+    if input_format == "ndjson":
+        return pd.DataFrame.from_records([json.loads(line) for line in lines])
+    return pd.read_csv(io.BytesIO(b"\n".join([header, *lines])))
+
+
+class BatchScorer:
+    """
+    Scores parsed chunks with one loaded model and formats the results.
+
+    Input columns are aligned to the model's features by name: missing
+    features are NaN and extra columns are ignored. Missing values are
+    filled with the imputer saved alongside the model, and rows are
+    labeled with the model's decision threshold, both as in /simulate.
+    Large chunks are sharded across the scoring engine's process pool.
+    """
+
+    def __init__(self, loaded, output_format: str = "ndjson", engine=scoring_engine, backend: str = "booster"):
+        self.loaded = loaded
+        self.backend = backend
+        self.model = loaded.scoring_model(backend)
+        self.imputer = loaded.imputer
+        self.version = loaded.version
+        self.threshold = loaded.threshold
+        self.output_format = output_format
+        self.engine = engine
+        self.feature_names = list(
+            self.imputer.feature_names if self.imputer is not None else loaded.model.feature_name_
+        )
+        self.rows_scored = 0
+
+    def score_frame(self, frame: pd.DataFrame) -> pd.DataFrame:
+        """One vectorized predict_proba call (or one per shard) for a whole chunk"""
+        features = to_float32_block(frame.reindex(columns=self.feature_names), self.feature_names)
+        if not features.flags.writeable:
+            # pandas may hand out a read-only view of its own block
+            features = features.copy()
+        labels, confidence = labels_and_confidence(
+            self.model, self.engine.score_array(self.loaded, features, self.backend), self.threshold
+        )
+
+        start = self.rows_scored
+        self.rows_scored += len(frame)
+        metrics.inc("ml_rows_scored_total", len(frame), endpoint="predict")
+        if "Id" in frame.columns:
+            ids = pd.to_numeric(frame["Id"], errors="coerce")
+            if ids.notna().all():
+                ids = ids.astype(np.int64)
+        else:
+            ids = pd.RangeIndex(start, start + len(frame))
+
+        result = pd.DataFrame({
+            "id": np.asarray(ids),
+            "prediction": np.where(labels == 1, "Pass", "Fail"),
+            "confidence": np.round(confidence, 2)
+        })
+        if "SyntheticTimestamp" in frame.columns:
+            result.insert(1, "timestamp", frame["SyntheticTimestamp"].to_numpy())
+        return result
+
+    def format(self, result: pd.DataFrame, first: bool) -> str:
+        """Serialize a scored chunk; CSV output writes its header once"""
+        if self.output_format == "csv":
+            return result.to_csv(index=False, header=first, lineterminator="\n")
+        return result.to_json(orient="records", lines=True, double_precision=4)
+
+    def process(self, lines: list, input_format: str, header: bytes, first: bool) -> str:
+        """Parse, score and serialize one chunk (runs in a worker thread)"""
+        frame = parse_chunk(lines, input_format, header)
+        return self.format(self.score_frame(frame), first)
+
+    def format_error(self, message: str) -> str:
+        if self.output_format == "csv":
+            return f"# error: {message}\n"
+        return json.dumps({"type": "error", "error": message}) + "\n"
+
+
+async def stream_predictions(scorer: BatchScorer, byte_blocks, input_format: str = "csv"):
+    """
+    Async generator scoring an input stream chunk by chunk.
+
+    Yields serialized predictions for each chunk as soon as it is scored,
+    while later chunks are still being read. Parsing and scoring run in a
+    worker thread. A chunk that fails ends the stream with an error record.
+    """
+    header = None
+    first = True
+
+    async for lines in iter_line_chunks(byte_blocks, header_lines=1 if input_format == "csv" else 0):
+        if input_format == "csv" and header is None:
+            header, lines = lines[0], lines[1:]
+            if not lines:
+                continue
+        try:
+            output = await asyncio.to_thread(scorer.process, lines, input_format, header, first)
+        except Exception as e:
+            logger.error(f"❌ Batch scoring error after {scorer.rows_scored} rows: {e}")
+            yield scorer.format_error(str(e))
+            return
+        first = False
+        metrics.inc("ml_bytes_streamed_total", len(output.encode()), endpoint="predict")
+        yield output
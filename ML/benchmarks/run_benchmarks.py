@@ -0,0 +1,206 @@
+"""
+Training/inference benchmarks for the ML service.
+
+Generates synthetic Bosch-shaped datasets, drives the FastAPI app through
+an in-process test client (no network, no running server) and writes the
+timings to a JSON file that can be diffed between versions.
+
+Usage:
+    python benchmarks/run_benchmarks.py --rows 100000 1000000 5000000 --features 1000
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ML_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ML_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+
+from synthetic_data import generate_parsed_csv, split_ranges
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_ROWS = [100_000, 500_000, 1_000_000, 5_000_000]
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2)
+
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, round(time.perf_counter() - start, 4)
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ML_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def _stream_simulation(client, params: dict) -> dict:
+    """Consume /simulate and measure time to first event and per-event latency"""
+    start = time.perf_counter()
+    first_event = None
+    events = 0
+    with client.stream("GET", "/simulate", params=params) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line.startswith("data: "):
+                continue
+            payload = json.loads(line[len("data: "):])
+            if "error" in payload:
+                raise RuntimeError(f"Simulation failed: {payload}")
+            if "prediction" in payload:
+                events += 1
+                if first_event is None:
+                    first_event = time.perf_counter() - start
+    total = time.perf_counter() - start
+    streaming = total - (first_event or 0.0)
+    return {
+        "events": events,
+        "total_seconds": round(total, 4),
+        "time_to_first_event_seconds": round(first_event or 0.0, 4),
+        "per_event_latency_us": round(streaming / max(events - 1, 1) * 1e6, 2),
+        "events_per_second": round(max(events - 1, 0) / streaming, 1) if streaming > 0 else None
+    }
+
+
+def benchmark_size(client, main_module, work_dir: str, n_rows: int, args) -> dict:
+    from dataset_cache import open_dataset
+    from imputation import MedianImputer
+    from model_registry import model_registry
+
+    storage = os.path.join(work_dir, f"rows_{n_rows}")
+    os.makedirs(storage, exist_ok=True)
+    csv_path = os.path.join(storage, "parsed.csv")
+    ranges = split_ranges(n_rows, sim_rows=args.sim_events)
+    with open(os.path.join(storage, "range_selection.json"), "w") as f:
+        json.dump(ranges, f, indent=4)
+
+    print(f"[{n_rows} rows] generating data...")
+    info, generate_seconds = _timed(
+        generate_parsed_csv, csv_path, n_rows, args.features,
+        args.sparsity, args.positive_rate, args.seed
+    )
+
+    timings = {"generate_csv": generate_seconds}
+    main_module.STORAGE_PATH = storage
+
+    # Load: one-time CSV -> columnar cache conversion, then a warm open
+    dataset, timings["load_cold_cache_build"] = _timed(open_dataset, csv_path, storage)
+    _, timings["load_warm"] = _timed(open_dataset, csv_path, storage)
+    train_rows = dataset.window(ranges["TrainStart"], ranges["TrainEnd"])
+    test_rows = dataset.window(ranges["TestStart"], ranges["TestEnd"])
+    X_train, timings["read_train_slice"] = _timed(dataset.read_rows, train_rows)
+
+    # Imputation on the training slice
+    imputer, timings["imputation_fit"] = _timed(MedianImputer(dataset.feature_names).fit, X_train)
+    _, timings["imputation_transform"] = _timed(imputer.transform, X_train)
+    del X_train
+
+    # Fit through the API: first run bins the data, second reuses the bins
+    print(f"[{n_rows} rows] training...")
+    response, timings["train_endpoint_cold"] = _timed(client.get, "/train")
+    response.raise_for_status()
+    results = response.json()
+    response, timings["train_endpoint_warm"] = _timed(client.get, "/train")
+    response.raise_for_status()
+
+    # Predict throughput on the test window with the registry's model
+    loaded = model_registry.get(os.path.join(storage, "model.pkl"))
+    X_test = dataset.read_rows(test_rows)
+    if loaded.imputer is not None:
+        loaded.imputer.transform(X_test)
+    frame = pd.DataFrame(X_test, columns=dataset.feature_names, copy=False)
+    _, predict_seconds = _timed(loaded.model.predict_proba, frame)
+    timings["predict_test_window"] = predict_seconds
+
+    print(f"[{n_rows} rows] streaming simulation...")
+    sse = _stream_simulation(client, {"pace": "max", "batch_size": args.sse_batch_size})
+
+    return {
+        "rows": n_rows,
+        "features": args.features,
+        "sparsity": args.sparsity,
+        "positive_rate": args.positive_rate,
+        "csv_size_mb": round(os.path.getsize(csv_path) / (1024 * 1024), 2),
+        "train_rows": results["training_info"]["train_rows"],
+        "test_rows": results["training_info"]["test_rows"],
+        "timings_seconds": timings,
+        "predict_rows_per_second": round(len(X_test) / predict_seconds, 1) if predict_seconds > 0 else None,
+        "simulation_stream": sse,
+        "memory_mb": {
+            "training_peak_rss": results["training_info"].get("peak_rss_mb"),
+            "benchmark_process_peak_rss": _peak_rss_mb()
+        },
+        "model_performance": results.get("model_performance")
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark training and inference of the ML service")
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS)
+    parser.add_argument("--features", type=int, default=1000)
+    parser.add_argument("--sparsity", type=float, default=0.8)
+    parser.add_argument("--positive-rate", type=float, default=0.0058)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--sim-events", type=int, default=5000)
+    parser.add_argument("--sse-batch-size", type=int, default=1)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--work-dir", default=None, help="keep generated data here instead of a temp dir")
+    args = parser.parse_args()
+
+    os.chdir(ML_DIR)
+    import main as main_module
+    from fastapi.testclient import TestClient
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="intelliinspect-bench-")
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_revision": _git_revision(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "lightgbm": lgb.__version__
+        },
+        "runs": []
+    }
+
+    try:
+        with TestClient(main_module.app) as client:
+            for n_rows in args.rows:
+                report["runs"].append(benchmark_size(client, main_module, work_dir, n_rows, args))
+                with open(args.output, "w") as f:
+                    json.dump(report, f, indent=4)
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"Results written to {os.path.abspath(args.output)}")
+
+
+if __name__ == "__main__":
+    main()
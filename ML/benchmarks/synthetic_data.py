@@ -0,0 +1,114 @@
+"""
+Generator for synthetic parsed.csv files shaped like the Bosch line data.
+
+Usage:
+    python benchmarks/synthetic_data.py out/parsed.csv --rows 1000000 --features 1000
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_START = "2021-01-01T00:00:00"
+CHUNK_ROWS = 100_000
+
+# Number of leading features whose values shift for failing parts
+INFORMATIVE_FEATURES = 10
+
+
+def generate_parsed_csv(path: str, n_rows: int, n_features: int, sparsity: float = 0.8,
+                        positive_rate: float = 0.0058, seed: int = 42,
+                        start: str = DEFAULT_START) -> dict:
+    """
+    Write a parsed.csv with the same layout the backend produces.
+
+    Columns are Id, L0_S0_F0..F{n-1}, Response and SyntheticTimestamp,
+    one second apart from `start`. Each feature value is missing with
+    probability `sparsity`; Response is 1 with probability `positive_rate`,
+    and the first few features are shifted for those rows so a model has
+    something to learn. Rows are written in chunks, so memory stays flat
+    regardless of `n_rows`.
+    """
+    rng = np.random.default_rng(seed)
+    feature_names = [f"L0_S0_F{i}" for i in range(n_features)]
+    informative = min(INFORMATIVE_FEATURES, n_features)
+    start_ts = pd.Timestamp(start)
+    positives = 0
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", newline="") as f:
+        for lo in range(0, n_rows, CHUNK_ROWS):
+            count = min(CHUNK_ROWS, n_rows - lo)
+            response = (rng.random(count) < positive_rate).astype(np.int8)
+            features = rng.standard_normal((count, n_features), dtype=np.float32)
+            features[:, :informative] += response[:, None] * 1.5
+            features[rng.random((count, n_features), dtype=np.float32) < sparsity] = np.nan
+            positives += int(response.sum())
+
+            chunk = pd.DataFrame(features, columns=feature_names, copy=False)
+            chunk.insert(0, "Id", np.arange(lo + 1, lo + count + 1))
+            chunk["Response"] = response
+            timestamps = start_ts + pd.to_timedelta(np.arange(lo, lo + count), unit="s")
+            chunk["SyntheticTimestamp"] = timestamps.strftime("%Y-%m-%dT%H:%M:%S.0000000")
+            chunk.to_csv(f, header=(lo == 0), index=False, float_format="%.4f", na_rep="")
+
+    return {
+        "path": path,
+        "rows": n_rows,
+        "features": n_features,
+        "sparsity": sparsity,
+        "positive_rate": positive_rate,
+        "positives": positives,
+        "start": str(start_ts),
+        "end": str(start_ts + pd.Timedelta(seconds=max(n_rows - 1, 0)))
+    }
+
+
+def split_ranges(n_rows: int, sim_rows: int = 1000, start: str = DEFAULT_START) -> dict:
+    """range_selection.json covering 60% train, 20% test and a short sim window"""
+    start_ts = pd.Timestamp(start)
+
+    def at(row):
+        return (start_ts + pd.Timedelta(seconds=int(row))).strftime("%Y-%m-%dT%H:%M:%S")
+
+    train_end = int(n_rows * 0.6) - 1
+    test_end = int(n_rows * 0.8) - 1
+    sim_end = min(test_end + sim_rows, n_rows - 1)
+    return {
+        "TrainStart": at(0),
+        "TrainEnd": at(train_end),
+        "TestStart": at(train_end + 1),
+        "TestEnd": at(test_end),
+        "SimStart": at(test_end + 1),
+        "SimEnd": at(sim_end)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic parsed.csv")
+    parser.add_argument("path")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--features", type=int, default=1000)
+    parser.add_argument("--sparsity", type=float, default=0.8)
+    parser.add_argument("--positive-rate", type=float, default=0.0058)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--start", default=DEFAULT_START)
+    parser.add_argument("--ranges", action="store_true",
+                        help="also write range_selection.json next to the CSV")
+    args = parser.parse_args()
+
+    info = generate_parsed_csv(
+        args.path, args.rows, args.features, args.sparsity,
+        args.positive_rate, args.seed, args.start
+    )
+    if args.ranges:
+        range_path = os.path.join(os.path.dirname(os.path.abspath(args.path)), "range_selection.json")
+        with open(range_path, "w") as f:
+            json.dump(split_ranges(args.rows, start=args.start), f, indent=4)
+    print(json.dumps(info, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import hashlib
+import json
+import os
+
+import lightgbm as lgb
+import numpy as np
+
+from dataset_cache import to_datetime64
+from imputation import MedianImputer
+from sparse_features import to_csr
+
+# Parameters that decide how features are binned. They are fixed so a
+# binned training set stays valid across hyperparameter changes;
+# feature_pre_filter is off because it depends on min_data_in_leaf.
+DATASET_PARAMS = {
+    "max_bin": 255,
+    "min_data_in_bin": 3,
+    "bin_construct_sample_cnt": 200_000,
+    "feature_pre_filter": False,
+    "verbosity": -1
+}
+
+# Same model as the former LGBMClassifier(objective='binary', n_estimators=50,
+# max_depth=6, num_leaves=31, learning_rate=0.1, subsample=0.8,
+# colsample_bytree=0.8, random_state=42, force_col_wise=True)
+MODEL_PARAMS = {
+    "objective": "binary",
+    "metric": "binary_logloss",
+    "max_depth": 6,
+    "num_leaves": 31,
+    "learning_rate": 0.1,
+    "bagging_fraction": 0.8,
+    "bagging_freq": 0,
+    "feature_fraction": 0.8,
+    "seed": 42,
+    "force_col_wise": True,  # Better for wide datasets
+    "verbosity": -1
+}
+NUM_BOOST_ROUND = 50  # Reduced for faster training
+
+# Sparse layout: NaNs and zeros are implicit CSR entries, so both must mean
+# "missing"; the median fill step is skipped
+SPARSE_DATASET_PARAMS = {**DATASET_PARAMS, "zero_as_missing": True}
+
+BINNED_DIRNAME = "binned"
+BINNED_FORMAT_VERSION = 1
+
+
+class BoosterClassifier:
+    """
+    Binary classifier around a trained lgb.Booster.
+
+    Exposes the parts of the LGBMClassifier interface the service uses
+    (predict_proba, predict, classes_, booster_), so model.pkl keeps
+    working for /simulate regardless of how the booster was trained.
+    """
+
+    def __init__(self, booster: lgb.Booster):
+        self.booster_ = booster
+        self.classes_ = np.array([0.0, 1.0])
+        self.feature_name_ = booster.feature_name()
+        self.n_features_in_ = booster.num_feature()
+        self.best_iteration_ = booster.best_iteration
+        self.sparse_input = bool(booster.params.get("zero_as_missing", False))
+
+    def _positive_proba(self, X, **kwargs) -> np.ndarray:
+        data = X.to_numpy() if hasattr(X, "to_numpy") else X
+        if getattr(self, "sparse_input", False) and isinstance(data, np.ndarray) and data.ndim == 2:
+            # Same predictions (NaN and zero are both missing), faster on mostly-empty rows
+            data = to_csr(data)
+        num_iteration = self.best_iteration_ if self.best_iteration_ > 0 else None
+        return self.booster_.predict(data, num_iteration=num_iteration, **kwargs)
+
+    def predict_proba(self, X, **kwargs) -> np.ndarray:
+        positive = self._positive_proba(X, **kwargs)
+        return np.column_stack([1.0 - positive, positive])
+
+    def predict(self, X, **kwargs) -> np.ndarray:
+        return self.classes_[(self._positive_proba(X, **kwargs) > 0.5).astype(int)]
+
+
+def dataset_params(layout: str = "dense") -> dict:
+    return SPARSE_DATASET_PARAMS if layout == "sparse" else DATASET_PARAMS
+
+
+def binned_cache_key(dataset, train_start, train_end, layout: str = "dense") -> str:
+    """Identifies a binned training set: source data, window and binning parameters"""
+    key = {
+        "format_version": BINNED_FORMAT_VERSION,
+        "content_hash": dataset.content_hash,
+        "train_start": str(to_datetime64(train_start)),
+        "train_end": str(to_datetime64(train_end)),
+        "dataset_params": dataset_params(layout),
+        "lightgbm": lgb.__version__
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()[:24]
+
+
+def binned_cache_paths(dataset, train_start, train_end, layout: str = "dense"):
+    """
+    Paths of the binary training set and its imputer for a window.
+
+    Sparse training sets are not imputed, so their imputer path is None.
+    """
+    directory = os.path.join(dataset.cache_dir, BINNED_DIRNAME)
+    key = binned_cache_key(dataset, train_start, train_end, layout)
+    imputer_path = None if layout == "sparse" else os.path.join(directory, f"{key}.imputer.json")
+    return os.path.join(directory, f"{key}.bin"), imputer_path
+
+
+def load_binned_train_set(bin_path: str, imputer_path: str, params: dict = DATASET_PARAMS):
+    """
+    Load a previously saved binned training set.
+
+    Returns (train_set, imputer), or (None, None) on a cache miss. The
+    imputer is None for sets saved without one (imputer_path None).
+    """
+    if not os.path.exists(bin_path) or (imputer_path is not None and not os.path.exists(imputer_path)):
+        return None, None
+    train_set = lgb.Dataset(bin_path, params=params, free_raw_data=True).construct()
+    return train_set, MedianImputer.load(imputer_path) if imputer_path is not None else None
+
+
+def build_train_set(X, y: np.ndarray, feature_names: list, free_raw_data: bool = True,
+                    params: dict = DATASET_PARAMS) -> lgb.Dataset:
+    """Bin the training matrix (dense or CSR) into a constructed lgb.Dataset"""
+    return lgb.Dataset(
+        X, label=y, feature_name=feature_names,
+        params=params, free_raw_data=free_raw_data
+    ).construct()
+
+
+def save_binned_train_set(train_set: lgb.Dataset, imputer: MedianImputer, bin_path: str, imputer_path: str):
+    """Persist a constructed training set so later fits skip binning"""
+    os.makedirs(os.path.dirname(bin_path), exist_ok=True)
+    tmp_bin_path = f"{bin_path}.{os.getpid()}.tmp"
+    train_set.save_binary(tmp_bin_path)
+    if imputer is not None:
+        imputer.save(imputer_path)
+    os.replace(tmp_bin_path, bin_path)
+
+
+def build_valid_set(X, y: np.ndarray, train_set: lgb.Dataset, free_raw_data: bool = True,
+                    params: dict = DATASET_PARAMS) -> lgb.Dataset:
+    """Validation set binned with the training set's bin boundaries"""
+    return lgb.Dataset(
+        X, label=y, reference=train_set,
+        params=params, free_raw_data=free_raw_data
+    ).construct()
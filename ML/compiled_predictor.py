@@ -0,0 +1,295 @@
+import math
+import os
+
+import numpy as np
+import scipy.sparse as sp
+
+from storage import atomic_write
+
+try:
+    import numba
+except ImportError:  # optional: the NumPy traversal is used instead
+    numba = None
+
+COMPILED_FOREST_FILENAME = "compiled_forest.npz"
+
+# Values of the per-request `backend` parameter
+SCORING_BACKENDS = ("booster", "compiled")
+
+# Without numba the sigmoid uses np.exp, which can differ from LightGBM's
+# exp in the last bit; differences up to this count as verified
+NUMPY_VERIFY_TOLERANCE = 1e-12
+
+# LightGBM's kZeroThreshold: |x| <= this counts as zero for missing_type=Zero
+ZERO_THRESHOLD = 1e-35
+
+# CSR input (sparse-layout test windows) is densified this many rows at a time
+SPARSE_ROW_BLOCK = 65_536
+
+MISSING_TYPES = {"None": 0, "Zero": 1, "NaN": 2}
+MISSING_ZERO = MISSING_TYPES["Zero"]
+MISSING_NAN = MISSING_TYPES["NaN"]
+
+_ARRAY_FIELDS = (
+    "tree_root", "split_feature", "threshold", "missing_type",
+    "default_left", "left_child", "right_child", "leaf_value"
+)
+
+
+if numba is not None:
+    @numba.njit(nogil=True)
+    def _raw_scores_numba(X, tree_root, split_feature, threshold, missing_type, default_left,
+                          left_child, right_child, leaf_value, out):
+        for i in range(X.shape[0]):
+            total = 0.0
+            for t in range(tree_root.shape[0]):
+                node = tree_root[t]
+                while node >= 0:
+                    fval = np.float64(X[i, split_feature[node]])
+                    kind = missing_type[node]
+                    if np.isnan(fval) and kind != 2:
+                        fval = 0.0
+                    if (kind == 1 and -1e-35 <= fval <= 1e-35) or (kind == 2 and np.isnan(fval)):
+                        go_left = default_left[node]
+                    else:
+                        go_left = fval <= threshold[node]
+                    node = left_child[node] if go_left else right_child[node]
+                total += leaf_value[~node]
+            out[i] = total
+
+    @numba.njit(nogil=True)
+    def _sigmoid_numba(raw, sigmoid, out):
+        for i in range(raw.shape[0]):
+            out[i] = 1.0 / (1.0 + math.exp(-sigmoid * raw[i]))
+
+
+class CompiledForest:
+    """
+    Array-backed copy of a trained binary LightGBM ensemble.
+
+    Every split of every tree is stored in flat node arrays (children < 0
+    point at leaves as ~leaf_index), so prediction needs neither the
+    booster nor a DataFrame. Rows are routed exactly like LightGBM's
+    NumericalDecision, in double precision, and leaf values are added in
+    tree order. With numba the probabilities match predict_proba bit for
+    bit; the NumPy fallback traverses all trees at once and applies the
+    sigmoid with np.exp, so it may differ in the last bit.
+
+    `verified` is True/False once checked against the booster with
+    verify(), and None for forests that were never checked.
+    """
+
+    def __init__(self, arrays: dict, feature_names: list, sigmoid: float = 1.0,
+                 average_output: bool = False, verified: bool = None):
+        for name in _ARRAY_FIELDS:
+            setattr(self, name, np.ascontiguousarray(arrays[name]))
+        self.feature_names = list(feature_names)
+        self.sigmoid = float(sigmoid)
+        self.average_output = bool(average_output)
+        self.verified = verified
+        self.classes_ = np.array([0.0, 1.0])
+
+    @classmethod
+    def from_model(cls, model) -> "CompiledForest":
+        """Flatten the trees a model predicts with (up to its best iteration)"""
+        booster = model.booster_
+        dump = booster.dump_model()
+        if dump["num_class"] != 1 or dump["num_tree_per_iteration"] != 1:
+            raise ValueError("Only binary models can be compiled")
+        objective = dump.get("objective", "")
+        if not objective.startswith("binary"):
+            raise ValueError(f"Unsupported objective for compilation: {objective}")
+        sigmoid = 1.0
+        for part in objective.split()[1:]:
+            if part.startswith("sigmoid:"):
+                sigmoid = float(part.split(":", 1)[1])
+
+        nodes = {name: [] for name in ("split_feature", "threshold", "missing_type",
+                                       "default_left", "left_child", "right_child")}
+        leaf_value, tree_root = [], []
+
+        for tree in dump["tree_info"]:
+            node_offset = len(nodes["split_feature"])
+            leaf_offset = len(leaf_value)
+            n_splits = tree["num_leaves"] - 1
+            for values in nodes.values():
+                values.extend([0] * n_splits)
+            leaf_value.extend([0.0] * tree["num_leaves"])
+
+            def ref(entry):
+                if "split_index" in entry:
+                    return node_offset + entry["split_index"]
+                return ~(leaf_offset + entry.get("leaf_index", 0))
+
+            root = tree["tree_structure"]
+            tree_root.append(ref(root))
+            stack = [root]
+            while stack:
+                entry = stack.pop()
+                if "split_index" not in entry:
+                    leaf_value[leaf_offset + entry.get("leaf_index", 0)] = entry["leaf_value"]
+                    continue
+                if entry["decision_type"] != "<=":
+                    raise ValueError("Categorical splits are not supported by the compiled predictor")
+                index = node_offset + entry["split_index"]
+                nodes["split_feature"][index] = entry["split_feature"]
+                nodes["threshold"][index] = entry["threshold"]
+                nodes["missing_type"][index] = MISSING_TYPES[entry["missing_type"]]
+                nodes["default_left"][index] = entry["default_left"]
+                nodes["left_child"][index] = ref(entry["left_child"])
+                nodes["right_child"][index] = ref(entry["right_child"])
+                stack.extend([entry["left_child"], entry["right_child"]])
+
+        arrays = {
+            "tree_root": np.array(tree_root, dtype=np.int32),
+            "split_feature": np.array(nodes["split_feature"], dtype=np.int32),
+            "threshold": np.array(nodes["threshold"], dtype=np.float64),
+            "missing_type": np.array(nodes["missing_type"], dtype=np.int8),
+            "default_left": np.array(nodes["default_left"], dtype=np.bool_),
+            "left_child": np.array(nodes["left_child"], dtype=np.int32),
+            "right_child": np.array(nodes["right_child"], dtype=np.int32),
+            "leaf_value": np.array(leaf_value, dtype=np.float64)
+        }
+        return cls(arrays, dump["feature_names"], sigmoid, dump.get("average_output", False))
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.tree_root)
+
+    def _raw_scores_numpy(self, X: np.ndarray) -> np.ndarray:
+        n_rows, n_trees = len(X), self.n_trees
+        node = np.repeat(self.tree_root[None, :], n_rows, axis=0)
+        active = node >= 0
+        # One step moves every unfinished (row, tree) pair down one level
+        while active.any():
+            rows, trees = np.nonzero(active)
+            current = node[rows, trees]
+            fval = X[rows, self.split_feature[current]].astype(np.float64)
+            kind = self.missing_type[current]
+            is_nan = np.isnan(fval)
+            fval[is_nan & (kind != MISSING_NAN)] = 0.0
+            use_default = ((kind == MISSING_ZERO) & (np.abs(fval) <= ZERO_THRESHOLD)) | ((kind == MISSING_NAN) & is_nan)
+            go_left = np.where(use_default, self.default_left[current], fval <= self.threshold[current])
+            following = np.where(go_left, self.left_child[current], self.right_child[current])
+            node[rows, trees] = following
+            active[rows, trees] = following >= 0
+
+        values = self.leaf_value[~node]
+        # Sum in tree order like LightGBM (np.sum would reassociate)
+        raw = np.zeros(n_rows)
+        for t in range(n_trees):
+            raw += values[:, t]
+        return raw
+
+    def raw_scores(self, X) -> np.ndarray:
+        if sp.issparse(X):
+            # Entries left out of a CSR matrix are zeros, as LightGBM reads them
+            X = sp.csr_matrix(X)
+            blocks = [self.raw_scores(X[lo:lo + SPARSE_ROW_BLOCK].toarray())
+                      for lo in range(0, X.shape[0], SPARSE_ROW_BLOCK)]
+            return np.concatenate(blocks) if blocks else np.zeros(0)
+        data = X.to_numpy() if hasattr(X, "to_numpy") else np.asarray(X)
+        if data.ndim == 1:
+            data = data[None, :]
+        if numba is not None:
+            raw = np.empty(len(data))
+            _raw_scores_numba(
+                np.ascontiguousarray(data), self.tree_root, self.split_feature, self.threshold,
+                self.missing_type, self.default_left, self.left_child, self.right_child,
+                self.leaf_value, raw
+            )
+        else:
+            raw = self._raw_scores_numpy(data)
+        if self.average_output and self.n_trees > 0:
+            raw /= self.n_trees
+        return raw
+
+    def _positive_proba(self, X) -> np.ndarray:
+        raw = self.raw_scores(X)
+        # Same C library exp as LightGBM; np.exp differs in the last bit for some inputs
+        if numba is not None:
+            positive = np.empty_like(raw)
+            _sigmoid_numba(raw, self.sigmoid, positive)
+            return positive
+        return 1.0 / (1.0 + np.exp(-self.sigmoid * raw))
+
+    def predict_proba(self, X, **kwargs) -> np.ndarray:
+        positive = self._positive_proba(X)
+        return np.column_stack([1.0 - positive, positive])
+
+    def predict(self, X, **kwargs) -> np.ndarray:
+        return self.classes_[(self._positive_proba(X) > 0.5).astype(int)]
+
+    def verify(self, model, X, expected: np.ndarray = None) -> dict:
+        """
+        Compare against model.predict_proba on X and remember the outcome.
+
+        Returns the number of rows checked, whether the probabilities are
+        identical and the largest absolute difference. The forest counts as
+        verified if they are identical, or with the NumPy engine if they
+        are within NUMPY_VERIFY_TOLERANCE. `expected` can pass the model's
+        probabilities if X was scored already.
+        """
+        if expected is None:
+            expected = model.predict_proba(X)
+        actual = self.predict_proba(X)
+        max_abs_diff = float(np.max(np.abs(expected - actual))) if len(actual) else 0.0
+        identical = bool(np.array_equal(expected, actual))
+        tolerance = 0.0 if numba is not None else NUMPY_VERIFY_TOLERANCE
+        self.verified = identical or max_abs_diff <= tolerance
+        return {
+            "rows_checked": len(actual),
+            "identical": identical,
+            "max_abs_diff": max_abs_diff,
+            "tolerance": tolerance
+        }
+
+    def save(self, path: str):
+        with atomic_write(path, "wb") as f:
+            np.savez(
+                f,
+                feature_names=np.array(self.feature_names),
+                sigmoid=self.sigmoid,
+                average_output=self.average_output,
+                verified=np.int8(-1 if self.verified is None else self.verified),
+                **{name: getattr(self, name) for name in _ARRAY_FIELDS}
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "CompiledForest":
+        with np.load(path) as data:
+            arrays = {name: data[name] for name in _ARRAY_FIELDS}
+            verified = int(data["verified"])
+            return cls(
+                arrays, data["feature_names"].tolist(), float(data["sigmoid"]),
+                bool(data["average_output"]), None if verified < 0 else bool(verified)
+            )
+
+    def describe(self) -> dict:
+        return {
+            "trees": self.n_trees,
+            "nodes": len(self.split_feature),
+            "verified": self.verified,
+            "engine": compiled_engine()
+        }
+
+
+def compiled_engine() -> str:
+    """Kernel the compiled predictor runs on in this process"""
+    return "numba" if numba is not None else "numpy"
+
+
+def available_backends() -> tuple:
+    """
+    Scoring backends worth offering here.
+
+    The NumPy fallback is slower than the booster, so the compiled backend
+    is only offered when numba is installed.
+    """
+    return SCORING_BACKENDS if numba is not None else ("booster",)
+
+
+def load_compiled_forest(artifacts_dir: str):
+    """The forest saved with a model version (verified or not), or None"""
+    path = os.path.join(artifacts_dir, COMPILED_FOREST_FILENAME)
+    return CompiledForest.load(path) if os.path.exists(path) else None
@@ -0,0 +1,395 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+
+from dataset_stats import RESPONSE_CUMSUM_FILENAME, STATS_FILENAME, StatsAccumulator, response_cumsum
+from instrumentation import get_logger, span
+from storage import atomic_write_json, file_lock
+from timestamp_index import TimestampIndex, build_timestamp_index
+
+# Columns that are never used as model features
+META_COLUMNS = ['Response', 'Id', 'SyntheticTimestamp']
+
+CACHE_DIRNAME = "dataset_cache"
+CACHE_FORMAT_VERSION = 3
+CHUNK_SIZE = 50_000
+HASH_BLOCK_SIZE = 8 * 1024 * 1024
+
+# Replaced datasets whose caches are kept in case they are still being read
+KEEP_UNREFERENCED_CACHES = 2
+
+_open_datasets = {}
+# One lock per CSV path (hashing, sources) and per content hash (conversion),
+# so opening one dataset never waits for another one's conversion
+_open_locks = {}
+_open_locks_guard = threading.Lock()
+
+logger = get_logger(__name__)
+
+
+def file_fingerprint(path: str) -> dict:
+    """Cheap change detector for a file: size and modification time"""
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def file_hash(path: str) -> str:
+    """SHA-256 of the file contents, read in large blocks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def to_datetime64(value) -> np.datetime64:
+    """Normalise a range bound (string or timestamp) to a naive datetime64[ns]"""
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is not None:
+        ts = ts.tz_convert("UTC").tz_localize(None)
+    return np.datetime64(ts.as_unit("ns").to_datetime64(), "ns")
+
+
+class CachedDataset:
+    """
+    Read-only view over a converted parsed.csv.
+
+    Features are a row-major float32 matrix memory-mapped from disk, so
+    slicing rows never copies; Id, Response and SyntheticTimestamp are
+    stored as separate arrays and only touched when asked for.
+    """
+
+    def __init__(self, cache_dir: str, manifest: dict):
+        self.cache_dir = cache_dir
+        self.manifest = manifest
+        self.content_hash = manifest["content_hash"]
+        self.feature_names = manifest["feature_names"]
+        self.n_rows = manifest["n_rows"]
+
+        shape = (self.n_rows, len(self.feature_names))
+        self.features_path = os.path.join(cache_dir, "features.f32")
+        if self.n_rows > 0 and shape[1] > 0:
+            self.features = np.memmap(self.features_path, dtype=np.float32, mode="r", shape=shape)
+        else:
+            self.features = np.empty(shape, dtype=np.float32)
+
+        self.timestamps = np.load(os.path.join(cache_dir, "timestamps.npy"), mmap_mode="r")
+        self.ids = self._load_optional("ids.npy")
+        self.response = self._load_optional("response.npy")
+        self.response_cumsum = self._load_optional(RESPONSE_CUMSUM_FILENAME)
+        self._stats = None
+
+        index_info = manifest["timestamp_index"]
+        self.timestamp_index = None
+        if index_info["sorted"]:
+            samples = np.load(os.path.join(cache_dir, "timestamp_index.npy"))
+            self.timestamp_index = TimestampIndex(samples, index_info["stride"], self.timestamps)
+
+    def _load_optional(self, name: str):
+        path = os.path.join(self.cache_dir, name)
+        return np.load(path, mmap_mode="r") if os.path.exists(path) else None
+
+    def window_mask(self, start, end) -> np.ndarray:
+        """Boolean row mask for start <= SyntheticTimestamp <= end"""
+        return (self.timestamps >= to_datetime64(start)) & (self.timestamps <= to_datetime64(end))
+
+    def window(self, start, end):
+        """
+        Row selector for start <= SyntheticTimestamp <= end.
+
+        Uses the sparse timestamp index to return a contiguous slice, so the
+        rows outside the window are never read. Falls back to a full mask
+        if the file turned out not to be in timestamp order.
+        """
+        with span("masking"):
+            if self.timestamp_index is None:
+                return self.window_mask(start, end)
+            return self.timestamp_index.row_range(to_datetime64(start), to_datetime64(end))
+
+    @property
+    def stats(self) -> dict:
+        """Statistics gathered when the cache was built (kept in memory after the first read)"""
+        if self._stats is None:
+            with open(os.path.join(self.cache_dir, STATS_FILENAME), "r") as f:
+                self._stats = json.load(f)
+        return self._stats
+
+    def window_counts(self, start, end) -> dict:
+        """
+        Rows and pass/fail counts of a window without reading its rows.
+
+        Contiguous windows use the running counts (two lookups); files
+        not in timestamp order fall back to counting the mask.
+        """
+        rows = self.window(start, end)
+        counts = {"rows": self.count(rows), "pass": 0, "fail": 0}
+        if self.response is None:
+            return counts
+        if isinstance(rows, slice) and self.response_cumsum is not None:
+            lo, hi, _ = rows.indices(self.n_rows)
+            hi = max(hi, lo)
+            passed, failed = self.response_cumsum[hi] - self.response_cumsum[lo]
+        else:
+            response = np.asarray(self.response[rows])
+            passed, failed = np.count_nonzero(response == 1), np.count_nonzero(response == 0)
+        counts["pass"], counts["fail"] = int(passed), int(failed)
+        return counts
+
+    def count(self, rows) -> int:
+        """Number of rows picked by a selector returned from window()"""
+        if isinstance(rows, slice):
+            return len(range(*rows.indices(self.n_rows)))
+        return int(np.count_nonzero(rows))
+
+    def read_rows(self, rows) -> np.ndarray:
+        """
+        Writable float32 copy of the selected feature rows.
+
+        Contiguous windows are copied from the already open mapping, so
+        only their pages are read, and the rows stay readable even if the
+        cache directory has been replaced on disk since.
+        """
+        if not isinstance(rows, slice):
+            return np.array(self.features[rows])
+        start, stop, _ = rows.indices(self.n_rows)
+        return np.array(self.features[start:max(stop, start)])
+
+
+def _cache_root(storage_path: str) -> str:
+    return os.path.join(storage_path, CACHE_DIRNAME)
+
+
+def _read_sources(cache_root: str) -> dict:
+    sources_path = os.path.join(cache_root, "sources.json")
+    if not os.path.exists(sources_path):
+        return {}
+    try:
+        with open(sources_path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_sources(cache_root: str, sources: dict):
+    atomic_write_json(os.path.join(cache_root, "sources.json"), sources, indent=4)
+
+
+def _read_manifest(cache_dir: str):
+    manifest_path = os.path.join(cache_dir, "manifest.json")
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r") as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != CACHE_FORMAT_VERSION:
+        return None
+    return manifest
+
+
+def to_float32_block(chunk: pd.DataFrame, feature_cols: list) -> np.ndarray:
+    """Feature columns of a parsed chunk as a C-contiguous float32 matrix (non-numeric values become NaN)"""
+    features = chunk[feature_cols]
+    non_numeric = [col for col in feature_cols if not pd.api.types.is_numeric_dtype(features[col])]
+    if non_numeric:
+        features = features.copy()
+        for col in non_numeric:
+            features[col] = pd.to_numeric(features[col], errors="coerce")
+    return np.ascontiguousarray(features.to_numpy(dtype=np.float32, na_value=np.nan))
+
+
+def build_cache(csv_path: str, cache_dir: str, content_hash: str) -> dict:
+    """
+    Convert parsed.csv into the columnar cache in a single streaming pass.
+
+    The same pass gathers the dataset statistics (stats.json) and the
+    running pass/fail counts used for window class counts. The cache is
+    written into a temporary directory and renamed into place, so readers
+    never observe a half-written cache.
+    """
+    cache_root = os.path.dirname(cache_dir)
+    os.makedirs(cache_root, exist_ok=True)
+    build_dir = tempfile.mkdtemp(prefix=".build-", dir=cache_root)
+
+    try:
+        feature_cols = None
+        has_id = has_response = False
+        ids, response, timestamps = [], [], []
+        n_rows = 0
+        stats = None
+
+        with open(os.path.join(build_dir, "features.f32"), "wb") as features_file:
+            for chunk in pd.read_csv(csv_path, chunksize=CHUNK_SIZE):
+                if feature_cols is None:
+                    if 'SyntheticTimestamp' not in chunk.columns:
+                        raise ValueError("Missing 'SyntheticTimestamp' column in CSV.")
+                    feature_cols = [col for col in chunk.columns if col not in META_COLUMNS]
+                    has_id = 'Id' in chunk.columns
+                    has_response = 'Response' in chunk.columns
+                    stats = StatsAccumulator(feature_cols)
+
+                block = to_float32_block(chunk, feature_cols)
+                features_file.write(block.tobytes())
+
+                chunk_ts = pd.to_datetime(chunk['SyntheticTimestamp'])
+                if chunk_ts.dt.tz is not None:
+                    chunk_ts = chunk_ts.dt.tz_convert("UTC").dt.tz_localize(None)
+                timestamps.append(chunk_ts.to_numpy(dtype="datetime64[ns]"))
+
+                if has_id:
+                    ids.append(pd.to_numeric(chunk['Id'], errors="coerce").to_numpy())
+                if has_response:
+                    response.append(
+                        pd.to_numeric(chunk['Response'], errors="coerce").to_numpy(dtype=np.float32)
+                    )
+                stats.update(block, timestamps[-1], response[-1] if has_response else None)
+                n_rows += len(chunk)
+
+        if feature_cols is None:
+            raise ValueError("No rows loaded from the CSV.")
+
+        timestamps = np.concatenate(timestamps)
+        np.save(os.path.join(build_dir, "timestamps.npy"), timestamps)
+
+        index = build_timestamp_index(timestamps)
+        np.save(os.path.join(build_dir, "timestamp_index.npy"), index["samples"])
+        if has_id:
+            np.save(os.path.join(build_dir, "ids.npy"), np.concatenate(ids))
+        if has_response:
+            response = np.concatenate(response)
+            np.save(os.path.join(build_dir, "response.npy"), response)
+            np.save(os.path.join(build_dir, RESPONSE_CUMSUM_FILENAME), response_cumsum(response))
+        with open(os.path.join(build_dir, STATS_FILENAME), "w") as f:
+            json.dump(stats.finish(), f, indent=4)
+
+        manifest = {
+            "format_version": CACHE_FORMAT_VERSION,
+            "content_hash": content_hash,
+            "n_rows": n_rows,
+            "feature_names": feature_cols,
+            "feature_dtype": "float32",
+            "timestamp_index": {"stride": index["stride"], "sorted": index["sorted"]},
+            "source": {"path": os.path.abspath(csv_path), **file_fingerprint(csv_path)},
+        }
+        with open(os.path.join(build_dir, "manifest.json"), "w") as f:
+            json.dump(manifest, f, indent=4)
+
+        try:
+            os.rename(build_dir, cache_dir)
+        except OSError:
+            # Another worker finished the same conversion first; use theirs
+            shutil.rmtree(build_dir, ignore_errors=True)
+        return manifest
+
+    except Exception:
+        shutil.rmtree(build_dir, ignore_errors=True)
+        raise
+
+
+def _prune_unreferenced(cache_root: str, sources: dict):
+    """
+    Remove cache directories that no source file points at any more.
+
+    The KEEP_UNREFERENCED_CACHES most recently modified of them are left
+    alone: a training job, simulation or scoring worker may still be
+    reading a dataset that was just replaced by a new upload.
+    """
+    referenced = {entry["content_hash"] for entry in sources.values()}
+    unreferenced = [
+        entry for entry in os.scandir(cache_root)
+        if entry.is_dir() and not entry.name.startswith(".") and entry.name not in referenced
+    ]
+    unreferenced.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in unreferenced[KEEP_UNREFERENCED_CACHES:]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def _lock_for(key: str) -> threading.Lock:
+    with _open_locks_guard:
+        return _open_locks.setdefault(key, threading.Lock())
+
+
+def open_dataset(csv_path: str, storage_path: str, build: bool = True) -> CachedDataset:
+    """
+    Return the cached columnar form of `csv_path`, converting it if needed.
+
+    The cache is keyed on the CSV's content hash. Size and mtime are checked
+    on every call; the file is only re-hashed when they change (e.g. after a
+    new upload). Caches nothing refers to any more are dropped, apart from
+    the most recent few.
+
+    With build=False nothing is hashed, converted or waited for: None is
+    returned unless the cache is ready (used by cheap status queries).
+    """
+    csv_path = os.path.abspath(csv_path)
+    fingerprint = file_fingerprint(csv_path)
+    memo_key = (csv_path, fingerprint["size"], fingerprint["mtime_ns"])
+
+    dataset = _open_datasets.get(memo_key)
+    if dataset is not None:
+        return dataset
+    path_lock = _lock_for(csv_path)
+    if not path_lock.acquire(blocking=build):
+        # This file is being hashed or converted
+        return None
+    try:
+        return _open_locked(csv_path, storage_path, fingerprint, memo_key, build)
+    finally:
+        path_lock.release()
+
+
+def _open_locked(csv_path: str, storage_path: str, fingerprint: dict, memo_key: tuple, build: bool):
+    dataset = _open_datasets.get(memo_key)
+    if dataset is not None:
+        return dataset
+
+    cache_root = _cache_root(storage_path)
+    os.makedirs(cache_root, exist_ok=True)
+    sources = _read_sources(cache_root)
+    entry = sources.get(csv_path)
+
+    if entry and entry["size"] == fingerprint["size"] and entry["mtime_ns"] == fingerprint["mtime_ns"]:
+        content_hash = entry["content_hash"]
+    elif not build:
+        return None
+    else:
+        logger.info(f"Hashing {csv_path} for dataset cache lookup")
+        with span("csv_hash"):
+            content_hash = file_hash(csv_path)
+
+    cache_dir = os.path.join(cache_root, content_hash)
+    manifest = _read_manifest(cache_dir)
+    if manifest is None:
+        if not build:
+            return None
+        # Another path with the same contents may be converting it right now
+        with _lock_for(content_hash):
+            manifest = _read_manifest(cache_dir)
+            if manifest is None:
+                logger.info(f"Building columnar cache for {csv_path}")
+                shutil.rmtree(cache_dir, ignore_errors=True)
+                with span("csv_load"):
+                    build_cache(csv_path, cache_dir, content_hash)
+                manifest = _read_manifest(cache_dir)
+                logger.info(f"Cached {manifest['n_rows']} rows x {len(manifest['feature_names'])} features")
+
+    if entry is None or entry.get("content_hash") != content_hash or entry["mtime_ns"] != fingerprint["mtime_ns"]:
+        # Sessions share the cache root; other processes may have added
+        # their sources since we read the file
+        with file_lock(os.path.join(cache_root, ".sources.lock")):
+            sources = _read_sources(cache_root)
+            sources[csv_path] = {"content_hash": content_hash, **fingerprint}
+            _write_sources(cache_root, sources)
+            _prune_unreferenced(cache_root, sources)
+
+    # Drop handles to older versions of this file
+    for key in [key for key in list(_open_datasets) if key[0] == csv_path]:
+        _open_datasets.pop(key, None)
+
+    dataset = CachedDataset(cache_dir, manifest)
+    _open_datasets[memo_key] = dataset
+    return dataset
@@ -0,0 +1,150 @@
+import numpy as np
+
+from imputation import MedianImputer
+
+STATS_FILENAME = "stats.json"
+RESPONSE_CUMSUM_FILENAME = "response_cumsum.npy"
+
+# Range selection keys of each window
+RANGE_WINDOWS = {
+    "train": ("TrainStart", "TrainEnd"),
+    "test": ("TestStart", "TestEnd"),
+    "simulation": ("SimStart", "SimEnd")
+}
+
+# Medians are computed from an evenly spaced sample of at most this many
+# rows / values (exact for smaller datasets)
+MEDIAN_SAMPLE_ROWS = 100_000
+MEDIAN_SAMPLE_CELLS = 10_000_000
+
+
+class StatsAccumulator:
+    """
+    Dataset statistics gathered chunk by chunk while the cache is built.
+
+    Counts (rows and pass/fail per day, nulls per column, timestamp range)
+    are exact. Medians come from an evenly spaced row sample: every
+    `stride`-th row is kept, and the stride doubles (dropping every other
+    kept row) whenever the sample outgrows twice the target size, so
+    memory stays bounded without knowing the row count in advance.
+    """
+
+    def __init__(self, feature_names: list, sample_rows: int = MEDIAN_SAMPLE_ROWS):
+        self.feature_names = list(feature_names)
+        self.sample_rows = max(1, min(sample_rows, MEDIAN_SAMPLE_CELLS // max(len(feature_names), 1)))
+        self.n_rows = 0
+        self.null_counts = np.zeros(len(feature_names), dtype=np.int64)
+        self.days = {}  # day -> [rows, pass, fail]
+        self.min_timestamp = None
+        self.max_timestamp = None
+        self.stride = 1
+        self.sample = []
+
+    def update(self, features: np.ndarray, timestamps: np.ndarray, response: np.ndarray = None):
+        """Fold in one chunk (features as float32 rows, timestamps as datetime64[ns])"""
+        n = len(features)
+        if n == 0:
+            return
+        self.null_counts += np.count_nonzero(np.isnan(features), axis=0)
+
+        valid = timestamps[~np.isnat(timestamps)]
+        if len(valid):
+            lo, hi = valid.min(), valid.max()
+            self.min_timestamp = lo if self.min_timestamp is None else min(self.min_timestamp, lo)
+            self.max_timestamp = hi if self.max_timestamp is None else max(self.max_timestamp, hi)
+
+        day_values, day_index = np.unique(timestamps.astype("datetime64[D]"), return_inverse=True)
+        rows = np.bincount(day_index, minlength=len(day_values))
+        if response is not None:
+            passed = np.bincount(day_index, weights=response == 1, minlength=len(day_values))
+            failed = np.bincount(day_index, weights=response == 0, minlength=len(day_values))
+        else:
+            passed = failed = np.zeros(len(day_values))
+        for day, day_rows, day_pass, day_fail in zip(day_values, rows, passed, failed):
+            key = "unknown" if np.isnat(day) else str(day)
+            counts = self.days.setdefault(key, [0, 0, 0])
+            counts[0] += int(day_rows)
+            counts[1] += int(day_pass)
+            counts[2] += int(day_fail)
+
+        # Global row numbers of this chunk that fall on the current stride
+        first = (-self.n_rows) % self.stride
+        self.sample.append(np.array(features[first::self.stride]))
+        self.n_rows += n
+        if sum(len(block) for block in self.sample) > 2 * self.sample_rows:
+            self._thin_sample()
+
+    def _thin_sample(self):
+        kept = np.concatenate(self.sample)
+        self.stride *= 2
+        self.sample = [kept[::2]]
+
+    def finish(self) -> dict:
+        """The statistics as stored in stats.json"""
+        sample = (
+            np.concatenate(self.sample) if self.sample
+            else np.empty((0, len(self.feature_names)), dtype=np.float32)
+        )
+        medians = MedianImputer(self.feature_names).fit(sample).medians if len(sample) else None
+
+        columns = {}
+        for i, name in enumerate(self.feature_names):
+            median = None if medians is None or np.isnan(medians[i]) else float(medians[i])
+            columns[name] = {
+                "null_fraction": float(self.null_counts[i] / self.n_rows) if self.n_rows else 0.0,
+                "median": median
+            }
+
+        total_pass = sum(counts[1] for counts in self.days.values())
+        total_fail = sum(counts[2] for counts in self.days.values())
+        return {
+            "n_rows": self.n_rows,
+            "min_timestamp": None if self.min_timestamp is None else str(self.min_timestamp),
+            "max_timestamp": None if self.max_timestamp is None else str(self.max_timestamp),
+            "response": {
+                "pass": total_pass,
+                "fail": total_fail,
+                "unlabeled": self.n_rows - total_pass - total_fail
+            },
+            "daily": [
+                {"date": day, "rows": rows, "pass": passed, "fail": failed}
+                for day, (rows, passed, failed) in sorted(self.days.items())
+            ],
+            "columns": columns,
+            "median_sample_rows": len(sample)
+        }
+
+
+def response_cumsum(response: np.ndarray) -> np.ndarray:
+    """
+    Running (pass, fail) counts with a leading zero row.
+
+    Rows [a, b) hold cumsum[b] - cumsum[a] passes and fails, so class
+    counts of any contiguous window cost two lookups.
+    """
+    counts = np.zeros((len(response) + 1, 2), dtype=np.int64)
+    np.cumsum(response == 1, out=counts[1:, 0])
+    np.cumsum(response == 0, out=counts[1:, 1])
+    return counts
+
+
+def range_counts(dataset, ranges: dict) -> dict:
+    """Rows and pass/fail counts of every window present in a range selection"""
+    return {
+        name: dataset.window_counts(ranges[start], ranges[end])
+        for name, (start, end) in RANGE_WINDOWS.items()
+        if start in ranges and end in ranges
+    }
+
+
+def stats_summary(dataset) -> dict:
+    """The small part of the statistics shown by /status"""
+    stats = dataset.stats
+    return {
+        "content_hash": dataset.content_hash,
+        "n_rows": stats["n_rows"],
+        "features": len(dataset.feature_names),
+        "min_timestamp": stats["min_timestamp"],
+        "max_timestamp": stats["max_timestamp"],
+        "response": stats["response"]
+    }
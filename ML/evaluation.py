@@ -0,0 +1,222 @@
+import json
+import math
+import os
+
+import numpy as np
+
+from storage import atomic_write_json
+
+THRESHOLD_FILENAME = "decision_threshold.json"
+DEFAULT_THRESHOLD = 0.5
+
+# Scores are counted into this many equal-width bins; every curve,
+# threshold and calibration bin is derived from those counts
+SCORE_BINS = 10_000
+CURVE_POINTS = 101
+CALIBRATION_BINS = 10
+
+# Feature drift: train-decile bins plus one for missing values, measured
+# on evenly spaced row samples of at most this many rows / values
+PSI_BINS = 10
+PSI_SAMPLE_ROWS = 100_000
+PSI_SAMPLE_CELLS = 10_000_000
+PSI_EPSILON = 1e-4
+PSI_ROW_BLOCK = 2048
+PSI_MODERATE = 0.1
+PSI_MAJOR = 0.25
+TOP_DRIFT_FEATURES = 20
+
+
+def save_decision_threshold(directory: str, analysis: dict):
+    """Write the chosen threshold next to a model version's artifacts"""
+    chosen = analysis["chosen"]
+    atomic_write_json(os.path.join(directory, THRESHOLD_FILENAME), {
+        "threshold": chosen["threshold"],
+        "criterion": analysis["criterion"],
+        "precision": chosen["precision"],
+        "recall": chosen["recall"],
+        "f1_score": chosen["f1_score"]
+    }, indent=4)
+
+
+def load_decision_threshold(directory: str) -> float:
+    """The threshold saved with a model version, or 0.5 for models saved without one"""
+    path = os.path.join(directory, THRESHOLD_FILENAME)
+    if not os.path.exists(path):
+        return DEFAULT_THRESHOLD
+    with open(path, "r") as f:
+        return float(json.load(f)["threshold"])
+
+
+def _rounded(values, digits: int = 6) -> list:
+    return [None if not math.isfinite(value) else round(value, digits) for value in np.asarray(values, dtype=np.float64).tolist()]
+
+
+def _metrics_at(y: np.ndarray, proba: np.ndarray, threshold: float) -> dict:
+    predicted = proba > threshold
+    tp = int(np.count_nonzero(predicted & (y == 1)))
+    fp = int(np.count_nonzero(predicted & (y == 0)))
+    fn = int(np.count_nonzero(~predicted & (y == 1)))
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    f1 = 2 * tp / (2 * tp + fp + fn) if tp + fp + fn else 0.0
+    return {
+        "threshold": round(threshold, 6),
+        "precision": round(precision * 100, 2),
+        "recall": round(recall * 100, 2),
+        "f1_score": round(f1 * 100, 2),
+        "predicted_positive": tp + fp
+    }
+
+
+def threshold_analysis(y: np.ndarray, proba: np.ndarray) -> dict:
+    """
+    ROC and PR curves, the F1-optimal threshold and calibration of test scores.
+
+    One pass counts rows, positives and summed scores into SCORE_BINS
+    score bins; everything else is cumulative sums over those bins, so the
+    cost is linear in the rows and no sort is needed. Candidate thresholds
+    are the bin edges. The F1-optimal edge is then checked exactly against
+    the scores with the `proba > threshold` rule used at scoring time.
+    """
+    y = np.asarray(y)
+    proba = np.asarray(proba, dtype=np.float64)
+    n = len(proba)
+    index = np.minimum((proba * SCORE_BINS).astype(np.int64), SCORE_BINS - 1)
+    counts = np.bincount(index, minlength=SCORE_BINS)
+    positives = np.bincount(index, weights=(y == 1), minlength=SCORE_BINS)
+    score_sums = np.bincount(index, weights=proba, minlength=SCORE_BINS)
+    negatives = counts - positives
+    total_pos, total_neg = float(positives.sum()), float(negatives.sum())
+
+    # Rows at or above each edge k / SCORE_BINS (k = 0 .. SCORE_BINS)
+    tp = np.append(np.cumsum(positives[::-1])[::-1], 0.0)
+    fp = np.append(np.cumsum(negatives[::-1])[::-1], 0.0)
+    thresholds = np.arange(SCORE_BINS + 1) / SCORE_BINS
+    with np.errstate(invalid="ignore", divide="ignore"):
+        tpr = tp / total_pos
+        fpr = fp / total_neg
+        precision = np.where(tp + fp > 0, tp / (tp + fp), 1.0)
+        f1 = 2 * tp / (2 * tp + fp + (total_pos - tp))
+
+    analysis = {"rows": n, "positives": int(total_pos), "negatives": int(total_neg), "criterion": "max_f1"}
+    if total_pos == 0 or total_neg == 0:
+        analysis.update({"roc_auc": None, "average_precision": None, "chosen": None,
+                         "reason": "test window has only one class"})
+    else:
+        # Edges run from the highest recall to the lowest, so reverse for integration
+        analysis["roc_auc"] = round(float(np.trapezoid(tpr[::-1], fpr[::-1])), 6)
+        analysis["average_precision"] = round(float(np.sum((tpr[:-1] - tpr[1:]) * precision[:-1])), 6)
+        best = int(np.nanargmax(f1[:-1]))
+        analysis["chosen"] = _metrics_at(y, proba, float(thresholds[best]))
+    analysis["at_default_threshold"] = _metrics_at(y, proba, DEFAULT_THRESHOLD)
+
+    # Curve points spread evenly over the rows rather than over the score range
+    above = np.append(np.cumsum(counts[::-1])[::-1], 0)
+    points = np.unique(np.searchsorted(-above, -np.linspace(n, 0, CURVE_POINTS), side="left"))
+    points = points[points <= SCORE_BINS]
+    analysis["curves"] = {
+        "threshold": _rounded(thresholds[points]),
+        "fpr": _rounded(fpr[points]),
+        "tpr": _rounded(tpr[points]),
+        "precision": _rounded(precision[points]),
+        "recall": _rounded(tpr[points])
+    }
+
+    per_bin = SCORE_BINS // CALIBRATION_BINS
+    bin_counts = counts.reshape(CALIBRATION_BINS, per_bin).sum(axis=1)
+    bin_positives = positives.reshape(CALIBRATION_BINS, per_bin).sum(axis=1)
+    bin_scores = score_sums.reshape(CALIBRATION_BINS, per_bin).sum(axis=1)
+    occupied = bin_counts > 0
+    mean_predicted = np.where(occupied, bin_scores / np.maximum(bin_counts, 1), np.nan)
+    observed = np.where(occupied, bin_positives / np.maximum(bin_counts, 1), np.nan)
+    analysis["calibration"] = {
+        "bins": [
+            {
+                "lower": round(i / CALIBRATION_BINS, 2),
+                "upper": round((i + 1) / CALIBRATION_BINS, 2),
+                "rows": int(bin_counts[i]),
+                "mean_predicted": None if not occupied[i] else round(float(mean_predicted[i]), 6),
+                "observed_rate": None if not occupied[i] else round(float(observed[i]), 6)
+            }
+            for i in range(CALIBRATION_BINS)
+        ],
+        "expected_calibration_error": round(float(
+            np.sum(bin_counts[occupied] * np.abs(mean_predicted[occupied] - observed[occupied])) / max(n, 1)
+        ), 6),
+        "brier_score": round(float(np.mean((proba - (y == 1)) ** 2)), 6) if n else None
+    }
+    return analysis
+
+
+def _sample_rows(dataset, rows, limit: int) -> np.ndarray:
+    """Evenly spaced row numbers of a window selector, at most `limit` of them"""
+    if isinstance(rows, slice):
+        start, stop, _ = rows.indices(dataset.n_rows)
+        selected = np.arange(start, stop)
+    else:
+        rows = np.asarray(rows)
+        selected = np.flatnonzero(rows) if rows.dtype == bool else rows
+    step = max(1, math.ceil(len(selected) / max(limit, 1)))
+    return selected[::step]
+
+
+def _bin_counts(sample: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """Rows per (feature, bin), the last bin holding missing values"""
+    n_features, n_edges = edges.shape
+    n_bins = n_edges + 2
+    counts = np.zeros(n_features * n_bins, dtype=np.int64)
+    offsets = np.arange(n_features) * n_bins
+    for lo in range(0, len(sample), PSI_ROW_BLOCK):
+        block = sample[lo:lo + PSI_ROW_BLOCK]
+        # Bin = number of edges at or below the value (NaN compares below none)
+        index = np.count_nonzero(block[:, :, None] >= edges[None, :, :], axis=2)
+        index[np.isnan(block)] = n_bins - 1
+        counts += np.bincount((index + offsets).ravel(), minlength=len(counts))
+    return counts.reshape(n_features, n_bins)
+
+
+def feature_drift(dataset, train_rows, test_rows) -> dict:
+    """
+    Population stability index of every feature between the Train and Test windows.
+
+    Bins are the deciles of each feature's training values plus a bin
+    for missing values, computed on evenly spaced row samples read from
+    the columnar cache (raw values, before any median fill). Both
+    windows are histogrammed for all features at once; a PSI of 0.1 or
+    more is usually read as moderate drift and 0.25 or more as major.
+    """
+    names = dataset.feature_names
+    limit = min(PSI_SAMPLE_ROWS, PSI_SAMPLE_CELLS // max(len(names), 1))
+    train_sample = dataset.read_rows(_sample_rows(dataset, train_rows, limit))
+    test_sample = dataset.read_rows(_sample_rows(dataset, test_rows, limit))
+    if len(names) == 0 or len(train_sample) == 0 or len(test_sample) == 0:
+        return {"method": "psi", "psi": {}, "top_features": []}
+
+    # Deciles of the non-missing training values; NaNs sort to the end
+    ordered = np.sort(train_sample, axis=0)
+    present = np.count_nonzero(~np.isnan(ordered), axis=0)
+    quantiles = np.arange(1, PSI_BINS) / PSI_BINS
+    positions = np.maximum((quantiles[:, None] * (present[None, :] - 1)).astype(np.int64), 0)
+    edges = np.take_along_axis(ordered, positions, axis=0).T
+
+    expected = _bin_counts(train_sample, edges) / len(train_sample)
+    actual = _bin_counts(test_sample, edges) / len(test_sample)
+    expected = np.maximum(expected, PSI_EPSILON)
+    actual = np.maximum(actual, PSI_EPSILON)
+    psi = np.sum((actual - expected) * np.log(actual / expected), axis=1)
+
+    order = np.argsort(-psi)
+    return {
+        "method": "psi",
+        "bins": PSI_BINS,
+        "train_sample_rows": len(train_sample),
+        "test_sample_rows": len(test_sample),
+        "features_moderate_drift": int(np.count_nonzero((psi >= PSI_MODERATE) & (psi < PSI_MAJOR))),
+        "features_major_drift": int(np.count_nonzero(psi >= PSI_MAJOR)),
+        "top_features": [
+            {"feature": names[i], "psi": round(float(psi[i]), 4)}
+            for i in order[:TOP_DRIFT_FEATURES]
+        ],
+        "psi": {name: round(float(value), 4) for name, value in zip(names, psi)}
+    }
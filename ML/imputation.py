@@ -0,0 +1,78 @@
+import json
+
+import numpy as np
+
+from instrumentation import span
+from storage import atomic_write_json
+
+IMPUTER_FILENAME = "imputer.json"
+
+# Columns sorted together when fitting, and rows filled together when
+# transforming; both bound the temporary memory to a slice of the input
+FIT_COLUMN_BLOCK = 64
+TRANSFORM_ROW_BLOCK = 65_536
+
+
+class MedianImputer:
+    """
+    Missing-value imputer fitted on the training slice.
+
+    Medians are computed once for all columns of the training matrix and
+    reused as-is for the test window, /simulate and batch scoring, so every
+    input the model sees is filled the same way. Columns that are entirely
+    missing in training keep NaN, which LightGBM treats as missing.
+    """
+
+    def __init__(self, feature_names: list, medians=None):
+        self.feature_names = list(feature_names)
+        self.medians = None if medians is None else np.asarray(medians, dtype=np.float64)
+
+    def fit(self, X: np.ndarray) -> "MedianImputer":
+        """Compute every column's median, ignoring NaNs"""
+        n_rows, n_cols = X.shape
+        medians = np.full(n_cols, np.nan)
+
+        with span("imputation_fit"):
+            for lo in range(0, n_cols, FIT_COLUMN_BLOCK):
+                hi = min(lo + FIT_COLUMN_BLOCK, n_cols)
+                # NaNs sort to the end, so the middle of the non-NaN prefix is the median
+                block = np.sort(X[:, lo:hi], axis=0)
+                present = n_rows - np.count_nonzero(np.isnan(block), axis=0)
+                has_values = present > 0
+                lower = np.maximum((present - 1) // 2, 0)
+                upper = np.maximum(present // 2, 0)
+                cols = np.arange(hi - lo)
+                middle = (block[lower, cols].astype(np.float64) + block[upper, cols].astype(np.float64)) / 2
+                medians[lo:hi] = np.where(has_values, middle, np.nan)
+
+        self.medians = medians
+        return self
+
+    def transform(self, X: np.ndarray) -> np.ndarray:
+        """Fill NaNs in place with the fitted medians and return X"""
+        fill = self.medians.astype(X.dtype)
+        with span("imputation"):
+            for lo in range(0, len(X), TRANSFORM_ROW_BLOCK):
+                block = X[lo:lo + TRANSFORM_ROW_BLOCK]
+                np.copyto(block, fill, where=np.isnan(block))
+        return X
+
+    def fit_transform(self, X: np.ndarray) -> np.ndarray:
+        return self.fit(X).transform(X)
+
+    def to_dict(self) -> dict:
+        return {
+            "strategy": "median",
+            "feature_names": self.feature_names,
+            "medians": [None if np.isnan(value) else float(value) for value in self.medians]
+        }
+
+    def save(self, path: str):
+        atomic_write_json(path, self.to_dict())
+
+    @classmethod
+    def load(cls, path: str) -> "MedianImputer":
+        with open(path, "r") as f:
+            data = json.load(f)
+        medians = [np.nan if value is None else value for value in data["medians"]]
+        return cls(data["feature_names"], medians)
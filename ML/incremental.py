@@ -0,0 +1,129 @@
+import json
+import os
+
+import joblib
+import lightgbm as lgb
+import numpy as np
+
+from dataset_cache import to_datetime64
+from imputation import IMPUTER_FILENAME, MedianImputer
+from model_registry import artifacts_dir, model_version
+from storage import atomic_write_json
+
+TRAINING_STATE_FILENAME = "training_state.json"
+
+# Trees added per incremental update (early stopping may keep fewer)
+INCREMENTAL_BOOST_ROUND = 20
+
+# Past this many trees an incremental request falls back to a full fit
+MAX_INCREMENTAL_TREES = 500
+
+ONE_NS = np.timedelta64(1, "ns")
+
+
+def save_training_state(directory: str, state: dict):
+    """Write the window and counts a model was trained on next to its artifacts"""
+    atomic_write_json(os.path.join(directory, TRAINING_STATE_FILENAME), state, indent=4)
+
+
+def training_state(dataset, train_start, train_end, positive: int, negative: int, trees: int,
+                   feature_layout: str = "dense", previous: dict = None) -> dict:
+    return {
+        "content_hash": dataset.content_hash,
+        "train_start": str(to_datetime64(train_start)),
+        "train_end": str(to_datetime64(train_end)),
+        "positive_samples": positive,
+        "negative_samples": negative,
+        "trees": trees,
+        "feature_layout": feature_layout,
+        "incremental_updates": previous["incremental_updates"] + 1 if previous else 0
+    }
+
+
+class IncrementalPlan:
+    """What an incremental update reuses from the previous model and what it adds"""
+
+    def __init__(self, previous_version: str, previous_state: dict, init_model: lgb.Booster,
+                 imputer: MedianImputer, new_rows: list, reused_rows: int):
+        self.previous_version = previous_version
+        self.previous_state = previous_state
+        self.init_model = init_model
+        self.imputer = imputer
+        self.new_rows = new_rows
+        self.reused_rows = reused_rows
+
+    @property
+    def feature_layout(self) -> str:
+        # States written before the sparse layout existed are dense
+        return self.previous_state.get("feature_layout", "dense")
+
+    @property
+    def previous_trees(self) -> int:
+        return self.init_model.num_trees()
+
+
+def _load_previous(model_path: str):
+    if not os.path.exists(model_path):
+        return None, None, None
+    version = model_version(model_path)
+    directory = artifacts_dir(model_path, version)
+    state_path = os.path.join(directory, TRAINING_STATE_FILENAME)
+    if not os.path.exists(state_path):
+        return version, None, directory
+    with open(state_path, "r") as f:
+        return version, json.load(f), directory
+
+
+def plan_incremental(dataset, model_path: str, train_start, train_end):
+    """
+    Decide whether a training window can be fitted as an update of the last model.
+
+    The new window qualifies if it uses the same dataset, overlaps the
+    previous window and adds rows to it (TrainEnd moved forward and/or
+    TrainStart moved back). The update keeps the previous model's feature
+    layout (see train_model). Only rows outside the previous window are new
+    work; rows that slid out of the window stay represented by the old
+    trees. Returns (plan, None) or (None, reason for a full fit).
+    """
+    version, state, directory = _load_previous(model_path)
+    if version is None:
+        return None, "no previous model"
+    if state is None:
+        return None, f"model {version} has no training state"
+    if state["content_hash"] != dataset.content_hash:
+        return None, "dataset changed since the previous model"
+
+    previous_start = np.datetime64(state["train_start"], "ns")
+    previous_end = np.datetime64(state["train_end"], "ns")
+    start, end = to_datetime64(train_start), to_datetime64(train_end)
+    if start > previous_end or end < previous_start:
+        return None, "training window does not overlap the previous one"
+    if end <= previous_end and start >= previous_start:
+        return None, "training window adds no rows to the previous one"
+    if state["trees"] + INCREMENTAL_BOOST_ROUND > MAX_INCREMENTAL_TREES:
+        return None, f"previous model already has {state['trees']} trees"
+
+    # Sparse-layout models read missing values as they are and have no imputer
+    sparse = state.get("feature_layout", "dense") == "sparse"
+    imputer_path = os.path.join(directory, IMPUTER_FILENAME)
+    if not sparse and not os.path.exists(imputer_path):
+        return None, f"model {version} has no saved imputer"
+
+    new_rows = []
+    if start < previous_start:
+        new_rows.append(dataset.window(start, previous_start - ONE_NS))
+    if end > previous_end:
+        new_rows.append(dataset.window(previous_end + ONE_NS, end))
+    overlap = dataset.window(max(start, previous_start), min(end, previous_end))
+
+    # Continue from the trees the previous model actually predicts with
+    previous_model = joblib.load(model_path)
+    booster = previous_model.booster_
+    best_iteration = booster.best_iteration if booster.best_iteration > 0 else None
+    init_model = lgb.Booster(model_str=booster.model_to_string(num_iteration=best_iteration))
+
+    plan = IncrementalPlan(
+        version, state, init_model, None if sparse else MedianImputer.load(imputer_path),
+        new_rows, dataset.count(overlap)
+    )
+    return plan, None
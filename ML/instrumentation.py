@@ -0,0 +1,288 @@
+import logging
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from urllib.parse import parse_qs
+
+# DEBUG also logs every streamed event; WARNING keeps stdout quiet
+LOG_LEVEL = os.environ.get("ML_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+# Requests can ask for a profile (?profile=1) only when this is set
+PROFILING_ENABLED = os.environ.get("ML_PROFILING", "0").lower() in ("1", "true", "yes")
+PROFILE_INTERVAL_SECONDS = float(os.environ.get("ML_PROFILE_INTERVAL_MS", "5")) / 1000
+PROFILES_DIRNAME = "profiles"
+KEEP_PROFILES = 20
+
+# Histogram buckets of ml_span_seconds, from per-batch predicts to full fits
+SPAN_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0, 120.0, math.inf)
+
+METRIC_TYPES = {
+    "ml_span_seconds": ("histogram", "Time spent in instrumented sections (dataset load, fit, predict, SSE flush, ...)"),
+    "ml_rows_scored_total": ("counter", "Rows scored, by endpoint"),
+    "ml_rows_trained_total": ("counter", "Rows used to fit models"),
+    "ml_training_runs_total": ("counter", "Finished training runs, by mode"),
+    "ml_sweep_fits_total": ("counter", "Candidate fits run by hyperparameter sweeps"),
+    "ml_sse_events_total": ("counter", "Server-sent events written by /simulate"),
+    "ml_simulation_streams_total": ("counter", "Simulation streams opened, by whether scored results were shared and whether they resumed"),
+    "ml_bytes_streamed_total": ("counter", "Bytes written by streaming endpoints"),
+    "ml_active_streams": ("gauge", "Streaming responses currently open, by endpoint"),
+}
+
+_logging_configured = False
+_logging_lock = threading.Lock()
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Logger for a service module, writing to stdout at ML_LOG_LEVEL.
+
+    Training and scoring worker processes import the same modules, so
+    they log with the same level and format.
+    """
+    global _logging_configured
+    with _logging_lock:
+        if not _logging_configured:
+            root = logging.getLogger("ml")
+            handler = logging.StreamHandler(sys.stdout)
+            handler.setFormatter(logging.Formatter(LOG_FORMAT))
+            root.addHandler(handler)
+            root.setLevel(LOG_LEVEL)
+            root.propagate = False
+            _logging_configured = True
+    return logging.getLogger(f"ml.{name}")
+
+
+def _labels_key(labels: dict) -> tuple:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = [*key, *extra]
+    if not pairs:
+        return ""
+    escaped = (
+        (name, value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n"))
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class MetricsRegistry:
+    """
+    Process-local counters, gauges and span histograms.
+
+    Updates are a dict increment under a lock, cheap enough for per-batch
+    use on hot paths. render() produces the Prometheus text format. A
+    worker process's metrics can be shipped to the API process with
+    snapshot() and folded in with merge().
+    """
+
+    def __init__(self, buckets: tuple = SPAN_BUCKETS):
+        self.buckets = buckets
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}  # (name, labels) -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def gauge_add(self, name: str, delta: float, **labels):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + delta
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            entry = self._histograms.get(key)
+            if entry is None:
+                entry = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def span(self, name: str, **labels):
+        """Record the wall time of the block under ml_span_seconds{span=name}"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("ml_span_seconds", time.perf_counter() - start, span=name, **labels)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "histograms": {key: [list(counts), total, n] for key, (counts, total, n) in self._histograms.items()}
+            }
+
+    def merge(self, snapshot: dict):
+        with self._lock:
+            for key, value in snapshot["counters"].items():
+                self._counters[key] = self._counters.get(key, 0) + value
+            for key, (counts, total, n) in snapshot["histograms"].items():
+                entry = self._histograms.get(key)
+                if entry is None:
+                    entry = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+                entry[0] = [a + b for a, b in zip(entry[0], counts)]
+                entry[1] += total
+                entry[2] += n
+
+    def render(self) -> str:
+        with self._lock:
+            series = {}
+            for (name, key), value in self._counters.items():
+                series.setdefault(name, []).append(f"{name}{_format_labels(key)} {_format_value(value)}")
+            for (name, key), value in self._gauges.items():
+                series.setdefault(name, []).append(f"{name}{_format_labels(key)} {_format_value(value)}")
+            for (name, key), (counts, total, n) in sorted(self._histograms.items()):
+                lines = series.setdefault(name, [])
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(key, (('le', _format_value(bound)),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(key)} {_format_value(total)}")
+                lines.append(f"{name}_count{_format_labels(key)} {n}")
+
+        output = []
+        for name in sorted(series):
+            kind, description = METRIC_TYPES.get(name, ("untyped", name))
+            output.append(f"# HELP {name} {description}")
+            output.append(f"# TYPE {name} {kind}")
+            output.extend(series[name])
+        return "\n".join(output) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+def span(name: str, **labels):
+    """Shortcut for metrics.span on the process-wide registry"""
+    return metrics.span(name, **labels)
+
+
+async def track_stream(chunks, endpoint: str):
+    """Pass a streamed body through, counted in ml_active_streams while it is open"""
+    metrics.gauge_add("ml_active_streams", 1, endpoint=endpoint)
+    try:
+        async for chunk in chunks:
+            yield chunk
+    finally:
+        metrics.gauge_add("ml_active_streams", -1, endpoint=endpoint)
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler sampling the stacks of every thread.
+
+    A background thread records all Python stacks every `interval` seconds,
+    so time spent in worker threads (scoring, parsing) is seen as well as
+    the event loop. Samples are written in the collapsed-stack format
+    ("outer;inner count" per line) read by flamegraph.pl and speedscope.
+    Work done in other processes (training and scoring pools) is not seen.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL_SECONDS):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def write(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _prune_profiles(directory: str):
+    profiles = sorted(
+        (entry for entry in os.scandir(directory) if entry.name.endswith(".folded")),
+        key=lambda entry: entry.stat().st_mtime,
+        reverse=True
+    )
+    for entry in profiles[KEEP_PROFILES:]:
+        os.remove(entry.path)
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware profiling single requests on demand.
+
+    When ML_PROFILING is enabled, a request with `profile=1` in its query
+    string is sampled from start until its (possibly streamed) response
+    is finished. The profile is written to `output_dir` and its path is
+    returned in the X-Profile-Path header. Other requests pass through
+    untouched.
+    """
+
+    def __init__(self, app, output_dir: str, enabled: bool = PROFILING_ENABLED):
+        self.app = app
+        self.output_dir = output_dir
+        self.enabled = enabled
+        self._logger = get_logger(__name__)
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        if query.get("profile", [""])[-1].lower() not in ("1", "true"):
+            return await self.app(scope, receive, send)
+
+        name = scope["path"].strip("/").replace("/", "_") or "root"
+        path = os.path.join(self.output_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{os.getpid()}-{id(scope):x}.folded")
+
+        async def send_with_header(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-path", path.encode())]}
+            await send(message)
+
+        profiler = SamplingProfiler()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_header)
+        finally:
+            profiler.stop()
+            profiler.write(path)
+            _prune_profiles(self.output_dir)
+            self._logger.info(f"Profile of {scope['path']} written to {path} ({sum(profiler.samples.values())} samples)")
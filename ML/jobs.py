@@ -0,0 +1,250 @@
+import json
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from dataset_cache import file_fingerprint
+from instrumentation import get_logger, metrics
+from sparse_features import DEFAULT_FEATURE_LAYOUT
+
+# Number of trainings allowed to run at the same time
+DEFAULT_TRAIN_WORKERS = int(os.environ.get("ML_TRAIN_WORKERS", "1"))
+
+# Finished jobs kept around for status queries
+MAX_FINISHED_JOBS = 100
+
+_progress_queue = None
+
+logger = get_logger(__name__)
+
+
+def _init_worker(progress_queue):
+    global _progress_queue
+    _progress_queue = progress_queue
+
+
+def _run_training_job(job_id: str, csv_path: str, range_selection: dict, storage_path: str,
+                      cache_path: str = None, incremental: bool = False,
+                      feature_layout: str = DEFAULT_FEATURE_LAYOUT, sweep: dict = None) -> dict:
+    """Entry point executed inside a pool process"""
+    from train_model import train_model
+
+    _progress_queue.put(("started", job_id, None))
+    try:
+        return train_model(
+            csv_path, range_selection, storage_path,
+            progress_callback=lambda record: _progress_queue.put(("progress", job_id, record)),
+            cache_path=cache_path,
+            incremental=incremental,
+            feature_layout=feature_layout,
+            sweep=sweep
+        )
+    finally:
+        # Spans and counters recorded in this process end up in the API's /metrics/runtime
+        _progress_queue.put(("metrics", job_id, metrics.snapshot()))
+
+
+class TrainingJob:
+    """State of one submitted training run"""
+
+    def __init__(self, job_id: str, key: tuple, csv_path: str, range_selection: dict, storage_path: str,
+                 cache_path: str = None, incremental: bool = False,
+                 feature_layout: str = DEFAULT_FEATURE_LAYOUT, sweep: dict = None):
+        self.id = job_id
+        self.key = key
+        self.csv_path = csv_path
+        self.range_selection = range_selection
+        self.storage_path = storage_path
+        self.cache_path = cache_path
+        self.incremental = incremental
+        self.feature_layout = feature_layout
+        self.sweep = sweep
+        self.status = "queued"
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.progress = []
+        self.result = None
+        self.error = None
+        self.future = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+    def to_dict(self, include_result: bool = True) -> dict:
+        info = {
+            "job_id": self.id,
+            "status": self.status,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "iterations_completed": len(self.progress),
+            "latest_progress": self.progress[-1] if self.progress else None,
+            "date_ranges": self.range_selection,
+            "incremental": self.incremental,
+            "feature_layout": self.feature_layout,
+            "sweep": self.sweep
+        }
+        if self.error is not None:
+            info["error"] = self.error
+        if include_result and self.result is not None:
+            info["result"] = self.result
+        return info
+
+
+class TrainingJobManager:
+    """
+    Runs training jobs in a bounded process pool.
+
+    Submitting the same (dataset, range_selection) while an identical job is
+    queued or running returns that job instead of starting another one.
+    Workers report per-iteration metrics through a queue that a background
+    thread folds into each job's progress list.
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_TRAIN_WORKERS):
+        self.max_workers = max_workers
+        self._jobs = OrderedDict()
+        self._active = {}  # dedupe key -> job id
+        self._lock = threading.Lock()
+        self._executor = None
+        self._queue = None
+
+    def _ensure_started(self):
+        if self._executor is not None:
+            return
+        # Fresh spawned process per job: no forked OpenMP state, memory is
+        # returned to the OS after each fit
+        context = multiprocessing.get_context("spawn")
+        self._queue = context.Queue()
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(self._queue,),
+            max_tasks_per_child=1
+        )
+        threading.Thread(target=self._drain_progress, name="training-progress", daemon=True).start()
+
+    def _drain_progress(self):
+        queue = self._queue
+        while True:
+            message = queue.get()
+            if message is None:
+                return
+            kind, job_id, record = message
+            if kind == "metrics":
+                metrics.merge(record)
+                continue
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    continue
+                if kind == "started":
+                    job.status = "running"
+                    job.started_at = time.time()
+                elif kind == "progress":
+                    job.progress.append(record)
+
+    @staticmethod
+    def job_key(csv_path: str, range_selection: dict, storage_path: str, incremental: bool = False,
+                feature_layout: str = DEFAULT_FEATURE_LAYOUT, sweep: dict = None) -> tuple:
+        fingerprint = file_fingerprint(csv_path)
+        return (
+            os.path.abspath(storage_path),
+            os.path.abspath(csv_path),
+            fingerprint["size"],
+            fingerprint["mtime_ns"],
+            json.dumps(range_selection, sort_keys=True),
+            incremental,
+            feature_layout,
+            json.dumps(sweep, sort_keys=True)
+        )
+
+    def submit(self, csv_path: str, range_selection: dict, storage_path: str, cache_path: str = None,
+               incremental: bool = False, feature_layout: str = DEFAULT_FEATURE_LAYOUT, sweep: dict = None):
+        """
+        Queue a training run; returns (job, deduplicated).
+
+        Outputs go to `storage_path`; `cache_path` is where the dataset
+        cache lives (defaults to `storage_path`). `incremental` asks for
+        an update of the current model and `feature_layout` picks the
+        dense or sparse feature matrix; a `sweep` spec tunes the booster
+        parameters first (see train_model).
+        """
+        key = self.job_key(csv_path, range_selection, storage_path, incremental, feature_layout, sweep)
+
+        with self._lock:
+            active_id = self._active.get(key)
+            if active_id is not None:
+                return self._jobs[active_id], True
+
+            job = TrainingJob(
+                uuid.uuid4().hex, key, csv_path, range_selection, storage_path, cache_path, incremental,
+                feature_layout, sweep
+            )
+            job.future = self._submit_to_pool(job)
+            self._jobs[job.id] = job
+            self._active[key] = job.id
+            self._prune()
+
+        job.future.add_done_callback(lambda future: self._finish(job, future))
+        logger.info(f"Queued training job {job.id}")
+        return job, False
+
+    def _submit_to_pool(self, job: TrainingJob):
+        self._ensure_started()
+        try:
+            return self._executor.submit(
+                _run_training_job, job.id, job.csv_path, job.range_selection, job.storage_path,
+                job.cache_path, job.incremental, job.feature_layout, job.sweep
+            )
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM-killed); start a fresh pool once
+            self.shutdown()
+            self._ensure_started()
+            return self._executor.submit(
+                _run_training_job, job.id, job.csv_path, job.range_selection, job.storage_path,
+                job.cache_path, job.incremental, job.feature_layout, job.sweep
+            )
+
+    def _finish(self, job: TrainingJob, future):
+        with self._lock:
+            try:
+                job.result = future.result()
+                job.status = "succeeded"
+            except Exception as e:
+                job.error = f"{type(e).__name__}: {e}"
+                job.status = "failed"
+                logger.error(f"❌ Training job {job.id} failed:\n" + "".join(traceback.format_exception(e)))
+            job.finished_at = time.time()
+            self._active.pop(job.key, None)
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> list:
+        with self._lock:
+            return [job.to_dict(include_result=False) for job in self._jobs.values()]
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._queue.put(None)
+            self._executor = None
+
+
+training_jobs = TrainingJobManager()
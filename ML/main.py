@@ -1,27 +1,141 @@
 import os
 import json
-from fastapi import FastAPI, HTTPException,Request
-from fastapi.responses import JSONResponse
-from train_model import train_model
+from fastapi import Body, FastAPI, Header, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from dataset_cache import open_dataset
+from simulation import PACE_MODES, scored_batches, stream_simulation
+from simulation_cache import simulation_cache, simulation_key
+from parallel_scoring import PARALLEL_MIN_ROWS, scoring_engine
+from batch_scoring import INPUT_FORMATS, OUTPUT_FORMATS, BatchScorer, iter_file_blocks, stream_predictions
+from model_registry import model_registry
+from compiled_predictor import SCORING_BACKENDS, available_backends
+from jobs import training_jobs
+from sparse_features import DEFAULT_FEATURE_LAYOUT, FEATURE_LAYOUTS
+from sweep import parse_sweep_spec
+from instrumentation import PROFILES_DIRNAME, ProfilingMiddleware, get_logger, metrics, track_stream
+from dataset_stats import range_counts, stats_summary
+from storage import (
+    SESSION_ID_PATTERN, atomic_write_json, dataset_path, link_dataset, list_sessions,
+    read_json_cached, session_path, store_dataset
+)
 import traceback
 from fastapi.responses import StreamingResponse
-import time
+import asyncio
 import pandas as pd
 import json
-import joblib
 
 app = FastAPI(title="ML Training API", version="1.0.0")
 
 # ✅ Define storage path globally
 STORAGE_PATH = os.path.abspath('../IntelliInspect.Backend/Storage')
 
+# How often a training progress stream checks for new iterations
+TRAINING_EVENTS_POLL_SECONDS = 0.25
+
+logger = get_logger(__name__)
+
+# Fire-and-forget tasks started by requests; the event loop only keeps weak
+# references, so they are held here until done
+background_tasks = set()
+
+# Opt-in per-request profiles (ML_PROFILING=1 and ?profile=1)
+app.add_middleware(ProfilingMiddleware, output_dir=os.path.join(STORAGE_PATH, PROFILES_DIRNAME))
+
 @app.get("/")
 def root():
     """Health check endpoint"""
     return {"message": "ML Training API is running", "status": "healthy"}
 
+def resolve_session(session: str = None, create: bool = False) -> str:
+    """
+    Storage folder of a session.
+
+    Without a session this is the storage root, where the .NET backend
+    writes parsed.csv and range_selection.json.
+    """
+    try:
+        return session_path(STORAGE_PATH, session, create)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def resolve_scoring_model(loaded, backend: str):
+    """
+    The predictor serving `backend` for a loaded model.
+
+    The compiled backend is refused where only its NumPy fallback is
+    available (numba is not installed), and for models whose compiled
+    forest did not reproduce the booster's probabilities at training time.
+    """
+    if backend not in available_backends():
+        raise HTTPException(
+            status_code=400,
+            detail=f"The {backend} backend is not available here (numba is not installed); use backend=booster"
+        )
+    try:
+        model = loaded.scoring_model(backend)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Model cannot use the compiled backend: {e}")
+    if backend == "compiled" and model.verified is False:
+        raise HTTPException(
+            status_code=409,
+            detail="Compiled predictor did not match the booster for this model; use backend=booster"
+        )
+    return model
+
+def load_training_inputs(session: str = None):
+    """
+    Resolve the CSV path, range selection and output folder for a training run.
+
+    Raises HTTPException if the files are missing or the ranges are invalid.
+    """
+    # Define file paths
+    session_folder = resolve_session(session, create=True)
+    csv_path = dataset_path(session_folder)
+    range_path = os.path.join(session_folder, 'range_selection.json')
+    
+    logger.info(f"Storage path: {session_folder}")
+    logger.info(f"CSV path: {csv_path}")
+    logger.info(f"Range selection path: {range_path}")
+    
+    # Check if required files exist
+    if not os.path.exists(csv_path):
+        raise HTTPException(
+            status_code=404, 
+            detail=f"CSV file not found at: {csv_path}"
+        )
+    
+    if not os.path.exists(range_path):
+        raise HTTPException(
+            status_code=404, 
+            detail=f"Range selection file not found at: {range_path}"
+        )
+    
+    # Load range selection
+    try:
+        with open(range_path, "r") as f:
+            range_selection = json.load(f)
+        logger.info(f"Range selection loaded: {range_selection}")
+    except Exception as e:
+        raise HTTPException(
+            status_code=400, 
+            detail=f"Error reading range selection file: {str(e)}"
+        )
+    
+    # Validate range selection format
+    required_keys = ['TrainStart', 'TrainEnd', 'TestStart', 'TestEnd']
+    missing_keys = [key for key in required_keys if key not in range_selection]
+    if missing_keys:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Missing keys in range selection: {missing_keys}"
+        )
+
+    return csv_path, range_selection, session_folder
+
 @app.get("/train")
-def train_model_endpoint():
+async def train_model_endpoint(session: str = Query(None, pattern=SESSION_ID_PATTERN),
+                               incremental: bool = Query(False),
+                               layout: str = Query(DEFAULT_FEATURE_LAYOUT, pattern=f"^({'|'.join(FEATURE_LAYOUTS)})$")):
     """
     Train the ML model using data from storage
     
@@ -29,60 +143,36 @@ def train_model_endpoint():
     - parsed.csv: The training/test data
     - range_selection.json: Date ranges for train/test split
     
+    Runs as a job in the training pool and waits for it; concurrent
+    identical requests share one job. Use POST /train/jobs to submit
+    without waiting. With `session`, inputs and outputs are that
+    session's folder, so sessions train independently.
+
+    With `incremental=true`, a Train window that extends the previous
+    one is fitted as an update of the current model (new rows only);
+    otherwise it trains from scratch.
+
+    `layout=sparse` trains on a CSR feature matrix with missing values
+    left to LightGBM instead of median-filled, for datasets with mostly
+    empty sensor columns; `layout=auto` chooses from column densities.
+    
     Returns:
     - Training results and metrics
     - Saves results to metrics.json
     """
     try:
-        print("=== Starting Model Training ===")
-        
-        # Define file paths
-        session_folder = os.path.join(STORAGE_PATH)
-        csv_path = os.path.join(session_folder, 'parsed.csv')
-        range_path = os.path.join(session_folder, 'range_selection.json')
-        
-        print(f"Storage path: {session_folder}")
-        print(f"CSV path: {csv_path}")
-        print(f"Range selection path: {range_path}")
-        
-        # Check if required files exist
-        if not os.path.exists(csv_path):
-            raise HTTPException(
-                status_code=404, 
-                detail=f"CSV file not found at: {csv_path}"
-            )
-        
-        if not os.path.exists(range_path):
-            raise HTTPException(
-                status_code=404, 
-                detail=f"Range selection file not found at: {range_path}"
-            )
-        
-        # Load range selection
-        try:
-            with open(range_path, "r") as f:
-                range_selection = json.load(f)
-            print(f"Range selection loaded: {range_selection}")
-        except Exception as e:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Error reading range selection file: {str(e)}"
-            )
-        
-        # Validate range selection format
-        required_keys = ['TrainStart', 'TrainEnd', 'TestStart', 'TestEnd']
-        missing_keys = [key for key in required_keys if key not in range_selection]
-        if missing_keys:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Missing keys in range selection: {missing_keys}"
-            )
+        logger.info("=== Starting Model Training ===")
+        csv_path, range_selection, session_folder = load_training_inputs(session)
         
         # Start training
-        print("Calling train_model function...")
-        results = train_model(csv_path, range_selection, STORAGE_PATH)
+        job, deduplicated = training_jobs.submit(
+            csv_path, range_selection, session_folder, cache_path=STORAGE_PATH, incremental=incremental,
+            feature_layout=layout
+        )
+        logger.info(f"Waiting for training job {job.id} (shared: {deduplicated})...")
+        results = await asyncio.wrap_future(job.future)
         
-        print("=== Training Completed Successfully ===")
+        logger.info("=== Training Completed Successfully ===")
         return JSONResponse(
             content=results,
             status_code=200
@@ -95,8 +185,7 @@ def train_model_endpoint():
     except Exception as e:
         # Log the full error for debugging
         error_trace = traceback.format_exc()
-        print(f"❌ Unexpected error during training:")
-        print(error_trace)
+        logger.error(f"❌ Unexpected error during training:\n{error_trace}")
         
         # Return error response
         error_response = {
@@ -107,24 +196,113 @@ def train_model_endpoint():
         
         # Try to save error to metrics file
         try:
-            error_path = os.path.join(STORAGE_PATH, "metrics.json")
-            with open(error_path, "w") as f:
-                json.dump(error_response, f, indent=4)
+            error_path = os.path.join(resolve_session(session), "metrics.json")
+            atomic_write_json(error_path, error_response, indent=4)
         except:
             pass
         
         raise HTTPException(status_code=500, detail=error_response)
 
+@app.post("/train/jobs", status_code=202)
+def submit_training_job(session: str = Query(None, pattern=SESSION_ID_PATTERN),
+                        incremental: bool = Query(False),
+                        layout: str = Query(DEFAULT_FEATURE_LAYOUT, pattern=f"^({'|'.join(FEATURE_LAYOUTS)})$")):
+    """
+    Queue a training run and return its job id immediately.
+
+    If an identical run (same dataset and range selection) is already queued
+    or running, its job is returned instead of starting a new one.
+    """
+    csv_path, range_selection, session_folder = load_training_inputs(session)
+    job, deduplicated = training_jobs.submit(
+        csv_path, range_selection, session_folder, cache_path=STORAGE_PATH, incremental=incremental,
+        feature_layout=layout
+    )
+    return {**job.to_dict(include_result=False), "deduplicated": deduplicated}
+
+@app.post("/train/sweep", status_code=202)
+def submit_training_sweep(spec: dict = Body(...),
+                          session: str = Query(None, pattern=SESSION_ID_PATTERN),
+                          layout: str = Query(DEFAULT_FEATURE_LAYOUT, pattern=f"^({'|'.join(FEATURE_LAYOUTS)})$")):
+    """
+    Queue a hyperparameter sweep and return its job id immediately.
+
+    The body is a sweep spec, e.g. {"search": "grid", "params":
+    {"num_leaves": [15, 31, 63], "learning_rate": [0.05, 0.1]},
+    "max_rounds": 200}, or "search": "random" with "n_candidates" and
+    low/high ranges. The training window is binned once and the
+    candidates are fitted in a process pool with successive halving; the
+    best one becomes the session's model and the leaderboard is written
+    to metrics.json under "sweep". Poll GET /train/jobs/{job_id}.
+    """
+    try:
+        candidates = len(parse_sweep_spec(spec)["candidates"])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    csv_path, range_selection, session_folder = load_training_inputs(session)
+    job, deduplicated = training_jobs.submit(
+        csv_path, range_selection, session_folder, cache_path=STORAGE_PATH,
+        feature_layout=layout, sweep=spec
+    )
+    return {**job.to_dict(include_result=False), "deduplicated": deduplicated, "candidates": candidates}
+
+@app.get("/train/jobs")
+def list_training_jobs():
+    """List known training jobs, oldest first"""
+    return {"jobs": training_jobs.list()}
+
+@app.get("/train/jobs/{job_id}")
+def get_training_job(job_id: str):
+    """Status, progress and (once finished) results of a training job"""
+    job = training_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Training job not found: {job_id}")
+    return job.to_dict()
+
+@app.get("/train/jobs/{job_id}/events")
+async def stream_training_job(job_id: str):
+    """Stream per-iteration training metrics of a job as server-sent events"""
+    job = training_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Training job not found: {job_id}")
+
+    async def event_generator():
+        sent = 0
+        status = None
+        while True:
+            done = job.done
+            if job.status != status:
+                status = job.status
+                yield f"data: {json.dumps({'type': 'status', 'status': status})}\n\n"
+            for record in job.progress[sent:]:
+                yield f"data: {json.dumps({'type': 'progress', **record})}\n\n"
+                sent += 1
+            if done:
+                break
+            await asyncio.sleep(TRAINING_EVENTS_POLL_SECONDS)
+
+        final = job.to_dict(include_result=False)
+        yield f"data: {json.dumps({'type': 'complete', **final})}\n\n"
+
+    return StreamingResponse(event_generator(), media_type="text/event-stream")
+
+@app.on_event("shutdown")
+def shutdown_training_jobs():
+    training_jobs.shutdown()
+    scoring_engine.shutdown()
+
 @app.get("/status")
-def get_status():
+def get_status(session: str = Query(None, pattern=SESSION_ID_PATTERN)):
     """Get current status and check if files exist"""
-    session_folder = os.path.join(STORAGE_PATH)
-    csv_path = os.path.join(session_folder, 'parsed.csv')
+    session_folder = resolve_session(session)
+    csv_path = dataset_path(session_folder)
     range_path = os.path.join(session_folder, 'range_selection.json')
     metrics_path = os.path.join(session_folder, 'metrics.json')
     
     file_status = {
         "storage_path": session_folder,
+        "session": session,
         "files": {
             "parsed_csv": {
                 "path": csv_path,
@@ -142,23 +320,70 @@ def get_status():
         }
     }
     
-    # If metrics file exists, include latest results
+    # If metrics file exists, include latest results (parsed once per file version)
     if os.path.exists(metrics_path):
         try:
-            with open(metrics_path, "r") as f:
-                latest_results = json.load(f)
+            latest_results = read_json_cached(metrics_path)
             file_status["latest_training"] = latest_results.get("status", "unknown")
             if "model_performance" in latest_results:
                 file_status["latest_performance"] = latest_results["model_performance"]
+            if "model_version" in latest_results:
+                file_status["latest_model_version"] = latest_results["model_version"]
         except:
             file_status["latest_training"] = "error_reading_metrics"
     
+    # Dataset statistics and window sizes, if the dataset has been converted
+    dataset = open_dataset(csv_path, STORAGE_PATH, build=False) if os.path.exists(csv_path) else None
+    if dataset is not None:
+        file_status["dataset"] = stats_summary(dataset)
+        if os.path.exists(range_path):
+            try:
+                file_status["windows"] = range_counts(dataset, read_json_cached(range_path))
+            except (ValueError, KeyError):
+                file_status["windows"] = "error_reading_range_selection"
+
+    if session is None:
+        file_status["sessions"] = list_sessions(STORAGE_PATH)
+    file_status["models"] = model_registry.describe()
+    file_status["scoring"] = {**scoring_engine.describe(), "backends": list(available_backends())}
+    file_status["simulations"] = simulation_cache.describe()
     return file_status
 
+@app.get("/stats")
+async def get_dataset_stats(
+    session: str = Query(None, pattern=SESSION_ID_PATTERN),
+    start: str = Query(None, description="Start of an extra window to count"),
+    end: str = Query(None, description="End of an extra window to count")
+):
+    """
+    Statistics of the session's dataset, computed once when it was converted.
+
+    Per-day row and pass/fail counts, per-column null fractions and
+    medians, the timestamp range, and exact row/class counts of the
+    train/test/simulation windows (and of start..end if given). Nothing
+    is read from the CSV after conversion.
+    """
+    session_folder = resolve_session(session)
+    csv_path = dataset_path(session_folder)
+    if not os.path.exists(csv_path):
+        raise HTTPException(status_code=404, detail=f"CSV file not found at: {csv_path}")
+    dataset = await asyncio.to_thread(open_dataset, csv_path, STORAGE_PATH)
+
+    result = {"content_hash": dataset.content_hash, **dataset.stats}
+    try:
+        range_path = os.path.join(session_folder, "range_selection.json")
+        if os.path.exists(range_path):
+            result["windows"] = range_counts(dataset, read_json_cached(range_path))
+        if start is not None and end is not None:
+            result.setdefault("windows", {})["requested"] = dataset.window_counts(start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid date range: {e}")
+    return result
+
 @app.get("/metrics")
-def get_latest_metrics():
+def get_latest_metrics(session: str = Query(None, pattern=SESSION_ID_PATTERN)):
     """Get the latest training metrics if available"""
-    metrics_path = os.path.join(STORAGE_PATH, "metrics.json")
+    metrics_path = os.path.join(resolve_session(session), "metrics.json")
     
     if not os.path.exists(metrics_path):
         raise HTTPException(
@@ -176,17 +401,68 @@ def get_latest_metrics():
             detail=f"Error reading metrics file: {str(e)}"
         )
         
+@app.get("/metrics/runtime")
+def get_runtime_metrics():
+    """
+    Service instrumentation in the Prometheus text format.
+
+    Timing spans (dataset load, masking, imputation, fit, model load,
+    per-batch predict, SSE flush) and row/event/byte counters of this API
+    process, including the training runs it started.
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/simulate")
-def simulate():
-    def event_generator():
+async def simulate(
+    pace: str = Query("fixed", pattern=f"^({'|'.join(PACE_MODES)})$"),
+    interval: float = Query(0.5, ge=0),
+    speed: float = Query(1.0, gt=0),
+    batch_size: int = Query(1, ge=1, le=1000),
+    session: str = Query(None, pattern=SESSION_ID_PATTERN),
+    backend: str = Query("booster", pattern=f"^({'|'.join(SCORING_BACKENDS)})$"),
+    cursor: str = Query(None, description="Event id to resume after, for clients that cannot send Last-Event-ID"),
+    last_event_id: str = Header(None)
+):
+    """
+    Stream predictions for the simulation window as server-sent events.
+
+    - pace=fixed: one event every `interval` seconds (default 0.5s)
+    - pace=realtime: follow SyntheticTimestamp gaps, scaled by `speed`
+    - pace=max: as fast as the client reads
+    - batch_size: events written per flush
+    - backend: booster (LightGBM) or compiled (array-backed trees, same probabilities;
+      needs numba)
+
+    Predictions use the decision threshold chosen when the model was
+    trained (F1-optimal on the Test window; 0.5 for older models).
+    Confidence is scaled around that threshold: 50% at the threshold up
+    to 100% at probability 1 (or 0 for the other label).
+
+    The model version serving the stream is returned in the X-Model-Version
+    header and in the initial info event.
+
+    A simulation is scored once per (model version, backend, dataset,
+    window) and its events are shared by every viewer. Each event has an
+    SSE `id:`; a reconnect sending it back as Last-Event-ID (or `cursor`)
+    resumes after that event instead of starting over. Ids of another
+    simulation, e.g. after retraining, restart from the first row.
+    """
+    session_folder = resolve_session(session)
+    MODEL_PATH = os.path.join(session_folder, "model.pkl")
+    loaded = None
+    model = None
+    if os.path.exists(MODEL_PATH):
+        loaded = await asyncio.to_thread(model_registry.get, MODEL_PATH)
+        model = await asyncio.to_thread(resolve_scoring_model, loaded, backend)
+
+    async def event_generator():
         try:
-            MODEL_PATH = os.path.join(STORAGE_PATH, "model.pkl")
-            csv_path = os.path.join(STORAGE_PATH, "parsed.csv")
-            range_path = os.path.join(STORAGE_PATH, "range_selection.json")
+            csv_path = dataset_path(session_folder)
+            range_path = os.path.join(session_folder, "range_selection.json")
 
-            print(f"📄 Loading data from: {csv_path}")
-            print(f"🗂️ Reading range from: {range_path}")
-            print(f"🤖 Loading model from: {MODEL_PATH}")
+            logger.info(f"📄 Loading data from: {csv_path}")
+            logger.info(f"🗂️ Reading range from: {range_path}")
+            logger.info(f"🤖 Loading model from: {MODEL_PATH}")
 
             # Check if all required files exist
             if not os.path.exists(csv_path):
@@ -197,17 +473,12 @@ def simulate():
                 yield f"data: {json.dumps({'error': 'Range selection file not found'})}\n\n"
                 return
                 
-            if not os.path.exists(MODEL_PATH):
+            if loaded is None:
                 yield f"data: {json.dumps({'error': 'Model file not found. Train model first.'})}\n\n"
                 return
 
-            # Load the trained model
-            model = joblib.load(MODEL_PATH)
-            print("✅ Model loaded successfully")
-
-            # Load data
-            df = pd.read_csv(csv_path)
-            print(f"📊 Loaded {len(df)} total rows")
+            # Model comes from the shared registry, loaded once per version
+            logger.info(f"✅ Using model version {loaded.version} ({backend})")
 
             # Load simulation range
             with open(range_path) as f:
@@ -220,82 +491,199 @@ def simulate():
 
             sim_start = pd.to_datetime(ranges["SimStart"])
             sim_end = pd.to_datetime(ranges["SimEnd"])
-            print(f"⏱️ Simulating from {sim_start} to {sim_end}")
+            logger.info(f"⏱️ Simulating from {sim_start} to {sim_end}")
 
-            # Filter simulation data
-            df["SyntheticTimestamp"] = pd.to_datetime(df["SyntheticTimestamp"])
-            sim_data = df[(df["SyntheticTimestamp"] >= sim_start) &
-                          (df["SyntheticTimestamp"] <= sim_end)]
+            # Select only the simulation window from the columnar cache
+            dataset = await asyncio.to_thread(open_dataset, csv_path, STORAGE_PATH)
+            logger.info(f"📊 Dataset has {dataset.n_rows} total rows")
+            sim_rows = dataset.window(sim_start, sim_end)
+            sim_count = dataset.count(sim_rows)
 
-            print(f"📊 Rows in simulation window: {len(sim_data)}")
+            logger.info(f"📊 Rows in simulation window: {sim_count}")
             
-            if len(sim_data) == 0:
+            if sim_count == 0:
                 yield f"data: {json.dumps({'error': 'No data found in simulation range'})}\n\n"
                 return
 
-            # Get feature columns (same as used in training)
-            feature_columns = [col for col in df.columns if col not in ['Response', 'Id', 'SyntheticTimestamp']]
-            print(f"🔧 Using features: {feature_columns}")
+            logger.info(f"🔧 Using {len(dataset.feature_names)} features")
+
+            def start_scoring():
+                # Large windows are scored in shards by the scoring pool
+                shard_scores = None
+                if scoring_engine.parallel and sim_count >= PARALLEL_MIN_ROWS:
+                    shard_scores = scoring_engine.iter_window(loaded, dataset, sim_rows, backend=backend)
+                return scored_batches(model, dataset, sim_rows, loaded.imputer, shard_scores, loaded.threshold)
+
+            # Viewers of the same simulation share one scored result set
+            key = simulation_key(loaded.version, backend, dataset.content_hash, sim_start, sim_end)
+            simulation, shared = simulation_cache.get(key, sim_count, start_scoring)
+            start = simulation.resume_position(last_event_id or cursor)
+            metrics.inc("ml_simulation_streams_total", shared=str(shared).lower(), resumed=str(start > 0).lower())
+            logger.info(f"Simulation {simulation.id}: shared={shared}, starting at row {start}")
 
             # Send initial info
-            yield f"data: {json.dumps({'type': 'info', 'message': f'Starting simulation with {len(sim_data)} samples'})}\n\n"
-
-            # Simulate each row
-            for i, (_, row) in enumerate(sim_data.iterrows()):
-                try:
-                    # Prepare features for prediction
-                    input_data = row[feature_columns].values.reshape(1, -1)
-                    
-                    # Make prediction
-                    prediction_prob = model.predict_proba(input_data)[0]
-                    prediction = model.predict(input_data)[0]
-                    confidence = max(prediction_prob) * 100
-                    
-                    # Convert prediction to Pass/Fail
-                    prediction_label = "Pass" if prediction == 1 else "Fail"
-                    
-                    # Get actual response if available
-                    actual_response = row.get("Response", "Unknown")
-                    actual_label = "Pass" if actual_response == 1 else "Fail" if actual_response == 0 else "Unknown"
-
-                    # Build event data
-                    event = {
-                        "id": row.get("Id", f"SAMPLE_{i:03d}"),
-                        "timestamp": row["SyntheticTimestamp"].isoformat(),
-                        "prediction": prediction_label,
-                        "confidence": round(confidence, 2),
-                        "actual": actual_label,
-                        "features": {col: round(float(row[col]), 2) if pd.notna(row[col]) else 0 for col in feature_columns[:3]}  # Send first 3 features for display
-                    }
-
-                    print(f"📤 Sending event {i+1}/{len(sim_data)}: {event['id']}")
-                    yield f"data: {json.dumps(event)}\n\n"
-                    
-                    # Add delay for real-time effect
-                    time.sleep(0.5)  # Reduced delay for faster simulation
-
-                except Exception as e:
-                    print(f"⚠️ Prediction error for row {i}: {e}")
-                    error_event = {
-                        "id": row.get("Id", f"SAMPLE_{i:03d}"),
-                        "timestamp": row["SyntheticTimestamp"].isoformat(),
-                        "prediction": "Error",
-                        "confidence": 0.0,
-                        "error": str(e)
-                    }
-                    yield f"data: {json.dumps(error_event)}\n\n"
+            if start == 0:
+                message = f'Starting simulation with {sim_count} samples'
+            elif start < sim_count:
+                message = f'Resuming simulation at sample {start + 1} of {sim_count}'
+            else:
+                message = f'All {sim_count} samples were already sent'
+            yield f"data: {json.dumps({'type': 'info', 'message': message, 'model_version': loaded.version, 'simulation_id': simulation.id, 'resume_from': start, 'threshold': loaded.threshold, 'feature_layout': loaded.feature_layout})}\n\n"
+
+            # Events are streamed from the shared results while the rest is scored
+            async for chunk in stream_simulation(simulation, start, pace, interval, speed, batch_size):
+                yield chunk
 
             # Send completion signal
-            print("✅ Simulation completed")
+            logger.info("✅ Simulation completed")
             yield f"data: {json.dumps({'type': 'complete', 'message': 'Simulation completed successfully'})}\n\n"
 
         except Exception as e:
-            print(f"❌ Simulation error: {e}")
+            logger.error(f"❌ Simulation error: {e}")
             yield f"data: {json.dumps({'type': 'error', 'error': str(e)})}\n\n"
 
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
+    headers = {"X-Model-Version": loaded.version, "X-Scoring-Backend": backend} if loaded else {}
+    return StreamingResponse(
+        track_stream(event_generator(), "simulate"), media_type="text/event-stream", headers=headers
+    )
+
+class BodyStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse for generators that are still reading the request body.
+
+    The stock class listens for client disconnects on receive(), which would
+    swallow the body chunks; here the body reader is the only consumer and
+    raises ClientDisconnect itself.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+
+@app.post("/predict")
+async def predict(
+    request: Request,
+    path: str = Query(None, description="File in storage to score instead of the request body"),
+    input_format: str = Query(None, pattern=f"^({'|'.join(INPUT_FORMATS)})$"),
+    output_format: str = Query("ndjson", alias="format", pattern=f"^({'|'.join(OUTPUT_FORMATS)})$"),
+    session: str = Query(None, pattern=SESSION_ID_PATTERN),
+    backend: str = Query("booster", pattern=f"^({'|'.join(SCORING_BACKENDS)})$")
+):
+    """
+    Score parts in the parsed.csv schema and stream the predictions back.
+
+    Input is the request body (CSV, or NDJSON with a JSON content type) or,
+    with `path`, a file inside the storage folder. It is parsed and scored
+    in bounded chunks, and each chunk's predictions are written as NDJSON
+    (default) or CSV (`format=csv`) while the rest is still being read.
+    The session's model is used when `session` is given; `backend`
+    selects LightGBM or the compiled tree predictor (needs numba).
+    Rows are labeled with the decision threshold chosen when the model
+    was trained, as in /simulate, and confidence is scaled around it
+    the same way; it is returned in the X-Decision-Threshold header
+    along with X-Model-Version.
+    """
+    MODEL_PATH = os.path.join(resolve_session(session), "model.pkl")
+    if not os.path.exists(MODEL_PATH):
+        raise HTTPException(status_code=404, detail="Model file not found. Train model first.")
+
+    if path is not None:
+        input_path = os.path.realpath(os.path.join(STORAGE_PATH, path))
+        if os.path.commonpath([input_path, os.path.realpath(STORAGE_PATH)]) != os.path.realpath(STORAGE_PATH):
+            raise HTTPException(status_code=400, detail="Input path must be inside the storage folder")
+        if not os.path.isfile(input_path):
+            raise HTTPException(status_code=404, detail=f"Input file not found at: {input_path}")
+        if input_format is None:
+            input_format = "ndjson" if input_path.endswith((".ndjson", ".jsonl")) else "csv"
+        byte_blocks = iter_file_blocks(input_path)
+        response_class = StreamingResponse
+    else:
+        if input_format is None:
+            input_format = "ndjson" if "json" in request.headers.get("content-type", "") else "csv"
+        byte_blocks = request.stream()
+        response_class = BodyStreamingResponse
+
+    # Model comes from the shared registry, loaded once per version
+    loaded = await asyncio.to_thread(model_registry.get, MODEL_PATH)
+    await asyncio.to_thread(resolve_scoring_model, loaded, backend)
+    scorer = BatchScorer(loaded, output_format, backend=backend)
+    logger.info(f"🤖 Batch scoring {input_format} input with model version {loaded.version} ({backend})")
+
+    media_type = "text/csv" if output_format == "csv" else "application/x-ndjson"
+    return response_class(
+        track_stream(stream_predictions(scorer, byte_blocks, input_format), "predict"),
+        media_type=media_type,
+        headers={
+            "X-Model-Version": loaded.version,
+            "X-Scoring-Backend": backend,
+            "X-Decision-Threshold": str(scorer.threshold)
+        }
+    )
+
+@app.get("/sessions")
+def get_sessions():
+    """List the session folders in storage"""
+    return {"sessions": list_sessions(STORAGE_PATH)}
+
+@app.put("/sessions/{session}/dataset")
+async def upload_session_dataset(session: str, request: Request):
+    """
+    Upload a parsed.csv for a session.
+
+    The file is stored once per content hash, so sessions uploading the
+    same data share the stored file and its columnar/binned caches.
+    """
+    session_folder = resolve_session(session, create=True)
+    dataset = await store_dataset(STORAGE_PATH, request.stream())
+    if dataset["size"] == 0:
+        raise HTTPException(status_code=400, detail="Uploaded dataset is empty")
+    link_dataset(session_folder, dataset)
+    logger.info(f"📦 Session {session} uses dataset {dataset['content_hash'][:12]} (reused: {dataset['reused']})")
+
+    # Convert it (columnar cache and statistics) right away instead of on first use
+    def conversion_done(task):
+        background_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"❌ Converting {dataset['path']} failed: {task.exception()}")
+
+    conversion = asyncio.create_task(asyncio.to_thread(open_dataset, dataset["path"], STORAGE_PATH))
+    background_tasks.add(conversion)
+    conversion.add_done_callback(conversion_done)
+    return {"session": session, **dataset}
+
+@app.put("/sessions/{session}/ranges")
+def set_session_ranges(session: str, ranges: dict):
+    """
+    Save the train/test/simulation ranges of a session.
+
+    If the session's dataset is already converted, the windows are checked
+    against its statistics: train and test must contain labeled rows. The
+    response then includes each window's row and pass/fail counts.
+    """
+    missing_keys = [key for key in ['TrainStart', 'TrainEnd', 'TestStart', 'TestEnd'] if key not in ranges]
+    if missing_keys:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Missing keys in range selection: {missing_keys}"
+        )
+    session_folder = resolve_session(session, create=True)
+
+    result = {"session": session, "range_selection": ranges}
+    csv_path = dataset_path(session_folder)
+    dataset = open_dataset(csv_path, STORAGE_PATH, build=False) if os.path.exists(csv_path) else None
+    if dataset is not None:
+        try:
+            windows = range_counts(dataset, ranges)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid date range: {e}")
+        empty = [name for name in ("train", "test") if windows[name]["pass"] + windows[name]["fail"] == 0]
+        if empty:
+            raise HTTPException(status_code=400, detail=f"No labeled rows in the {' and '.join(empty)} window")
+        result["windows"] = windows
+
+    atomic_write_json(os.path.join(session_folder, "range_selection.json"), ranges, indent=4)
+    return result
 
 if __name__ == "__main__":
     import uvicorn
-    print(f"Storage path set to: {STORAGE_PATH}")
+    logger.info(f"Storage path set to: {STORAGE_PATH}")
     uvicorn.run(app, host="127.0.0.1", port=8000, reload=True)
\ No newline at end of file
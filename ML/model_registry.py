@@ -0,0 +1,188 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import shutil
+
+import joblib
+
+from dataset_cache import file_fingerprint, file_hash
+from imputation import IMPUTER_FILENAME, MedianImputer
+from compiled_predictor import CompiledForest, load_compiled_forest
+from evaluation import load_decision_threshold
+from instrumentation import get_logger, span
+
+# Upper bound on the serialized size of models kept in memory at once
+DEFAULT_MEMORY_BUDGET_MB = int(os.environ.get("ML_MODEL_CACHE_MB", "1024"))
+
+# Per-version files saved alongside model.pkl (imputer statistics etc.)
+ARTIFACTS_DIRNAME = "model_artifacts"
+KEEP_ARTIFACT_VERSIONS = 5
+
+logger = get_logger(__name__)
+
+
+def model_version(model_path: str) -> str:
+    """Content hash identifying a saved model file"""
+    return file_hash(model_path)[:12]
+
+
+def artifacts_dir(model_path: str, version: str) -> str:
+    """Directory holding the sidecar files of one model version"""
+    return os.path.join(os.path.dirname(os.path.abspath(model_path)), ARTIFACTS_DIRNAME, version)
+
+
+def publish_model(model, model_path: str, write_artifacts=None) -> str:
+    """
+    Save a model and its sidecar files, then atomically swap it into place.
+
+    `write_artifacts(directory)` is called to write the per-version files
+    before model.pkl is replaced, so whoever sees the new model.pkl also
+    finds its artifacts. Returns the new model version.
+    """
+    tmp_model_path = f"{model_path}.{os.getpid()}.tmp"
+    joblib.dump(model, tmp_model_path)
+    version = model_version(tmp_model_path)
+
+    directory = artifacts_dir(model_path, version)
+    os.makedirs(directory, exist_ok=True)
+    if write_artifacts is not None:
+        write_artifacts(directory)
+
+    # Write to a temp file and rename, so readers never see a partial model
+    os.replace(tmp_model_path, model_path)
+    _prune_artifacts(os.path.dirname(directory), keep=version)
+    return version
+
+
+def _prune_artifacts(root: str, keep: str):
+    versions = sorted(
+        (entry for entry in os.scandir(root) if entry.is_dir()),
+        key=lambda entry: entry.stat().st_mtime,
+        reverse=True
+    )
+    for entry in versions[KEEP_ARTIFACT_VERSIONS:]:
+        if entry.name != keep:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+
+class LoadedModel:
+    """A deserialized model together with the version it was loaded from"""
+
+    def __init__(self, version: str, path: str, model, size_bytes: int):
+        self.version = version
+        self.path = path
+        self.model = model
+        self.size_bytes = size_bytes
+        self.loaded_at = time.time()
+        self.artifacts_dir = artifacts_dir(path, version)
+
+        imputer_path = os.path.join(self.artifacts_dir, IMPUTER_FILENAME)
+        self.imputer = MedianImputer.load(imputer_path) if os.path.exists(imputer_path) else None
+        # Decision threshold chosen at training time (0.5 if none was saved)
+        self.threshold = load_decision_threshold(self.artifacts_dir)
+        # Sparse-layout models read zeros as missing and have no imputer
+        self.feature_layout = "sparse" if getattr(model, "sparse_input", False) else "dense"
+        self._compiled = load_compiled_forest(self.artifacts_dir)
+        self._compile_lock = threading.Lock()
+
+    @property
+    def compiled(self) -> CompiledForest:
+        """
+        Array-backed predictor of this version.
+
+        Uses the forest verified and saved at training time; models saved
+        without one are compiled on first use (and report verified=None).
+        """
+        if self._compiled is None:
+            with self._compile_lock:
+                if self._compiled is None:
+                    self._compiled = CompiledForest.from_model(self.model)
+        return self._compiled
+
+    def scoring_model(self, backend: str = "booster"):
+        """Object whose predict_proba serves the requested scoring backend"""
+        return self.compiled if backend == "compiled" else self.model
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of trained models.
+
+    Each model file is deserialized once per content version and shared by
+    every request. A file is re-checked by size and mtime on each lookup;
+    when train_model replaces it, the new version is loaded and swapped in
+    while requests already holding the old one keep using it. Once the
+    memory budget is exceeded, models are evicted least-recently-used
+    first and simply reloaded if asked for again.
+    """
+
+    def __init__(self, memory_budget_mb: int = DEFAULT_MEMORY_BUDGET_MB):
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self._models = OrderedDict()  # version -> LoadedModel, LRU order
+        self._current = {}  # path -> (fingerprint, version)
+        self._lock = threading.Lock()
+        self._load_locks = {}
+
+    def get(self, model_path: str) -> LoadedModel:
+        """Return the current version of the model stored at `model_path`"""
+        model_path = os.path.abspath(model_path)
+        fingerprint = file_fingerprint(model_path)
+
+        with self._lock:
+            current = self._current.get(model_path)
+            if current and current[0] == fingerprint and current[1] in self._models:
+                self._models.move_to_end(current[1])
+                return self._models[current[1]]
+            load_lock = self._load_locks.setdefault(model_path, threading.Lock())
+
+        # Only one thread deserializes a given path; others wait and reuse it
+        with load_lock:
+            version = model_version(model_path)
+            with self._lock:
+                entry = self._models.get(version)
+            if entry is None:
+                with span("model_load"):
+                    model = joblib.load(model_path)
+                    entry = LoadedModel(version, model_path, model, fingerprint["size"])
+                logger.info(f"✅ Loaded model {version} from {model_path}")
+
+            with self._lock:
+                self._models[version] = entry
+                self._models.move_to_end(version)
+                self._current[model_path] = (fingerprint, version)
+                self._evict(keep=version)
+            return entry
+
+    def _evict(self, keep: str):
+        total = sum(entry.size_bytes for entry in self._models.values())
+        for version in list(self._models):
+            if total <= self.memory_budget:
+                break
+            if version != keep:
+                total -= self._models.pop(version).size_bytes
+
+    def describe(self) -> dict:
+        """Summary of loaded models for status endpoints"""
+        with self._lock:
+            current = {path: version for path, (_, version) in self._current.items()}
+            return {
+                "memory_budget_mb": round(self.memory_budget / (1024 * 1024), 2),
+                "current": current,
+                "loaded": [
+                    {
+                        "version": entry.version,
+                        "path": entry.path,
+                        "size_mb": round(entry.size_bytes / (1024 * 1024), 2),
+                        "loaded_at": entry.loaded_at,
+                        "threshold": entry.threshold,
+                        "feature_layout": entry.feature_layout,
+                        "compiled": entry._compiled.describe() if entry._compiled is not None else None
+                    }
+                    for entry in self._models.values()
+                ]
+            }
+
+
+model_registry = ModelRegistry()
@@ -0,0 +1,181 @@
+import multiprocessing
+import os
+import tempfile
+import threading
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from simulation import iter_batches, predict_proba_block
+
+# Scoring processes; 1 keeps scoring inside the API process
+DEFAULT_SCORING_WORKERS = int(os.environ.get("ML_SCORING_WORKERS", "1"))
+
+# Total LightGBM threads across all scoring processes
+DEFAULT_SCORING_THREADS = int(os.environ.get("ML_SCORING_THREADS", str(os.cpu_count() or 1)))
+
+# Rows per task sent to a scoring process
+SHARD_ROWS = 32_768
+
+# Windows smaller than this are scored in-process; the round trip costs more
+PARALLEL_MIN_ROWS = 2 * SHARD_ROWS
+
+_worker_threads = 1
+
+
+class ModelVersionMismatch(RuntimeError):
+    """The model file changed between submitting a shard and scoring it"""
+
+
+def _init_worker(threads: int):
+    global _worker_threads
+    _worker_threads = threads
+    # Set before LightGBM is first imported in this process
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+
+
+def score_features(loaded, features: np.ndarray, num_threads: int = None, backend: str = "booster") -> np.ndarray:
+    """
+    Impute and score a writable float32 block with a loaded model.
+
+    Returns the predict_proba matrix of the requested backend. Missing
+    values are filled in place with the imputer saved alongside the model.
+    """
+    if loaded.imputer is not None:
+        loaded.imputer.transform(features)
+    feature_names = (
+        loaded.imputer.feature_names if loaded.imputer is not None else list(loaded.model.feature_name_)
+    )
+    kwargs = {"num_threads": num_threads} if num_threads else {}
+    return predict_proba_block(loaded.scoring_model(backend), features, feature_names, **kwargs)
+
+
+def _score_shard(model_path: str, version: str, features_path: str, shape: tuple, rows,
+                 backend: str = "booster") -> np.ndarray:
+    """Entry point executed inside a pool process"""
+    from model_registry import model_registry
+
+    loaded = model_registry.get(model_path)
+    if loaded.version != version:
+        raise ModelVersionMismatch(f"expected model {version}, found {loaded.version}")
+
+    # Attach to the feature file by mapping it; only this shard's pages are read
+    features = np.memmap(features_path, dtype=np.float32, mode="r", shape=shape)
+    block = np.array(features[rows])
+    del features
+    return score_features(loaded, block, _worker_threads, backend)
+
+
+class ScoringEngine:
+    """
+    Splits large scoring requests into row shards scored by a process pool.
+
+    Feature matrices are never pickled: workers map the dataset cache's
+    features.f32 directly, and in-memory blocks are first written to a
+    scratch memory-mapped file (under /dev/shm when available). Each worker
+    runs LightGBM with an equal share of the thread budget, so the pool as
+    a whole never oversubscribes the machine. With one worker, or below
+    PARALLEL_MIN_ROWS, everything is scored in the calling process.
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_SCORING_WORKERS,
+                 thread_budget: int = DEFAULT_SCORING_THREADS):
+        self.max_workers = max(1, max_workers)
+        self.thread_budget = max(1, thread_budget)
+        self.threads_per_worker = max(1, self.thread_budget // self.max_workers)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def parallel(self) -> bool:
+        return self.max_workers > 1
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.threads_per_worker,)
+                )
+            return self._executor
+
+    def _submit(self, *args):
+        try:
+            return self._ensure_started().submit(_score_shard, *args)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM-killed); start a fresh pool once
+            self.shutdown()
+            return self._ensure_started().submit(_score_shard, *args)
+
+    def iter_window(self, loaded, dataset, rows, shard_rows: int = SHARD_ROWS, backend: str = "booster"):
+        """
+        Yield (shard_rows, future) for each shard of a dataset window, in order.
+
+        At most two shards per worker are in flight at a time; the next one
+        is submitted when the consumer asks for the following shard, so a
+        slow reader bounds the amount of scored-but-unsent data.
+        """
+        shape = (dataset.n_rows, len(dataset.feature_names))
+        pending = deque()
+        for shard in iter_batches(dataset, rows, shard_rows):
+            pending.append((
+                shard,
+                self._submit(loaded.path, loaded.version, dataset.features_path, shape, shard, backend)
+            ))
+            if len(pending) >= 2 * self.max_workers:
+                yield pending.popleft()
+        while pending:
+            yield pending.popleft()
+
+    def score_array(self, loaded, features: np.ndarray, backend: str = "booster") -> np.ndarray:
+        """predict_proba for an in-memory float32 block (imputed in place when scored locally)"""
+        if not self.parallel or len(features) < PARALLEL_MIN_ROWS:
+            return score_features(loaded, features, self.thread_budget, backend)
+
+        scratch_dir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+        scratch_path = os.path.join(scratch_dir, f"intelliinspect-scoring-{uuid.uuid4().hex}.f32")
+        try:
+            scratch = np.memmap(scratch_path, dtype=np.float32, mode="w+", shape=features.shape)
+            scratch[:] = features
+            scratch.flush()
+            del scratch
+
+            futures = [
+                self._submit(
+                    loaded.path, loaded.version, scratch_path, features.shape, slice(lo, lo + SHARD_ROWS), backend
+                )
+                for lo in range(0, len(features), SHARD_ROWS)
+            ]
+            try:
+                return np.concatenate([future.result() for future in futures])
+            except ModelVersionMismatch:
+                # model.pkl was replaced meanwhile; keep the caller's version
+                return score_features(loaded, features, self.thread_budget, backend)
+            finally:
+                for future in futures:
+                    future.cancel()
+        finally:
+            os.remove(scratch_path)
+
+    def describe(self) -> dict:
+        return {
+            "workers": self.max_workers,
+            "thread_budget": self.thread_budget,
+            "threads_per_worker": self.threads_per_worker,
+            "shard_rows": SHARD_ROWS,
+            "parallel_min_rows": PARALLEL_MIN_ROWS
+        }
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+scoring_engine = ScoringEngine()
@@ -0,0 +1,240 @@
+import asyncio
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import get_logger, metrics, span
+
+# Rows scored per predict_proba call while streaming a simulation
+SCORING_BATCH_SIZE = 4096
+
+# Number of leading feature values echoed in each event for display
+DISPLAY_FEATURES = 3
+
+# Replay pacing modes accepted by /simulate
+PACE_MODES = ("fixed", "realtime", "max")
+
+logger = get_logger(__name__)
+
+
+def predict_proba_block(model, features: np.ndarray, feature_names: list, **kwargs) -> np.ndarray:
+    """Class probabilities for a block of rows from a single predict_proba call"""
+    frame = pd.DataFrame(features, columns=feature_names, copy=False)
+    with span("predict_batch"):
+        return model.predict_proba(frame, **kwargs)
+
+
+def labels_and_confidence(model, proba: np.ndarray, threshold: float = 0.5):
+    """
+    Predicted class per row and the confidence of that prediction in percent.
+
+    A row is positive when its positive-class probability exceeds
+    `threshold`; at 0.5 this is the same as model.predict. Confidence is
+    scaled around the threshold rather than being the raw probability:
+    50% at the threshold, rising linearly to 100% at probability 1 for
+    positive rows and at probability 0 for negative ones. At 0.5 it is
+    the probability of the predicted class, as before; with a learned
+    threshold every label still reads as at least 50% confident.
+    """
+    positive = proba[:, 1]
+    best = (positive > threshold).astype(np.int64)
+    labels = model.classes_[best]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        margin = np.where(
+            best == 1,
+            (positive - threshold) / (1.0 - threshold),
+            (threshold - positive) / threshold
+        )
+    # A threshold of 0 leaves 0/0 for rows scored exactly 0
+    confidence = 50 + 50 * np.clip(np.nan_to_num(margin, nan=1.0), 0.0, 1.0)
+    return labels, confidence
+
+
+def _row_ids(dataset, rows, start: int, count: int):
+    if dataset.ids is None:
+        return [f"SAMPLE_{i:03d}" for i in range(start, start + count)]
+    ids = np.asarray(dataset.ids[rows])
+    if np.issubdtype(ids.dtype, np.floating) and not np.isnan(ids).any():
+        ids = ids.astype(np.int64)
+    return ids.tolist()
+
+
+def _actual_labels(dataset, rows, count: int):
+    if dataset.response is None:
+        return ["Unknown"] * count
+    response = np.asarray(dataset.response[rows])
+    return np.where(response == 1, "Pass", np.where(response == 0, "Fail", "Unknown")).tolist()
+
+
+def iter_batches(dataset, rows, batch_size: int = SCORING_BATCH_SIZE):
+    """Split a window selector (slice, mask or row indices) into micro-batch selectors"""
+    if isinstance(rows, slice):
+        start, stop, _ = rows.indices(dataset.n_rows)
+        for lo in range(start, stop, batch_size):
+            yield slice(lo, min(lo + batch_size, stop))
+    else:
+        # Boolean masks only come from files that are not in timestamp order
+        rows = np.asarray(rows)
+        if rows.dtype == bool:
+            rows = np.flatnonzero(rows)
+        for i in range(0, len(rows), batch_size):
+            yield rows[i:i + batch_size]
+
+
+def build_batch_events(model, dataset, batch_rows, position: int, imputer=None, proba=None, threshold: float = 0.5):
+    """
+    Score one micro-batch and build its events.
+
+    All per-event fields are derived with array operations, so the
+    per-event cost is a dict build and nothing else. Also returns each
+    row's timestamp in seconds, used to pace replay at recorded speed.
+    Missing values are filled with the training medians when an imputer
+    was saved with the model; displayed values stay raw. If `proba` is
+    given (already scored elsewhere), the batch is not scored again.
+    Predictions use the model's decision `threshold`.
+    """
+    display_names = dataset.feature_names[:DISPLAY_FEATURES]
+    if proba is None:
+        features = np.array(dataset.features[batch_rows])
+        shown = features[:, :len(display_names)]
+    else:
+        features = None
+        shown = np.asarray(dataset.features[batch_rows, :len(display_names)])
+    shown = np.nan_to_num(np.round(shown.astype(np.float64), 2), nan=0).tolist()
+    count = len(shown)
+    raw_timestamps = np.asarray(dataset.timestamps[batch_rows])
+    timestamps = np.datetime_as_string(raw_timestamps, unit="s").tolist()
+    seconds = (raw_timestamps.astype("datetime64[ns]").astype(np.int64) / 1e9).tolist()
+    ids = _row_ids(dataset, batch_rows, position, count)
+
+    try:
+        if proba is None:
+            if imputer is not None:
+                imputer.transform(features)
+            proba = predict_proba_block(model, features, dataset.feature_names)
+        labels, confidence = labels_and_confidence(model, proba, threshold)
+    except Exception as e:
+        logger.warning(f"⚠️ Prediction error for rows {position}-{position + count - 1}: {e}")
+        events = [
+            {
+                "id": ids[i],
+                "timestamp": timestamps[i],
+                "prediction": "Error",
+                "confidence": 0.0,
+                "error": str(e)
+            }
+            for i in range(count)
+        ]
+        return events, seconds
+
+    predictions = np.where(labels == 1, "Pass", "Fail").tolist()
+    confidence = np.round(confidence, 2).tolist()
+    actual = _actual_labels(dataset, batch_rows, count)
+
+    events = [
+        {
+            "id": ids[i],
+            "timestamp": timestamps[i],
+            "prediction": predictions[i],
+            "confidence": confidence[i],
+            "actual": actual[i],
+            "features": dict(zip(display_names, shown[i]))
+        }
+        for i in range(count)
+    ]
+    return events, seconds
+
+
+async def scored_batches(model, dataset, rows, imputer=None, shard_scores=None, threshold: float = 0.5):
+    """
+    Async iterator of (events, seconds) per micro-batch of the window.
+
+    Without `shard_scores` each batch is scored in a worker thread. With
+    it, an iterator of (shard_rows, future) from the scoring engine, the
+    shards' probabilities are awaited in order and cut into batches; a
+    shard whose scoring failed is re-scored locally.
+    """
+    position = 0
+    if shard_scores is None:
+        for batch_rows in iter_batches(dataset, rows):
+            events, seconds = await asyncio.to_thread(
+                build_batch_events, model, dataset, batch_rows, position, imputer, None, threshold
+            )
+            position += len(events)
+            metrics.inc("ml_rows_scored_total", len(events), endpoint="simulate")
+            yield events, seconds
+        return
+
+    for shard_rows, future in shard_scores:
+        try:
+            proba = await asyncio.wrap_future(future)
+        except Exception as e:
+            logger.warning(f"⚠️ Parallel scoring failed for a shard, scoring locally: {e}")
+            proba = None
+        offset = 0
+        for batch_rows in iter_batches(dataset, shard_rows):
+            count = dataset.count(batch_rows) if isinstance(batch_rows, slice) else len(batch_rows)
+            batch_proba = None if proba is None else proba[offset:offset + count]
+            events, seconds = await asyncio.to_thread(
+                build_batch_events, model, dataset, batch_rows, position, imputer, batch_proba, threshold
+            )
+            offset += count
+            position += len(events)
+            metrics.inc("ml_rows_scored_total", len(events), endpoint="simulate")
+            yield events, seconds
+
+
+async def stream_simulation(simulation, start: int = 0, pace: str = "fixed", interval: float = 0.5,
+                            speed: float = 1.0, flush_size: int = 1):
+    """
+    Async SSE generator replaying a scored simulation from position `start`.
+
+    pace="fixed" sends one event every `interval` seconds, pace="realtime"
+    follows the gaps between SyntheticTimestamps divided by `speed`, and
+    pace="max" sends as fast as the client reads. Up to `flush_size`
+    events are written per flush. Events come from the shared
+    ScoredSimulation (see simulation_cache), which is scored once in the
+    background, and waiting uses asyncio.sleep, so an open stream holds
+    no thread. Every event carries an `id:` that a reconnecting client
+    sends back as Last-Event-ID to resume after it.
+
+    Events are logged individually only at DEBUG level. The time the
+    consumer takes to write each flush is recorded as the sse_flush span.
+    """
+    loop = asyncio.get_running_loop()
+    due = loop.time()
+    previous_second = None
+    log_events = logger.isEnabledFor(logging.DEBUG)
+
+    async for position, events, seconds in simulation.read(start):
+
+        for lo in range(0, len(events), flush_size):
+            group = events[lo:lo + flush_size]
+            for offset in range(len(group)):
+                if pace == "realtime" and previous_second is not None:
+                    due += max(seconds[lo + offset] - previous_second, 0.0) / speed
+                previous_second = seconds[lo + offset]
+                if log_events:
+                    logger.debug(f"📤 Sending event {position + lo + offset + 1} of simulation {simulation.id}")
+
+            delay = due - loop.time()
+            if pace != "max" and delay > 0:
+                await asyncio.sleep(delay)
+            chunk = "".join(
+                f"id: {simulation.event_id(position + lo + offset)}\ndata: {event}\n\n"
+                for offset, event in enumerate(group)
+            )
+            flush_started = time.perf_counter()
+            yield chunk
+            metrics.observe("ml_span_seconds", time.perf_counter() - flush_started, span="sse_flush")
+            # json.dumps escapes non-ASCII, so characters are bytes
+            metrics.inc("ml_sse_events_total", len(group))
+            metrics.inc("ml_bytes_streamed_total", len(chunk), endpoint="simulate")
+
+            if pace == "fixed":
+                due += interval * len(group)
+            elif pace == "max":
+                # Let other streams run between flushes
+                await asyncio.sleep(0)
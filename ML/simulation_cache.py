@@ -0,0 +1,213 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+
+from dataset_cache import to_datetime64
+from instrumentation import get_logger
+
+# Memory for the scored events of all cached simulations
+DEFAULT_SIMULATION_CACHE_MB = int(os.environ.get("ML_SIMULATION_CACHE_MB", "256"))
+
+# Events handed to a viewer per read, so resuming deep into a window
+# does not copy it all at once
+READ_BATCH_EVENTS = 4096
+
+# How far scoring may run ahead of the furthest viewer, in events
+SCORING_LOOKAHEAD_EVENTS = 65_536
+
+logger = get_logger(__name__)
+
+
+def simulation_key(model_version: str, backend: str, content_hash: str, sim_start, sim_end) -> tuple:
+    """Identifies one scored simulation: model, scoring backend, dataset and window"""
+    return (model_version, backend, content_hash, str(to_datetime64(sim_start)), str(to_datetime64(sim_end)))
+
+
+class ScoredSimulation:
+    """
+    Scored events of one simulation window, shared by all its viewers.
+
+    A single producer task scores the window batch by batch and appends
+    each event as serialized JSON; viewers read from any position and wait
+    for the producer when they catch up. The producer stays at most
+    SCORING_LOOKAHEAD_EVENTS ahead of the furthest position any viewer
+    has read, so memory grows with what viewers consume rather than with
+    the window. When every viewer has left it pauses there, and a
+    reconnect resumes from cached events.
+    """
+
+    def __init__(self, key: tuple, total: int):
+        self.key = key
+        self.id = hashlib.sha256(json.dumps(key).encode()).hexdigest()[:12]
+        self.total = total
+        self.events = []
+        self.seconds = []
+        self.nbytes = 0
+        self.done = False
+        self.error = None
+        self.viewers = 0
+        self.furthest_read = 0
+        self.created_at = time.time()
+        self._changed = asyncio.Condition()
+        self._task = None
+
+    def start(self, batches):
+        """Consume an async iterator of (events, seconds) per scored batch"""
+        self._task = asyncio.create_task(self._produce(batches))
+
+    async def _produce(self, batches):
+        try:
+            async for events, seconds in batches:
+                encoded = await asyncio.to_thread(lambda: [json.dumps(event) for event in events])
+                async with self._changed:
+                    self.events.extend(encoded)
+                    self.seconds.extend(seconds)
+                    self.nbytes += sum(len(event) for event in encoded)
+                    self._changed.notify_all()
+                    # Scoring the next batch waits until a viewer gets close enough
+                    await self._changed.wait_for(
+                        lambda: len(self.events) - self.furthest_read < SCORING_LOOKAHEAD_EVENTS
+                    )
+        except asyncio.CancelledError:
+            self.error = "Simulation scoring was cancelled"
+            raise
+        except Exception as e:
+            logger.error(f"❌ Scoring simulation {self.id} failed: {e}")
+            self.error = str(e)
+        finally:
+            # Closing the batches drops shards still queued for an unfinished window
+            await batches.aclose()
+            async with self._changed:
+                self.done = True
+                self._changed.notify_all()
+
+    def stop(self):
+        """Cancel scoring that has not finished"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+    def event_id(self, position: int) -> str:
+        return f"{self.id}:{position}"
+
+    def resume_position(self, last_event_id: str) -> int:
+        """
+        Position after the event a client last received, or 0.
+
+        Ids from another simulation (a retrained model, a changed window)
+        start the stream over.
+        """
+        if not last_event_id:
+            return 0
+        simulation_id, _, position = last_event_id.strip().partition(":")
+        if simulation_id != self.id or not position.isdigit():
+            return 0
+        return min(int(position) + 1, self.total)
+
+    async def read(self, position: int = 0):
+        """
+        Async iterator of (position, events, seconds) from `position` on.
+
+        Waits for events that are not scored yet; raises RuntimeError if
+        scoring failed before the reader reached the end.
+        """
+        self.viewers += 1
+        try:
+            async with self._changed:
+                if position > self.furthest_read:
+                    # A resume past what was scored so far (e.g. after eviction
+                    # or a restart) must let the producer reach it
+                    self.furthest_read = position
+                    self._changed.notify_all()
+            while True:
+                async with self._changed:
+                    await self._changed.wait_for(lambda: len(self.events) > position or self.done)
+                    end = min(len(self.events), position + READ_BATCH_EVENTS)
+                    if end <= position:
+                        if self.error is not None:
+                            raise RuntimeError(self.error)
+                        return
+                    events, seconds = self.events[position:end], self.seconds[position:end]
+                    if end > self.furthest_read:
+                        # Lets the producer score further ahead
+                        self.furthest_read = end
+                        self._changed.notify_all()
+                yield position, events, seconds
+                position = end
+        finally:
+            self.viewers -= 1
+
+    def describe(self) -> dict:
+        return {
+            "id": self.id,
+            "model_version": self.key[0],
+            "backend": self.key[1],
+            "window": [self.key[3], self.key[4]],
+            "scored": len(self.events),
+            "read": self.furthest_read,
+            "total": self.total,
+            "done": self.done,
+            "error": self.error,
+            "viewers": self.viewers,
+            "size_mb": round(self.nbytes / (1024 * 1024), 2)
+        }
+
+
+class SimulationCache:
+    """
+    Process-wide cache of scored simulations.
+
+    The first /simulate request for a (model version, backend, dataset,
+    window) starts scoring it; later and concurrent requests share that
+    result set instead of scoring again. Once the memory budget is
+    exceeded, simulations without viewers are evicted least-recently-used
+    first, finished or not (unfinished ones stop scoring, and are scored
+    again if requested later); a failed one is also scored again on the
+    next request. Simulations being watched are kept: their memory is
+    bounded by how far their viewers have read plus the scoring
+    look-ahead. Runs on the event loop, so no locking is needed.
+    """
+
+    def __init__(self, memory_budget_mb: int = DEFAULT_SIMULATION_CACHE_MB):
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self._simulations = OrderedDict()  # key -> ScoredSimulation, LRU order
+
+    def get(self, key: tuple, total: int, scored_batches):
+        """
+        Return (simulation, shared) for `key`.
+
+        `scored_batches` is called to start scoring only when the key is
+        not cached; `shared` tells whether existing results were reused.
+        """
+        simulation = self._simulations.get(key)
+        if simulation is not None and simulation.error is None:
+            self._simulations.move_to_end(key)
+            self._evict(keep=key)
+            return simulation, True
+
+        simulation = ScoredSimulation(key, total)
+        simulation.start(scored_batches())
+        self._simulations[key] = simulation
+        self._evict(keep=key)
+        return simulation, False
+
+    def _evict(self, keep: tuple):
+        total = sum(simulation.nbytes for simulation in self._simulations.values())
+        for key, simulation in list(self._simulations.items()):
+            if total <= self.memory_budget:
+                break
+            if key != keep and simulation.viewers == 0:
+                self._simulations.pop(key).stop()
+                total -= simulation.nbytes
+
+    def describe(self) -> dict:
+        """Summary of cached simulations for status endpoints"""
+        return {
+            "memory_budget_mb": round(self.memory_budget / (1024 * 1024), 2),
+            "simulations": [simulation.describe() for simulation in self._simulations.values()]
+        }
+
+
+simulation_cache = SimulationCache()
@@ -0,0 +1,75 @@
+import os
+
+import numpy as np
+import scipy.sparse as sp
+
+# Feature matrix layouts accepted by /train (`layout`)
+FEATURE_LAYOUTS = ("dense", "sparse", "auto")
+DEFAULT_FEATURE_LAYOUT = os.environ.get("ML_FEATURE_LAYOUT", "dense")
+
+# "auto" picks the sparse layout when the average share of present values
+# per column is at most this; CSR needs 8 bytes per value against 4 per
+# cell for a dense float32 matrix
+SPARSE_MAX_DENSITY = 0.25
+
+# Rows densified at a time while building a CSR matrix from the cache
+CSR_BLOCK_ROWS = 65_536
+
+
+def to_csr(block: np.ndarray) -> sp.csr_matrix:
+    """
+    CSR copy of a dense float32 block, keeping only present, non-zero values.
+
+    NaNs and zeros both become implicit entries, which LightGBM treats as
+    missing under zero_as_missing.
+    """
+    flat = block.reshape(-1)
+    present = np.flatnonzero((flat == flat) & (flat != 0))
+    rows, cols = np.divmod(present, block.shape[1])
+    indptr = np.searchsorted(rows, np.arange(block.shape[0] + 1))
+    return sp.csr_matrix((flat[present], cols.astype(np.int32), indptr), shape=block.shape)
+
+
+def read_rows_csr(dataset, rows, block_rows: int = CSR_BLOCK_ROWS) -> sp.csr_matrix:
+    """
+    Selected rows of a cached dataset as CSR, without densifying the selection.
+
+    Only `block_rows` rows are held densely at a time, so peak memory is
+    the sparse result plus one block.
+    """
+    if isinstance(rows, slice):
+        start, stop, _ = rows.indices(dataset.n_rows)
+        blocks = (slice(lo, min(lo + block_rows, stop)) for lo in range(start, stop, block_rows))
+    else:
+        rows = np.asarray(rows)
+        if rows.dtype == bool:
+            rows = np.flatnonzero(rows)
+        blocks = (rows[i:i + block_rows] for i in range(0, len(rows), block_rows))
+
+    parts = [to_csr(dataset.read_rows(block)) for block in blocks]
+    if not parts:
+        return sp.csr_matrix((0, len(dataset.feature_names)), dtype=np.float32)
+    return sp.vstack(parts, format="csr")
+
+
+def matrix_nbytes(X) -> int:
+    """Memory held by a dense or CSR feature matrix"""
+    if sp.issparse(X):
+        return X.data.nbytes + X.indices.nbytes + X.indptr.nbytes
+    return X.nbytes
+
+
+def feature_density(dataset) -> float:
+    """Average share of present values per column, from the dataset statistics"""
+    columns = dataset.stats["columns"].values()
+    if not columns:
+        return 1.0
+    return float(np.mean([1.0 - column["null_fraction"] for column in columns]))
+
+
+def choose_feature_layout(requested: str, dataset):
+    """Resolve "auto" from column densities; returns (layout, density)"""
+    density = feature_density(dataset)
+    if requested == "auto":
+        return ("sparse" if density <= SPARSE_MAX_DENSITY else "dense"), density
+    return requested, density
@@ -0,0 +1,170 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import tempfile
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Sessions live in their own folders under the storage root; requests
+# without a session use the root itself, where the .NET backend writes
+SESSIONS_DIRNAME = "sessions"
+SESSION_ID_PATTERN = r"^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$"
+
+# Uploaded datasets, stored once per content hash and shared by sessions
+DATASETS_DIRNAME = "datasets"
+DATASET_POINTER_FILENAME = "dataset.json"
+
+
+def session_path(storage_root: str, session: str = None, create: bool = True) -> str:
+    """Folder holding one session's ranges, model and metrics"""
+    if session is None:
+        return storage_root
+    if not re.match(SESSION_ID_PATTERN, session):
+        raise ValueError(f"Invalid session id: {session!r}")
+    path = os.path.join(storage_root, SESSIONS_DIRNAME, session)
+    if create:
+        os.makedirs(path, exist_ok=True)
+    return path
+
+
+def list_sessions(storage_root: str) -> list:
+    root = os.path.join(storage_root, SESSIONS_DIRNAME)
+    if not os.path.isdir(root):
+        return []
+    return sorted(entry.name for entry in os.scandir(root) if entry.is_dir())
+
+
+def dataset_path(session_dir: str) -> str:
+    """
+    The parsed.csv a session works on.
+
+    A session that uploaded through PUT /sessions/{id}/dataset points at a
+    content-addressed file; otherwise its own parsed.csv is used.
+    """
+    pointer_path = os.path.join(session_dir, DATASET_POINTER_FILENAME)
+    if os.path.exists(pointer_path):
+        with open(pointer_path, "r") as f:
+            return json.load(f)["path"]
+    return os.path.join(session_dir, "parsed.csv")
+
+
+_json_cache = {}
+
+
+def read_json_cached(path: str):
+    """
+    Parsed contents of a JSON file, re-read only when its size or mtime change.
+
+    Files here are replaced atomically, so a changed stat means a new file.
+    """
+    stat = os.stat(path)
+    key = (stat.st_size, stat.st_mtime_ns)
+    cached = _json_cache.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    with open(path, "r") as f:
+        data = json.load(f)
+    _json_cache[path] = (key, data)
+    return data
+
+
+@contextmanager
+def atomic_write(path: str, mode: str = "w"):
+    """
+    Open a temporary file next to `path` and rename it over `path` on success.
+
+    Readers see either the old or the new file, never a partial one; on
+    error the temporary file is removed and `path` is left untouched.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        # mkstemp creates 0600 files; keep artifacts readable like open() would
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write_json(path: str, data, **kwargs):
+    with atomic_write(path, "w") as f:
+        json.dump(data, f, **kwargs)
+
+
+@contextmanager
+def file_lock(path: str):
+    """
+    Exclusive advisory lock held on `path` for the duration of the block.
+
+    Serializes read-modify-write of shared files between the API and the
+    training/scoring processes. A no-op where fcntl is unavailable.
+    """
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+async def store_dataset(storage_root: str, byte_blocks) -> dict:
+    """
+    Save an uploaded parsed.csv under its content hash.
+
+    The upload is streamed to a temporary file while being hashed; if a
+    dataset with the same hash already exists the copy is discarded, so
+    identical uploads share one file and therefore one columnar cache.
+    """
+    directory = os.path.join(storage_root, DATASETS_DIRNAME)
+    os.makedirs(directory, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+
+    fd, tmp_path = tempfile.mkstemp(prefix=".upload-", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            async for block in byte_blocks:
+                digest.update(block)
+                size += len(block)
+                await asyncio.to_thread(f.write, block)
+
+        content_hash = digest.hexdigest()
+        path = os.path.join(directory, f"{content_hash}.csv")
+        reused = os.path.exists(path)
+        if reused:
+            os.remove(tmp_path)
+        else:
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return {"content_hash": content_hash, "path": path, "size": size, "reused": reused}
+
+
+def link_dataset(session_dir: str, dataset: dict):
+    """Point a session at a stored dataset"""
+    atomic_write_json(
+        os.path.join(session_dir, DATASET_POINTER_FILENAME),
+        {"content_hash": dataset["content_hash"], "path": dataset["path"]},
+        indent=4
+    )
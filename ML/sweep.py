@@ -0,0 +1,259 @@
+import itertools
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import lightgbm as lgb
+import numpy as np
+
+from instrumentation import get_logger, metrics
+
+# Booster parameters a sweep may vary, with their types. Binning
+# parameters are not among them, so every candidate trains on the same
+# binned dataset (feature_pre_filter is off, so min_data_in_leaf can vary)
+SWEEP_PARAMS = {
+    "num_leaves": int,
+    "max_depth": int,
+    "learning_rate": float,
+    "feature_fraction": float,
+    "bagging_fraction": float,
+    "bagging_freq": int,
+    "min_data_in_leaf": int,
+    "min_sum_hessian_in_leaf": float,
+    "lambda_l1": float,
+    "lambda_l2": float,
+    "min_gain_to_split": float
+}
+SEARCH_MODES = ("grid", "random")
+
+MAX_SWEEP_CANDIDATES = 256
+DEFAULT_RANDOM_CANDIDATES = 16
+DEFAULT_MAX_ROUNDS = 200
+MIN_RUNG_ROUNDS = 5
+DEFAULT_ETA = 3
+EARLY_STOPPING_ROUNDS = 10
+
+# LightGBM threads per candidate fit; the pool runs cores / threads fits at once
+DEFAULT_THREADS_PER_FIT = int(os.environ.get("ML_SWEEP_THREADS_PER_FIT", "1"))
+SWEEP_WORKERS = int(os.environ.get("ML_SWEEP_WORKERS", "0"))  # 0: from the core count
+
+VALID_BIN_FILENAME = "sweep_valid.bin"
+
+logger = get_logger(__name__)
+
+_train_set = None
+_valid_set = None
+
+
+def _cast(name: str, value):
+    kind = SWEEP_PARAMS[name]
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ValueError(f"Sweep values of {name} must be finite numbers, got {value!r}")
+    return kind(round(value)) if kind is int else kind(value)
+
+
+def _int_option(spec: dict, name: str, default: int, minimum: int) -> int:
+    value = spec.get(name, default)
+    valid = isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+    if not valid or value != int(value):
+        raise ValueError(f"{name} must be an integer, got {value!r}")
+    if value < minimum:
+        raise ValueError(f"{name} must be at least {minimum}")
+    return int(value)
+
+
+def _sample(name: str, space, rng: np.random.Generator):
+    if isinstance(space, list):
+        return space[rng.integers(len(space))]
+    low, high = space["low"], space["high"]
+    if space.get("log", False):
+        value = math.exp(rng.uniform(math.log(low), math.log(high)))
+    else:
+        value = rng.uniform(low, high)
+    return _cast(name, value)
+
+
+def parse_sweep_spec(spec: dict) -> dict:
+    """
+    Validate a sweep request and expand it into candidate parameter sets.
+
+    `params` maps booster parameters (see SWEEP_PARAMS) to a list of
+    values, or for random search also to {"low", "high", "log"} ranges.
+    Grid search takes every combination; random search draws
+    `n_candidates` sets with `seed`. `max_rounds` is the boosting budget
+    of the last halving rung and `eta` the factor by which candidates are
+    cut (and budgets grown) per rung. Raises ValueError on a bad spec.
+    """
+    if not isinstance(spec, dict):
+        raise ValueError("Sweep spec must be a JSON object")
+    search = spec.get("search", "grid")
+    if search not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode: {search} (expected one of {', '.join(SEARCH_MODES)})")
+    space = spec.get("params")
+    if not isinstance(space, dict) or not space:
+        raise ValueError("Sweep spec needs a non-empty 'params' object")
+    space = dict(space)
+
+    unknown = sorted(set(space) - set(SWEEP_PARAMS))
+    if unknown:
+        raise ValueError(f"Parameters cannot be swept: {unknown} (allowed: {sorted(SWEEP_PARAMS)})")
+    for name, values in space.items():
+        if isinstance(values, list):
+            if not values:
+                raise ValueError(f"No values given for {name}")
+            space[name] = [_cast(name, value) for value in values]
+        elif search == "random" and isinstance(values, dict) and {"low", "high"} <= set(values):
+            low, high = _cast(name, values["low"]), _cast(name, values["high"])
+            if low > high or (values.get("log", False) and low <= 0):
+                raise ValueError(f"Invalid range for {name}: {values}")
+        else:
+            raise ValueError(f"Values of {name} must be a list" + (" or a low/high range" if search == "random" else ""))
+
+    if search == "grid":
+        names = list(space)
+        candidates = [dict(zip(names, combination)) for combination in itertools.product(*space.values())]
+    else:
+        rng = np.random.default_rng(_int_option(spec, "seed", 0, 0))
+        n_candidates = _int_option(spec, "n_candidates", DEFAULT_RANDOM_CANDIDATES, 1)
+        candidates = [
+            {name: _sample(name, values, rng) for name, values in space.items()}
+            for _ in range(min(n_candidates, MAX_SWEEP_CANDIDATES))
+        ]
+    # Duplicates (from rounding or repeated draws) would only cost time
+    candidates = list({tuple(sorted(candidate.items())): candidate for candidate in candidates}.values())
+    if len(candidates) > MAX_SWEEP_CANDIDATES:
+        raise ValueError(f"Sweep has {len(candidates)} candidates (at most {MAX_SWEEP_CANDIDATES})")
+
+    max_rounds = _int_option(spec, "max_rounds", DEFAULT_MAX_ROUNDS, MIN_RUNG_ROUNDS)
+    eta = _int_option(spec, "eta", DEFAULT_ETA, 2)
+    threads_per_fit = _int_option(spec, "threads_per_fit", DEFAULT_THREADS_PER_FIT, 1)
+
+    return {
+        "search": search,
+        "candidates": candidates,
+        "max_rounds": max_rounds,
+        "eta": eta,
+        "threads_per_fit": threads_per_fit
+    }
+
+
+def halving_rungs(n_candidates: int, max_rounds: int, eta: int) -> list:
+    """
+    (candidates, boosting rounds) per rung of successive halving.
+
+    Each rung keeps the best 1/eta of the previous one and gives it eta
+    times the rounds, ending with max_rounds for the last few candidates.
+    """
+    n_rungs = 1
+    while n_candidates > eta ** n_rungs and max_rounds // eta ** n_rungs >= MIN_RUNG_ROUNDS:
+        n_rungs += 1
+    return [
+        (math.ceil(n_candidates / eta ** rung), max(MIN_RUNG_ROUNDS, max_rounds // eta ** (n_rungs - 1 - rung)))
+        for rung in range(n_rungs)
+    ]
+
+
+def _init_sweep_worker(train_path: str, valid_path: str, dataset_params: dict):
+    # Each worker loads the binned sets once and reuses them for every fit
+    global _train_set, _valid_set
+    _train_set = lgb.Dataset(train_path, params=dataset_params, free_raw_data=True).construct()
+    _valid_set = lgb.Dataset(valid_path, reference=_train_set, params=dataset_params).construct()
+
+
+def _fit_candidate(index: int, params: dict, num_boost_round: int) -> dict:
+    """Entry point executed inside a sweep pool process"""
+    start = time.perf_counter()
+    booster = lgb.train(
+        params,
+        _train_set,
+        num_boost_round=num_boost_round,
+        valid_sets=[_valid_set],
+        valid_names=["valid"],
+        callbacks=[lgb.early_stopping(stopping_rounds=EARLY_STOPPING_ROUNDS, first_metric_only=True, verbose=False)]
+    )
+    best_iteration = booster.best_iteration if booster.best_iteration > 0 else booster.current_iteration()
+    return {
+        "candidate": index,
+        "best_iteration": best_iteration,
+        "valid_binary_logloss": float(booster.best_score["valid"]["binary_logloss"]),
+        "seconds": round(time.perf_counter() - start, 3)
+    }
+
+
+def _pool_size(n_candidates: int, threads_per_fit: int) -> int:
+    if SWEEP_WORKERS > 0:
+        return min(SWEEP_WORKERS, n_candidates)
+    return max(1, min(n_candidates, (os.cpu_count() or 1) // threads_per_fit))
+
+
+def run_sweep(sweep: dict, train_path: str, valid_set: lgb.Dataset, base_params: dict, dataset_params: dict,
+              work_dir: str, progress_callback=None) -> dict:
+    """
+    Successive halving over the candidates of a parsed sweep spec.
+
+    The training set is the binned set cached at `train_path`; the
+    validation set is saved as a binary next to it in `work_dir`, so pool
+    processes load both without reading or binning raw rows. Candidates
+    are ranked by their best validation log loss (with early stopping);
+    losers are dropped after each rung. Returns the leaderboard, best
+    first, with each candidate's deepest rung.
+    """
+    candidates = sweep["candidates"]
+    threads_per_fit = sweep["threads_per_fit"]
+    rungs = halving_rungs(len(candidates), sweep["max_rounds"], sweep["eta"])
+
+    valid_path = os.path.join(work_dir, VALID_BIN_FILENAME)
+    valid_set.save_binary(valid_path)
+
+    workers = _pool_size(len(candidates), threads_per_fit)
+    logger.info(f"Sweeping {len(candidates)} candidates in {len(rungs)} rungs on {workers} workers "
+                f"({threads_per_fit} threads per fit)")
+
+    results = {}  # candidate -> result of its deepest rung
+    surviving = list(range(len(candidates)))
+    start = time.perf_counter()
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_sweep_worker,
+                             initargs=(train_path, valid_path, dataset_params)) as executor:
+        for rung, (_, rounds) in enumerate(rungs):
+            futures = [
+                executor.submit(
+                    _fit_candidate, index,
+                    {**base_params, **candidates[index], "num_threads": threads_per_fit}, rounds
+                )
+                for index in surviving
+            ]
+            for future in as_completed(futures):
+                result = {**future.result(), "rung": rung, "rounds": rounds}
+                results[result["candidate"]] = result
+                metrics.inc("ml_sweep_fits_total")
+                if progress_callback is not None:
+                    progress_callback({"stage": "sweep", **result})
+
+            ranked = sorted(surviving, key=lambda index: results[index]["valid_binary_logloss"])
+            if rung + 1 < len(rungs):
+                surviving = ranked[:rungs[rung + 1][0]]
+            logger.info(f"Sweep rung {rung} ({rounds} rounds): best log loss "
+                        f"{results[ranked[0]]['valid_binary_logloss']:.5f}")
+
+    leaderboard = sorted(
+        results.values(),
+        key=lambda result: (-result["rung"], result["valid_binary_logloss"])
+    )
+    return {
+        "search": sweep["search"],
+        "candidates": len(candidates),
+        "eta": sweep["eta"],
+        "max_rounds": sweep["max_rounds"],
+        "threads_per_fit": threads_per_fit,
+        "workers": workers,
+        "rungs": [{"rung": rung, "candidates": n, "rounds": rounds} for rung, (n, rounds) in enumerate(rungs)],
+        "seconds": round(time.perf_counter() - start, 2),
+        "best_params": candidates[leaderboard[0]["candidate"]],
+        "leaderboard": [
+            {"rank": rank + 1, **result, "params": candidates[result["candidate"]]}
+            for rank, result in enumerate(leaderboard)
+        ]
+    }
@@ -0,0 +1,100 @@
+import asyncio
+import io
+import os
+from concurrent.futures import Future
+
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+import pytest
+
+import parallel_scoring
+from batch_scoring import PREDICT_CHUNK_ROWS, BatchScorer, stream_predictions
+from boosting import BoosterClassifier
+from imputation import IMPUTER_FILENAME, MedianImputer
+from model_registry import model_registry, publish_model
+from parallel_scoring import PARALLEL_MIN_ROWS, ScoringEngine
+
+FEATURES = ["L0_S0_F0", "L0_S0_F2", "L1_S24_F1"]
+
+
+class InlinePoolEngine(ScoringEngine):
+    """Two-worker engine that scores submitted shards in this process"""
+
+    def __init__(self):
+        super().__init__(max_workers=2, thread_budget=2)
+        self.submitted = []
+
+    def _submit(self, *args):
+        self.submitted.append(args)
+        future = Future()
+        future.set_result(parallel_scoring._score_shard(*args))
+        return future
+
+
+@pytest.fixture(scope="module")
+def loaded(tmp_path_factory):
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(2000, len(FEATURES))).astype(np.float32)
+    X[rng.random(X.shape) < 0.2] = np.nan
+    y = (np.nan_to_num(X[:, 0]) + rng.normal(scale=0.5, size=len(X)) > 1).astype(int)
+    booster = lgb.train({"objective": "binary", "verbose": -1, "num_leaves": 7},
+                        lgb.Dataset(X, y, feature_name=FEATURES), num_boost_round=10)
+    imputer = MedianImputer(FEATURES).fit(X)
+
+    model_path = str(tmp_path_factory.mktemp("storage") / "model.pkl")
+    publish_model(BoosterClassifier(booster), model_path,
+                  lambda directory: imputer.save(os.path.join(directory, IMPUTER_FILENAME)))
+    return model_registry.get(model_path)
+
+
+def _csv_blocks(frame: pd.DataFrame, block_size: int = 1 << 20):
+    body = frame.to_csv(index=False).encode()
+
+    async def blocks():
+        for lo in range(0, len(body), block_size):
+            yield body[lo:lo + block_size]
+    return blocks()
+
+
+def _predict(scorer: BatchScorer, frame: pd.DataFrame) -> pd.DataFrame:
+    async def collect():
+        return "".join([chunk async for chunk in stream_predictions(scorer, _csv_blocks(frame))])
+    return pd.read_json(io.StringIO(asyncio.run(collect())), lines=True)
+
+
+def test_full_chunks_reach_the_pool():
+    assert PREDICT_CHUNK_ROWS >= PARALLEL_MIN_ROWS
+
+
+def test_large_predict_dispatches_to_pool(loaded):
+    rng = np.random.default_rng(1)
+    n_rows = PREDICT_CHUNK_ROWS + 1000
+    frame = pd.DataFrame(rng.normal(size=(n_rows, len(FEATURES))).astype(np.float32), columns=FEATURES)
+    frame.insert(0, "Id", np.arange(n_rows))
+
+    engine = InlinePoolEngine()
+    result = _predict(BatchScorer(loaded, engine=engine), frame)
+
+    # The first chunk is sharded across the pool; the 1000-row tail is scored in-process
+    shard_rows = [rows.stop - rows.start for *_, rows, _ in engine.submitted]
+    assert len(engine.submitted) >= 2
+    assert sum(shard_rows) == PREDICT_CHUNK_ROWS
+    assert result["id"].tolist() == list(range(n_rows))
+
+    local = _predict(BatchScorer(loaded, engine=ScoringEngine(max_workers=1)), frame)
+    pd.testing.assert_frame_equal(result, local)
+
+
+def test_predictions_use_model_threshold(loaded, monkeypatch):
+    rng = np.random.default_rng(2)
+    frame = pd.DataFrame(rng.normal(size=(500, len(FEATURES))).astype(np.float32), columns=FEATURES)
+    local = ScoringEngine(max_workers=1)
+    proba = local.score_array(loaded, frame.to_numpy(copy=True))[:, 1]
+
+    monkeypatch.setattr(loaded, "threshold", float(np.quantile(proba, 0.7)))
+    scorer = BatchScorer(loaded, engine=local)
+    result = _predict(scorer, frame)
+
+    assert scorer.threshold == loaded.threshold
+    np.testing.assert_array_equal(result["prediction"] == "Pass", proba > loaded.threshold)
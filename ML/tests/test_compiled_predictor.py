@@ -0,0 +1,64 @@
+import lightgbm as lgb
+import numpy as np
+import pytest
+
+import compiled_predictor
+from boosting import BoosterClassifier
+from compiled_predictor import NUMPY_VERIFY_TOLERANCE, CompiledForest
+
+
+def _model(zero_as_missing: bool = False) -> tuple:
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(3000, 6))
+    X[rng.random(X.shape) < 0.3] = np.nan
+    X[rng.random(X.shape) < 0.1] = 0.0
+    y = (np.nan_to_num(X[:, 0]) - np.nan_to_num(X[:, 3]) + rng.normal(scale=0.5, size=len(X)) > 0.5).astype(int)
+    params = {"objective": "binary", "verbose": -1, "num_leaves": 15, "zero_as_missing": zero_as_missing}
+    booster = lgb.train(params, lgb.Dataset(X, y, params={"zero_as_missing": zero_as_missing}), num_boost_round=30)
+    return BoosterClassifier(booster), X.astype(np.float32)
+
+
+@pytest.mark.parametrize("zero_as_missing", [False, True])
+def test_verify_matches_predict_proba(zero_as_missing):
+    model, X = _model(zero_as_missing)
+    compiled = CompiledForest.from_model(model)
+    result = compiled.verify(model, X)
+
+    assert result["rows_checked"] == len(X)
+    assert compiled.verified
+    if compiled_predictor.numba is not None:
+        assert result["identical"] and result["max_abs_diff"] == 0.0
+    np.testing.assert_allclose(compiled.predict_proba(X), model.predict_proba(X), rtol=0, atol=NUMPY_VERIFY_TOLERANCE)
+
+
+def test_numpy_fallback_within_tolerance(monkeypatch):
+    model, X = _model()
+    monkeypatch.setattr(compiled_predictor, "numba", None)
+    compiled = CompiledForest.from_model(model)
+    result = compiled.verify(model, X)
+
+    assert compiled.verified
+    assert result["tolerance"] == NUMPY_VERIFY_TOLERANCE
+    assert result["max_abs_diff"] <= NUMPY_VERIFY_TOLERANCE
+    assert compiled.describe()["engine"] == "numpy"
+    assert compiled_predictor.available_backends() == ("booster",)
+
+
+def test_verify_detects_mismatch():
+    model, X = _model()
+    compiled = CompiledForest.from_model(model)
+    compiled.leaf_value = compiled.leaf_value + 0.01
+    result = compiled.verify(model, X)
+    assert compiled.verified is False and not result["identical"]
+
+
+def test_save_and_load_keep_verification(tmp_path):
+    model, X = _model()
+    compiled = CompiledForest.from_model(model)
+    compiled.verify(model, X)
+    path = str(tmp_path / compiled_predictor.COMPILED_FOREST_FILENAME)
+    compiled.save(path)
+
+    loaded = CompiledForest.load(path)
+    assert loaded.verified is True
+    np.testing.assert_array_equal(loaded.predict_proba(X), compiled.predict_proba(X))
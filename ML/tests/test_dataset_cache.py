@@ -0,0 +1,72 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import dataset_cache
+from dataset_cache import CACHE_DIRNAME, open_dataset
+
+
+def _write_csv(path: str, n_rows: int, seed: int):
+    rng = np.random.default_rng(seed)
+    frame = pd.DataFrame(rng.normal(size=(n_rows, 3)).astype(np.float32), columns=["L0_S0_F0", "L0_S0_F2", "L1_S24_F1"])
+    frame.insert(0, "Id", np.arange(n_rows))
+    frame["Response"] = rng.integers(0, 2, n_rows)
+    frame["SyntheticTimestamp"] = pd.date_range("2021-01-01", periods=n_rows, freq="s")
+    frame.to_csv(path, index=False)
+    # Distinct mtimes, so each rewrite is noticed
+    os.utime(path, ns=(seed * 10**9, seed * 10**9))
+    return frame
+
+
+def test_read_rows_matches_source(tmp_path):
+    csv_path = str(tmp_path / "parsed.csv")
+    frame = _write_csv(csv_path, 50, 1)
+    dataset = open_dataset(csv_path, str(tmp_path))
+    expected = frame[dataset.feature_names].to_numpy(np.float32)
+
+    np.testing.assert_array_equal(dataset.read_rows(slice(10, 20)), expected[10:20])
+    np.testing.assert_array_equal(dataset.read_rows(np.array([3, 7])), expected[[3, 7]])
+    assert dataset.read_rows(slice(20, 10)).shape == (0, 3)
+    block = dataset.read_rows(slice(0, 5))
+    block[:] = 0  # a writable copy
+    np.testing.assert_array_equal(dataset.read_rows(slice(0, 5)), expected[:5])
+
+
+def test_replaced_dataset_stays_readable(tmp_path, monkeypatch):
+    monkeypatch.setattr(dataset_cache, "KEEP_UNREFERENCED_CACHES", 1)
+    csv_path = str(tmp_path / "parsed.csv")
+    first = _write_csv(csv_path, 40, 1)
+    old = open_dataset(csv_path, str(tmp_path))
+
+    _write_csv(csv_path, 60, 2)
+    new = open_dataset(csv_path, str(tmp_path))
+    assert new.content_hash != old.content_hash and new.n_rows == 60
+    # The replaced cache is kept and still readable by whoever holds it
+    assert os.path.isdir(old.cache_dir)
+    np.testing.assert_array_equal(old.read_rows(slice(0, 40)), first[old.feature_names].to_numpy(np.float32))
+
+    # One more replacement prunes all but the newest unreferenced cache
+    os.utime(old.cache_dir, (1, 1))
+    _write_csv(csv_path, 70, 3)
+    open_dataset(csv_path, str(tmp_path))
+    cache_dirs = sorted(os.listdir(tmp_path / CACHE_DIRNAME))
+    assert old.content_hash not in cache_dirs and new.content_hash in cache_dirs
+    # Rows of an already open dataset come from its mapping even after the prune
+    assert old.read_rows(slice(0, 40)).shape == (40, 3)
+
+
+def test_conversion_only_blocks_its_own_path(tmp_path):
+    busy_path = str(tmp_path / "busy.csv")
+    other_path = str(tmp_path / "other.csv")
+    _write_csv(busy_path, 20, 4)
+    _write_csv(other_path, 20, 5)
+
+    # As if busy.csv were being converted by another request
+    with dataset_cache._lock_for(os.path.abspath(busy_path)):
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            other = executor.submit(open_dataset, other_path, str(tmp_path)).result(timeout=30)
+        assert other.n_rows == 20
+        assert open_dataset(busy_path, str(tmp_path), build=False) is None
+    assert open_dataset(busy_path, str(tmp_path)).n_rows == 20
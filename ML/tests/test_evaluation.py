@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from sklearn.metrics import average_precision_score, brier_score_loss, f1_score, roc_auc_score
+
+import evaluation
+from evaluation import load_decision_threshold, save_decision_threshold, threshold_analysis
+
+
+def _scores(n: int = 20_000, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    y = (rng.random(n) < 0.1).astype(np.float64)
+    # Rounded scores give ties, like a small forest's
+    proba = np.clip(np.round(rng.beta(2, 5, n) + 0.25 * y, 3), 0, 1)
+    return y, proba
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_matches_sklearn(seed):
+    y, proba = _scores(seed=seed)
+    analysis = threshold_analysis(y, proba)
+
+    assert analysis["rows"] == len(y) and analysis["positives"] == int(y.sum())
+    # Scores are on a 0.001 grid, finer than no bin, so the binned curves are exact
+    assert analysis["roc_auc"] == pytest.approx(roc_auc_score(y, proba), abs=1e-6)
+    assert analysis["average_precision"] == pytest.approx(average_precision_score(y, proba), abs=1e-6)
+    assert analysis["calibration"]["brier_score"] == pytest.approx(brier_score_loss(y, proba), abs=1e-6)
+
+    chosen = analysis["chosen"]
+    assert chosen["f1_score"] == pytest.approx(100 * f1_score(y, proba > chosen["threshold"]), abs=0.01)
+    # No threshold between distinct scores does better than the chosen one
+    candidates = np.unique(proba)[:, None]
+    predicted = proba[None, :] > candidates
+    tp = np.count_nonzero(predicted & (y == 1), axis=1)
+    best = np.max(2 * tp / (np.count_nonzero(predicted, axis=1) + y.sum()))
+    assert chosen["f1_score"] >= round(100 * best, 2) - 0.01
+
+    default = analysis["at_default_threshold"]
+    assert default["f1_score"] == pytest.approx(100 * f1_score(y, proba > 0.5), abs=0.01)
+
+
+def test_single_class_window():
+    analysis = threshold_analysis(np.zeros(100), np.linspace(0, 1, 100))
+    assert analysis["roc_auc"] is None and analysis["chosen"] is None
+    assert analysis["at_default_threshold"]["predicted_positive"] == 50
+
+
+def test_threshold_round_trip(tmp_path):
+    assert load_decision_threshold(str(tmp_path)) == evaluation.DEFAULT_THRESHOLD
+    y, proba = _scores()
+    analysis = threshold_analysis(y, proba)
+    save_decision_threshold(str(tmp_path), analysis)
+    assert load_decision_threshold(str(tmp_path)) == analysis["chosen"]["threshold"]
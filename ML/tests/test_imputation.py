@@ -0,0 +1,57 @@
+import warnings
+
+import numpy as np
+
+import imputation
+from imputation import MedianImputer
+
+
+def _matrix(rng: np.random.Generator, n_rows: int, n_cols: int) -> np.ndarray:
+    X = rng.normal(size=(n_rows, n_cols)).astype(np.float32)
+    X[rng.random(X.shape) < 0.4] = np.nan
+    X[:, 0] = np.nan        # entirely missing
+    X[1:, 1] = np.nan       # a single value
+    return X
+
+
+def test_medians_match_nanmedian(monkeypatch):
+    # Small blocks so fitting and filling cross block boundaries
+    monkeypatch.setattr(imputation, "FIT_COLUMN_BLOCK", 4)
+    monkeypatch.setattr(imputation, "TRANSFORM_ROW_BLOCK", 7)
+    rng = np.random.default_rng(0)
+    for n_rows in (1, 2, 51, 100):
+        X = _matrix(rng, n_rows, 11)
+        imputer = MedianImputer([f"f{i}" for i in range(11)]).fit(X)
+
+        with warnings.catch_warnings():
+            # All-NaN columns warn and give NaN
+            warnings.simplefilter("ignore", RuntimeWarning)
+            expected = np.nanmedian(X.astype(np.float64), axis=0)
+        np.testing.assert_allclose(imputer.medians, expected, equal_nan=True)
+
+
+def test_transform_fills_in_place():
+    rng = np.random.default_rng(1)
+    X = _matrix(rng, 40, 6)
+    missing = np.isnan(X)
+    imputer = MedianImputer([f"f{i}" for i in range(6)]).fit(X)
+    original = X.copy()
+
+    out = imputer.transform(X)
+    assert out is X
+    np.testing.assert_array_equal(X[~missing], original[~missing])
+    rows, cols = np.nonzero(missing)
+    np.testing.assert_array_equal(X[rows, cols], imputer.medians.astype(np.float32)[cols])
+    # Columns missing throughout training stay missing
+    assert np.isnan(X[:, 0]).all()
+
+
+def test_save_and_load_round_trip(tmp_path):
+    X = _matrix(np.random.default_rng(2), 30, 5)
+    imputer = MedianImputer([f"f{i}" for i in range(5)]).fit(X)
+    path = tmp_path / imputation.IMPUTER_FILENAME
+    imputer.save(str(path))
+
+    loaded = MedianImputer.load(str(path))
+    assert loaded.feature_names == imputer.feature_names
+    np.testing.assert_array_equal(loaded.medians, imputer.medians)
@@ -0,0 +1,168 @@
+import os
+
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+import pytest
+
+import incremental
+from boosting import BoosterClassifier
+from dataset_cache import open_dataset
+from imputation import IMPUTER_FILENAME, MedianImputer
+from incremental import (
+    INCREMENTAL_BOOST_ROUND, MAX_INCREMENTAL_TREES, plan_incremental, save_training_state, training_state
+)
+from model_registry import publish_model
+
+FEATURES = ["L0_S0_F0", "L0_S0_F2", "L1_S24_F1"]
+N_ROWS = 600
+START = pd.Timestamp("2021-01-01 00:00:00")
+TREES = 5
+
+
+def _at(second: int) -> str:
+    return str(START + pd.Timedelta(seconds=second))
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    rng = np.random.default_rng(0)
+    frame = pd.DataFrame(rng.normal(size=(N_ROWS, len(FEATURES))).astype(np.float32), columns=FEATURES)
+    frame.insert(0, "Id", np.arange(N_ROWS))
+    frame["Response"] = rng.integers(0, 2, N_ROWS)
+    frame["SyntheticTimestamp"] = pd.date_range(START, periods=N_ROWS, freq="s")
+    csv_path = str(tmp_path / "parsed.csv")
+    frame.to_csv(csv_path, index=False)
+    return open_dataset(csv_path, str(tmp_path))
+
+
+def _publish(dataset, model_path: str, train_start: int = 100, train_end: int = 299, trees: int = TREES,
+             layout: str = "dense", state: bool = True, imputer: bool = True):
+    """Save a model as if trained on rows train_start..train_end (seconds from START)"""
+    rows = slice(train_start, train_end + 1)
+    X, y = dataset.read_rows(rows), np.asarray(dataset.response[rows])
+    booster = lgb.train({"objective": "binary", "verbose": -1, "num_leaves": 4},
+                        lgb.Dataset(X, y, feature_name=FEATURES), num_boost_round=TREES)
+
+    def write_artifacts(directory):
+        if imputer:
+            MedianImputer(FEATURES).fit(X).save(os.path.join(directory, IMPUTER_FILENAME))
+        if state:
+            save_training_state(directory, training_state(
+                dataset, _at(train_start), _at(train_end), int(y.sum()), int(len(y) - y.sum()), trees, layout
+            ))
+    return publish_model(BoosterClassifier(booster), model_path, write_artifacts)
+
+
+def _rows(dataset, selector) -> np.ndarray:
+    return np.arange(dataset.n_rows)[selector]
+
+
+def _plan(dataset, model_path, start: int, end: int):
+    return plan_incremental(dataset, model_path, _at(start), _at(end))
+
+
+def test_no_previous_model(dataset, tmp_path):
+    plan, reason = _plan(dataset, str(tmp_path / "model.pkl"), 100, 400)
+    assert plan is None and reason == "no previous model"
+
+
+def test_no_training_state(dataset, tmp_path):
+    model_path = str(tmp_path / "model.pkl")
+    version = _publish(dataset, model_path, state=False)
+    plan, reason = _plan(dataset, model_path, 100, 400)
+    assert plan is None and reason == f"model {version} has no training state"
+
+
+def test_dataset_changed(dataset, tmp_path, monkeypatch):
+    model_path = str(tmp_path / "model.pkl")
+    _publish(dataset, model_path)
+    monkeypatch.setattr(dataset, "content_hash", "0" * 64)
+    plan, reason = _plan(dataset, model_path, 100, 400)
+    assert plan is None and reason == "dataset changed since the previous model"
+
+
+@pytest.mark.parametrize("start, end", [(300, 500), (0, 99), (400, 599)])
+def test_no_overlap(dataset, tmp_path, start, end):
+    model_path = str(tmp_path / "model.pkl")
+    _publish(dataset, model_path)
+    plan, reason = _plan(dataset, model_path, start, end)
+    assert plan is None and reason == "training window does not overlap the previous one"
+
+
+@pytest.mark.parametrize("start, end", [(100, 299), (150, 250), (100, 200)])
+def test_no_new_rows(dataset, tmp_path, start, end):
+    model_path = str(tmp_path / "model.pkl")
+    _publish(dataset, model_path)
+    plan, reason = _plan(dataset, model_path, start, end)
+    assert plan is None and reason == "training window adds no rows to the previous one"
+
+
+def test_tree_cap(dataset, tmp_path):
+    model_path = str(tmp_path / "model.pkl")
+    trees = MAX_INCREMENTAL_TREES - INCREMENTAL_BOOST_ROUND + 1
+    _publish(dataset, model_path, trees=trees)
+    plan, reason = _plan(dataset, model_path, 100, 400)
+    assert plan is None and reason == f"previous model already has {trees} trees"
+
+    # Exactly at the cap still qualifies
+    _publish(dataset, model_path, trees=trees - 1)
+    plan, reason = _plan(dataset, model_path, 100, 400)
+    assert plan is not None and reason is None
+
+
+def test_dense_model_needs_imputer(dataset, tmp_path):
+    model_path = str(tmp_path / "model.pkl")
+    version = _publish(dataset, model_path, imputer=False)
+    plan, reason = _plan(dataset, model_path, 100, 400)
+    assert plan is None and reason == f"model {version} has no saved imputer"
+
+
+def test_sparse_model_has_no_imputer(dataset, tmp_path):
+    model_path = str(tmp_path / "model.pkl")
+    _publish(dataset, model_path, layout="sparse", imputer=False)
+    plan, reason = _plan(dataset, model_path, 100, 400)
+    assert reason is None
+    assert plan.feature_layout == "sparse" and plan.imputer is None
+
+
+@pytest.mark.parametrize("start, end, expected_new", [
+    (100, 400, [(300, 400)]),               # TrainEnd moved forward
+    (150, 400, [(300, 400)]),               # ... and TrainStart forward: rows 100-149 slide out
+    (20, 299, [(20, 99)]),                  # TrainStart moved back
+    (20, 250, [(20, 99)]),                  # ... and TrainEnd back
+    (20, 450, [(20, 99), (300, 450)]),      # both ends
+])
+def test_extended_window(dataset, tmp_path, start, end, expected_new):
+    model_path = str(tmp_path / "model.pkl")
+    version = _publish(dataset, model_path)
+    plan, reason = _plan(dataset, model_path, start, end)
+    assert reason is None
+    assert plan.previous_version == version
+    assert plan.previous_trees == TREES
+    assert plan.feature_layout == "dense" and plan.imputer is not None
+
+    # The new rows are exactly the rows of the window outside the previous one
+    timestamps = np.asarray(dataset.timestamps)
+    in_window = (timestamps >= np.datetime64(_at(start))) & (timestamps <= np.datetime64(_at(end)))
+    in_previous = (timestamps >= np.datetime64(_at(100))) & (timestamps <= np.datetime64(_at(299)))
+    new_rows = [_rows(dataset, rows) for rows in plan.new_rows]
+    np.testing.assert_array_equal(np.concatenate(new_rows), np.flatnonzero(in_window & ~in_previous))
+    assert [(rows[0], rows[-1]) for rows in new_rows] == expected_new
+    assert plan.reused_rows == np.count_nonzero(in_window & in_previous)
+
+
+def test_init_model_stops_at_best_iteration(dataset, tmp_path, monkeypatch):
+    model_path = str(tmp_path / "model.pkl")
+    _publish(dataset, model_path)
+    # A previous fit that early-stopped at iteration 3
+    real_load = incremental.joblib.load
+
+    def load_early_stopped(path):
+        model = real_load(path)
+        model.booster_.best_iteration = 3
+        return model
+    monkeypatch.setattr(incremental.joblib, "load", load_early_stopped)
+
+    plan, _ = _plan(dataset, model_path, 100, 400)
+    assert plan.previous_trees == 3
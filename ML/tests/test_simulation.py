@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+
+from dataset_cache import open_dataset
+from simulation import build_batch_events, labels_and_confidence
+
+
+class _Model:
+    classes_ = np.array([0.0, 1.0])
+
+
+def _dataset(tmp_path, timestamps):
+    n_rows = len(timestamps)
+    frame = pd.DataFrame({"Id": np.arange(n_rows), "L0_S0_F0": np.linspace(0, 1, n_rows)})
+    frame["Response"] = np.arange(n_rows) % 2
+    frame["SyntheticTimestamp"] = timestamps
+    csv_path = str(tmp_path / "parsed.csv")
+    frame.to_csv(csv_path, index=False)
+    return open_dataset(csv_path, str(tmp_path))
+
+
+def test_event_timestamps_keep_seconds(tmp_path):
+    timestamps = pd.to_datetime(["2021-01-01 00:00:00", "2021-01-01 12:00:00", "2021-01-01 12:34:56"])
+    dataset = _dataset(tmp_path, timestamps)
+    proba = np.column_stack([np.full(3, 0.8), np.full(3, 0.2)])
+
+    events, seconds = build_batch_events(_Model(), dataset, slice(0, 3), 0, proba=proba)
+
+    # Same form as Timestamp.isoformat(), so clients parse every event as local time
+    assert [event["timestamp"] for event in events] == [ts.isoformat() for ts in timestamps]
+    assert seconds[1] - seconds[0] == 12 * 3600
+
+
+def test_confidence_is_scaled_around_threshold():
+    proba = np.array([0.0, 0.07, 0.14, 0.15, 0.57, 1.0])
+    proba = np.column_stack([1 - proba, proba])
+
+    labels, confidence = labels_and_confidence(_Model(), proba, 0.14)
+    np.testing.assert_array_equal(labels, [0, 0, 0, 1, 1, 1])
+    np.testing.assert_allclose(confidence, [100, 75, 50, 50 + 50 * 0.01 / 0.86, 75, 100])
+
+    # At 0.5 confidence is the probability of the predicted class
+    labels, confidence = labels_and_confidence(_Model(), proba, 0.5)
+    np.testing.assert_allclose(confidence, 100 * proba.max(axis=1))
+
+    # Degenerate thresholds stay within 50-100%
+    for threshold in (0.0, 1.0):
+        _, confidence = labels_and_confidence(_Model(), proba, threshold)
+        assert np.all((confidence >= 50) & (confidence <= 100))
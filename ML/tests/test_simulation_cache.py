@@ -0,0 +1,100 @@
+import asyncio
+
+import simulation_cache
+from simulation_cache import SimulationCache
+
+BATCH = 10
+
+
+def _batches(total: int, produced: list):
+    async def batches():
+        for lo in range(0, total, BATCH):
+            produced.append(lo)
+            events = [{"id": i} for i in range(lo, min(lo + BATCH, total))]
+            yield events, [float(i) for i in range(lo, lo + len(events))]
+    return batches
+
+
+async def _settle():
+    # Events are serialized in a worker thread, so give the producer real time
+    await asyncio.sleep(0.2)
+
+
+def test_scoring_stays_within_lookahead_of_viewers(monkeypatch):
+    monkeypatch.setattr(simulation_cache, "SCORING_LOOKAHEAD_EVENTS", 30)
+    monkeypatch.setattr(simulation_cache, "READ_BATCH_EVENTS", 20)
+
+    async def run():
+        produced = []
+        cache = SimulationCache()
+        simulation, shared = cache.get(("v", "booster", "h", "a", "b"), 200, _batches(200, produced))
+        assert not shared
+        await _settle()
+        # Nobody has read yet: scoring pauses after the look-ahead
+        assert len(simulation.events) == 30 and not simulation.done
+
+        reader = simulation.read(0)
+        position, events, _ = await reader.__anext__()
+        assert (position, len(events)) == (0, 20)
+        await _settle()
+        assert len(simulation.events) == 50
+
+        received = 20 + sum([len(events) async for _, events, _ in reader])
+        assert received == 200 and simulation.done and simulation.error is None
+        assert len(produced) == 20
+
+    asyncio.run(run())
+
+
+def test_unwatched_unfinished_simulations_are_evicted(monkeypatch):
+    monkeypatch.setattr(simulation_cache, "SCORING_LOOKAHEAD_EVENTS", 30)
+
+    async def run():
+        cache = SimulationCache(memory_budget_mb=0)
+        first, _ = cache.get(("v", "booster", "h", "a", "b"), 200, _batches(200, []))
+        await _settle()
+        assert not first.done
+
+        second, shared = cache.get(("v", "booster", "h", "c", "d"), 200, _batches(200, []))
+        await _settle()
+        assert not shared
+        # Over budget: the first one had no viewers, so it stopped scoring and left the cache
+        assert first.done and first.error is not None
+        assert [simulation["id"] for simulation in cache.describe()["simulations"]] == [second.id]
+        second.stop()
+        await _settle()
+
+    asyncio.run(run())
+
+
+def test_resume_position():
+    async def run():
+        cache = SimulationCache()
+        simulation, _ = cache.get(("v", "booster", "h", "a", "b"), 5, _batches(5, []))
+        assert simulation.resume_position(simulation.event_id(2)) == 3
+        assert simulation.resume_position(simulation.event_id(4)) == 5
+        assert simulation.resume_position("other:2") == 0
+        assert simulation.resume_position(None) == 0
+        await _settle()
+
+    asyncio.run(run())
+
+
+def test_resume_beyond_lookahead_on_fresh_simulation(monkeypatch):
+    monkeypatch.setattr(simulation_cache, "SCORING_LOOKAHEAD_EVENTS", 30)
+
+    async def run():
+        cache = SimulationCache()
+        # As after eviction or a restart: the client's id points past anything scored
+        simulation, shared = cache.get(("v", "booster", "h", "a", "b"), 200, _batches(200, []))
+        assert not shared
+        start = simulation.resume_position(simulation.event_id(99))
+
+        reader = simulation.read(start)
+        position, events, _ = await asyncio.wait_for(reader.__anext__(), timeout=5)
+        assert position == 100 and events[0] == '{"id": 100}'
+        await reader.aclose()
+        simulation.stop()
+        await _settle()
+
+    asyncio.run(run())
@@ -0,0 +1,46 @@
+import pytest
+
+from sweep import halving_rungs, parse_sweep_spec
+
+
+def test_grid_and_random_specs():
+    grid = parse_sweep_spec({"params": {"num_leaves": [15, 31], "learning_rate": [0.05, 0.1]}})
+    assert len(grid["candidates"]) == 4 and grid["search"] == "grid"
+
+    spec = {"search": "random", "n_candidates": 8, "seed": 3,
+            "params": {"learning_rate": {"low": 0.01, "high": 0.3, "log": True}, "num_leaves": [15, 31, 63]}}
+    first, second = parse_sweep_spec(spec), parse_sweep_spec(spec)
+    assert first["candidates"] == second["candidates"]
+    assert all(0.01 <= candidate["learning_rate"] <= 0.3 for candidate in first["candidates"])
+
+
+@pytest.mark.parametrize("spec", [
+    None,
+    {"params": {}},
+    {"params": {"num_leaves": []}},
+    {"params": {"boosting": ["dart"]}},
+    {"params": {"num_leaves": ["31"]}},
+    {"params": {"num_leaves": [float("inf")]}},
+    {"search": "bayes", "params": {"num_leaves": [31]}},
+    {"search": "random", "seed": "abc", "params": {"num_leaves": [31]}},
+    {"search": "random", "seed": -1, "params": {"num_leaves": [31]}},
+    {"search": "random", "n_candidates": None, "params": {"num_leaves": [31]}},
+    {"search": "random", "n_candidates": 0, "params": {"num_leaves": [31]}},
+    {"search": "random", "params": {"learning_rate": {"low": "a", "high": 1}}},
+    {"params": {"num_leaves": [31]}, "max_rounds": None},
+    {"params": {"num_leaves": [31]}, "max_rounds": 2.5},
+    {"params": {"num_leaves": [31]}, "max_rounds": 1},
+    {"params": {"num_leaves": [31]}, "eta": [3]},
+    {"params": {"num_leaves": [31]}, "eta": True},
+    {"params": {"num_leaves": [31]}, "threads_per_fit": "2"},
+    {"params": {"num_leaves": [31]}, "threads_per_fit": 0},
+])
+def test_invalid_specs_raise_value_error(spec):
+    with pytest.raises(ValueError):
+        parse_sweep_spec(spec)
+
+
+def test_halving_rungs_end_at_max_rounds():
+    rungs = halving_rungs(27, 270, 3)
+    assert rungs[0][0] == 27 and rungs[-1][1] == 270
+    assert [n for n, _ in rungs] == sorted([n for n, _ in rungs], reverse=True)
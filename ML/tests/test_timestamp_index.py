@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from timestamp_index import TimestampIndex, build_timestamp_index
+
+
+def _index(timestamps: np.ndarray, stride: int) -> TimestampIndex:
+    built = build_timestamp_index(timestamps, stride=stride)
+    assert built["sorted"]
+    return TimestampIndex(built["samples"], built["stride"], timestamps)
+
+
+def _expected(timestamps: np.ndarray, start, end) -> np.ndarray:
+    return np.flatnonzero((timestamps >= start) & (timestamps <= end))
+
+
+@pytest.mark.parametrize("stride", [1, 3, 16, 4096])
+def test_row_range_matches_mask(stride):
+    # One second apart with repeated seconds, like rows parsed in file order
+    seconds = np.repeat(np.arange(500), np.random.default_rng(0).integers(1, 4, 500))
+    timestamps = np.datetime64("2021-01-01T00:00:00") + seconds.astype("timedelta64[s]")
+    index = _index(timestamps, stride)
+
+    rng = np.random.default_rng(stride)
+    for _ in range(200):
+        a, b = np.sort(rng.integers(-20, 520, 2))
+        start = np.datetime64("2021-01-01T00:00:00") + np.timedelta64(int(a), "s")
+        end = np.datetime64("2021-01-01T00:00:00") + np.timedelta64(int(b), "s")
+        rows = index.row_range(start, end)
+        np.testing.assert_array_equal(np.arange(len(timestamps))[rows], _expected(timestamps, start, end))
+
+
+def test_empty_and_inverted_windows():
+    timestamps = np.datetime64("2021-01-01") + np.arange(100).astype("timedelta64[s]")
+    index = _index(timestamps, 8)
+    assert index.row_range(timestamps[50], timestamps[10]) == slice(0, 0)
+
+    empty = _index(timestamps[:0], 8)
+    assert empty.row_range(timestamps[0], timestamps[-1]) == slice(0, 0)
+
+
+def test_unsorted_column_is_flagged():
+    timestamps = np.datetime64("2021-01-01") + np.array([0, 2, 1]).astype("timedelta64[s]")
+    assert not build_timestamp_index(timestamps)["sorted"]
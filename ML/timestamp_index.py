@@ -0,0 +1,53 @@
+import numpy as np
+
+# One index entry per block of rows; a lookup touches at most two blocks
+INDEX_STRIDE = 4096
+
+
+def build_timestamp_index(timestamps: np.ndarray, stride: int = INDEX_STRIDE) -> dict:
+    """
+    Sample every `stride`-th timestamp of a row-ordered timestamp column.
+
+    Returns the sampled timestamps plus whether the column is sorted; the
+    index is only usable for range seeks when it is.
+    """
+    timestamps = np.asarray(timestamps)
+    is_sorted = len(timestamps) < 2 or bool(np.all(timestamps[1:] >= timestamps[:-1]))
+    return {
+        "samples": np.ascontiguousarray(timestamps[::stride]),
+        "stride": stride,
+        "sorted": is_sorted,
+    }
+
+
+class TimestampIndex:
+    """
+    Sparse index from SyntheticTimestamp to row offsets.
+
+    The parser writes rows one second apart in file order, so a window is a
+    contiguous run of rows. The sampled timestamps narrow a lookup down to
+    the block(s) containing the window edges, and only those blocks of the
+    full timestamp column are searched.
+    """
+
+    def __init__(self, samples: np.ndarray, stride: int, timestamps: np.ndarray):
+        self.samples = samples
+        self.stride = stride
+        self.timestamps = timestamps
+        self.n_rows = len(timestamps)
+
+    def _first_row_at_or_after(self, value: np.datetime64, side: str) -> int:
+        # Block whose first sample is the last one before `value`
+        block = max(int(np.searchsorted(self.samples, value, side=side)) - 1, 0)
+        lo = block * self.stride
+        hi = min(lo + 2 * self.stride, self.n_rows)
+        offset = int(np.searchsorted(self.timestamps[lo:hi], value, side=side))
+        return lo + offset
+
+    def row_range(self, start: np.datetime64, end: np.datetime64) -> slice:
+        """Row slice covering start <= timestamp <= end"""
+        if self.n_rows == 0 or end < start:
+            return slice(0, 0)
+        first = self._first_row_at_or_after(start, "left")
+        stop = self._first_row_at_or_after(end, "right")
+        return slice(first, max(first, stop))
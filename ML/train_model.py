@@ -1,82 +1,250 @@
-import pandas as pd
+import numpy as np
 import lightgbm as lgb
 import os
-import json
+import tempfile
+import scipy.sparse as sp
 from sklearn.metrics import (
     accuracy_score, precision_score, recall_score,
     f1_score, confusion_matrix
 )
-import joblib
+from dataset_cache import open_dataset
+from model_registry import publish_model
+from imputation import IMPUTER_FILENAME, MedianImputer
+from compiled_predictor import COMPILED_FOREST_FILENAME, CompiledForest
+from storage import atomic_write_json
+from instrumentation import get_logger, metrics, span
+from boosting import (
+    MODEL_PARAMS, NUM_BOOST_ROUND, BoosterClassifier,
+    binned_cache_paths, build_train_set, build_valid_set, dataset_params,
+    load_binned_train_set, save_binned_train_set
+)
+from sparse_features import DEFAULT_FEATURE_LAYOUT, choose_feature_layout, matrix_nbytes, read_rows_csr
+from incremental import (
+    INCREMENTAL_BOOST_ROUND, plan_incremental, save_training_state, training_state
+)
+from sweep import parse_sweep_spec, run_sweep
+from evaluation import DEFAULT_THRESHOLD, feature_drift, save_decision_threshold, threshold_analysis
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = get_logger(__name__)
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, if the platform reports it"""
+    if resource is None:
+        return None
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2)
+
+
+# How each layout's model sees missing values. Sparse models do not
+# median-fill, and a measured 0.0 is missing to them just like NaN
+MISSING_VALUE_HANDLING = {
+    "dense": "median_filled",
+    "sparse": "zero_as_missing"
+}
+
+
+def _read_features(dataset, rows, layout: str):
+    """Feature rows as a writable float32 block, or as CSR for the sparse layout"""
+    return read_rows_csr(dataset, rows) if layout == "sparse" else dataset.read_rows(rows)
+
+
+def _matrix_mb(X) -> float:
+    return round(matrix_nbytes(X) / (1024 * 1024), 2)
+
+
+def _drop_unlabeled(X, y: np.ndarray):
+    """Remove rows whose Response is missing (only copies if there are any)"""
+    labeled = ~np.isnan(y)
+    if labeled.all():
+        return X, y
+    return X[labeled], y[labeled]
 
-def train_model(filepath: str, range_selection: dict, storage_path: str) -> dict:
-    print(f"Starting training with file: {filepath}")
+
+
+def train_model(filepath: str, range_selection: dict, storage_path: str, progress_callback=None,
+                free_raw_data: bool = True, cache_path: str = None, incremental: bool = False,
+                feature_layout: str = DEFAULT_FEATURE_LAYOUT, sweep: dict = None) -> dict:
+    """
+    Train the LightGBM model on the Train window and evaluate it on the Test window.
+
+    The model and metrics are written to `storage_path` (a session folder);
+    the dataset cache lives under `cache_path`, the shared storage root,
+    defaulting to `storage_path`.
+
+    If given, `progress_callback` is called once per boosting iteration with
+    that iteration's train/valid metrics. The binned training set is cached
+    per (dataset, train window), so retraining the same window skips
+    binning; with `free_raw_data` the raw matrices are released once binned.
+
+    With `incremental`, a Train window that extends the previous model's
+    window (TrainEnd moved forward, or a superset) is fitted as an update:
+    only the rows outside the previous window are read and binned, the
+    previous imputer and bin boundaries are reused, and boosting continues
+    from the previous trees. Otherwise it falls back to a full fit; the
+    reason is reported under training_info["incremental"].
+
+    `feature_layout` "sparse" reads the Train and Test windows as CSR
+    (NaNs and zeros left out) and lets LightGBM treat them as missing
+    (zero_as_missing) instead of median-filling, so unlike a dense model
+    it cannot tell a measured 0.0 from a missing value; this is reported
+    under training_info["feature_layout"]["missing_values"]. "auto" picks
+    the layout from the columns' densities in the dataset statistics.
+    Incremental updates keep the previous model's layout.
+
+    With a `sweep` spec (see sweep.parse_sweep_spec), the candidate
+    parameter sets are first compared by successive halving on the binned
+    training set in a process pool; the best one is then fitted here as
+    the published model and the leaderboard is reported under "sweep".
+
+    The Test window is scored once; those scores give the compiled
+    predictor check, the metrics at 0.5, the ROC/PR curves, calibration
+    and the F1-optimal decision threshold, which is saved with the model
+    and used by /simulate. Feature drift between the windows is reported
+    as per-feature PSI.
+    """
+    logger.info(f"Starting training with file: {filepath}")
     
     try:
-        # Load data in chunks to handle large files
-        CHUNK_SIZE = 50_000  # Reduced chunk size for better memory management
-        chunks = pd.read_csv(filepath, chunksize=CHUNK_SIZE)
-
-        df_list = []
-        for chunk in chunks:
-            if 'Response' not in chunk.columns:
-                raise ValueError("Missing 'Response' column in CSV.")
-            df_list.append(chunk)
+        if sweep is not None and incremental:
+            raise ValueError("A hyperparameter sweep cannot be combined with incremental training")
+        sweep_spec = parse_sweep_spec(sweep) if sweep is not None else None
 
-        if not df_list:
+        # Load data from the columnar cache (converted once per upload)
+        dataset = open_dataset(filepath, cache_path or storage_path)
+        if dataset.response is None:
+            raise ValueError("Missing 'Response' column in CSV.")
+        if dataset.n_rows == 0:
             raise ValueError("No rows loaded from the CSV.")
-
-        df = pd.concat(df_list, axis=0, ignore_index=True)
-        print(f"Loaded {len(df)} total rows")
-        
-        # Convert timestamp column
-        df['SyntheticTimestamp'] = pd.to_datetime(df['SyntheticTimestamp'])
+        logger.info(f"Loaded {dataset.n_rows} total rows")
 
         # Slice data based on provided date ranges
-        train_mask = (
-            (df['SyntheticTimestamp'] >= range_selection['TrainStart']) & 
-            (df['SyntheticTimestamp'] <= range_selection['TrainEnd'])
-        )
-        test_mask = (
-            (df['SyntheticTimestamp'] >= range_selection['TestStart']) & 
-            (df['SyntheticTimestamp'] <= range_selection['TestEnd'])
-        )
-
-        train_df = df[train_mask].copy()
-        test_df = df[test_mask].copy()
-        
-        print(f"Train data: {len(train_df)} rows")
-        print(f"Test data: {len(test_df)} rows")
-        
-        if len(train_df) == 0:
+        train_start, train_end = range_selection['TrainStart'], range_selection['TrainEnd']
+        train_rows = dataset.window(train_start, train_end)
+        test_rows = dataset.window(range_selection['TestStart'], range_selection['TestEnd'])
+        feature_cols = dataset.feature_names
+
+        # Exact window counts from the cache's running totals, before reading any rows
+        train_counts = dataset.window_counts(train_start, train_end)
+        if train_counts["pass"] + train_counts["fail"] == 0:
             raise ValueError("No training data found for the specified date range")
-        if len(test_df) == 0:
+
+        model_path = os.path.join(storage_path, "model.pkl")
+        plan, fallback_reason = None, "full retrain requested"
+        if incremental:
+            plan, fallback_reason = plan_incremental(dataset, model_path, train_start, train_end)
+            if plan is None:
+                logger.info(f"Incremental training not possible ({fallback_reason}), training from scratch")
+        incremental_mode = "incremental" if plan is not None else "full"
+
+        if plan is not None:
+            layout, density = plan.feature_layout, None
+        else:
+            layout, density = choose_feature_layout(feature_layout, dataset)
+        params_for_layout = dataset_params(layout)
+        logger.info(f"Feature layout: {layout} (requested {feature_layout}, density {density})")
+
+        binned_cache_hit = False
+        train_matrix_mb = None
+
+        if plan is not None:
+            logger.info(f"Updating model {plan.previous_version}: {plan.reused_rows} rows reused, "
+                        f"{plan.previous_trees} trees inherited")
+            # Only rows outside the previous window are read; they are filled
+            # with the previous medians, which the inherited trees were fitted on
+            imputer = plan.imputer
+            parts = [_read_features(dataset, rows, layout) for rows in plan.new_rows]
+            X_train = sp.vstack(parts, format="csr") if layout == "sparse" else np.concatenate(parts)
+            y_train = np.concatenate([np.array(dataset.response[rows]) for rows in plan.new_rows])
+            X_train, y_train = _drop_unlabeled(X_train, y_train)
+            if X_train.shape[0] == 0:
+                raise ValueError("No new labeled training rows since the previous model")
+            if imputer is not None:
+                imputer.transform(X_train)
+            train_matrix_mb = _matrix_mb(X_train)
+
+            # Bin with the previous window's boundaries when its binned set is cached
+            previous_bin_path, previous_imputer_path = binned_cache_paths(
+                dataset, plan.previous_state["train_start"], plan.previous_state["train_end"], layout
+            )
+            reference, _ = load_binned_train_set(previous_bin_path, previous_imputer_path, params_for_layout)
+            # Left unconstructed: LightGBM needs the raw rows to compute the
+            # inherited trees' scores as the starting point
+            train_set = lgb.Dataset(
+                X_train, label=y_train, feature_name=feature_cols, reference=reference,
+                params=params_for_layout, free_raw_data=False
+            )
+        else:
+            # Reuse the binned training set if this window was binned before
+            bin_path, binned_imputer_path = binned_cache_paths(dataset, train_start, train_end, layout)
+            train_set, imputer = load_binned_train_set(bin_path, binned_imputer_path, params_for_layout)
+            binned_cache_hit = train_set is not None
+
+            if binned_cache_hit:
+                logger.info(f"Loaded binned training set from: {bin_path}")
+            else:
+                # Read only the needed rows as one writable float32 block (or
+                # CSR); no DataFrame intermediates or per-step copies
+                X_train = _read_features(dataset, train_rows, layout)
+                y_train = np.array(dataset.response[train_rows])
+                X_train, y_train = _drop_unlabeled(X_train, y_train)
+                if X_train.shape[0] == 0:
+                    raise ValueError("No training data found for the specified date range")
+
+                if layout == "dense":
+                    # Fill missing values in place with medians fitted on the training slice only
+                    imputer = MedianImputer(feature_cols).fit(X_train)
+                    imputer.transform(X_train)
+                train_matrix_mb = _matrix_mb(X_train)
+
+                with span("binning", layout=layout):
+                    train_set = build_train_set(X_train, y_train, feature_cols, free_raw_data, params_for_layout)
+                save_binned_train_set(train_set, imputer, bin_path, binned_imputer_path)
+                # The binned set is all LightGBM needs from here on
+                del X_train
+
+        y_train = train_set.get_label()
+
+        X_test = _read_features(dataset, test_rows, layout)
+        y_test = np.array(dataset.response[test_rows])
+        X_test, y_test = _drop_unlabeled(X_test, y_test)
+        if X_test.shape[0] == 0:
             raise ValueError("No test data found for the specified date range")
+        # Sparse-layout models read NaNs and zeros as missing, so the test rows stay as they are
+        if imputer is not None:
+            imputer.transform(X_test)
+        test_matrix_mb = _matrix_mb(X_test)
 
-        # Fill missing values
-        for subset_name, subset in [("train", train_df), ("test", test_df)]:
-            for col in subset.columns:
-                if subset[col].isna().any():
-                    if subset[col].dtype in ['float64', 'int64']:
-                        median_val = subset[col].median()
-                        subset[col] = subset[col].fillna(median_val)
-                    else:
-                        subset[col] = subset[col].fillna("-1")
-
-        # Prepare features and target
-        feature_cols = [col for col in train_df.columns if col not in ['Response', 'Id', 'SyntheticTimestamp']]
-        
-        X_train = train_df[feature_cols].copy()
-        y_train = train_df['Response'].copy()
-        X_test = test_df[feature_cols].copy()
-        y_test = test_df['Response'].copy()
+        # Validation rows are binned with the training set's bin boundaries
+        if plan is not None:
+            valid_set = lgb.Dataset(X_test, label=y_test, reference=train_set,
+                                    params=params_for_layout, free_raw_data=False)
+        else:
+            valid_set = build_valid_set(X_test, y_test, train_set, free_raw_data, params_for_layout)
+
+        logger.info(f"Train data: {len(y_train)} rows")
+        logger.info(f"Test data: {len(y_test)} rows")
 
         # Calculate class weights for imbalanced data
-        pos = int(sum(y_train == 1))
-        neg = int(sum(y_train == 0))
-        scale_pos_weight = neg / pos if pos > 0 else 1.0
+        if plan is not None:
+            pos = int(np.count_nonzero(y_train == 1))
+            neg = int(np.count_nonzero(y_train == 0))
+        else:
+            # Class balance of the window from the dataset statistics
+            pos, neg = train_counts["pass"], train_counts["fail"]
+        total_pos, total_neg = pos, neg
+        if plan is not None:
+            # Weight by everything the model has seen, not just the new rows
+            total_pos += plan.previous_state["positive_samples"]
+            total_neg += plan.previous_state["negative_samples"]
+        scale_pos_weight = total_neg / total_pos if total_pos > 0 else 1.0
 
-        print(f"Positive samples: {pos}, Negative samples: {neg}")
-        print(f"Scale pos weight: {scale_pos_weight}")
+        logger.info(f"Positive samples: {pos}, Negative samples: {neg}")
+        logger.info(f"Scale pos weight: {scale_pos_weight}")
 
         # Initialize results storage
         training_history = {
@@ -103,53 +271,116 @@ def train_model(filepath: str, range_selection: dict, storage_path: str) -> dict
                                 training_history['valid_logloss'].append(result)
                             elif eval_name == 'accuracy':
                                 training_history['valid_accuracy'].append(result)
+                    if progress_callback is not None:
+                        progress_callback({
+                            "iteration": env.iteration + 1,
+                            "total_iterations": env.end_iteration,
+                            **{f"{data_name}_{eval_name}": result for data_name, eval_name, result, _ in train_results}
+                        })
                 return False
             return callback
 
         # Custom accuracy metric
-        def lgb_accuracy(y_true, y_pred):
+        def lgb_accuracy(y_pred, eval_data):
             y_pred_binary = (y_pred > 0.5).astype(int)
-            acc = accuracy_score(y_true, y_pred_binary)
+            acc = accuracy_score(eval_data.get_label(), y_pred_binary)
             return 'accuracy', acc, True
 
-        # Create and configure model
-        model = lgb.LGBMClassifier(
-            objective='binary',
-            scale_pos_weight=scale_pos_weight,
-            n_estimators=50,  # Reduced for faster training
-            max_depth=6,
-            num_leaves=31,
-            learning_rate=0.1,
-            subsample=0.8,
-            colsample_bytree=0.8,
-            random_state=42,
-            verbosity=-1,
-            force_col_wise=True  # Better for wide datasets
-        )
-
-        # Train the model
-        print("Starting model training...")
-        model.fit(
-            X_train, y_train,
-            eval_set=[(X_train, y_train), (X_test, y_test)],
-            eval_names=['training', 'valid_1'],
-            eval_metric=[lgb_accuracy, 'binary_logloss'],
-            callbacks=[
-                lgb.early_stopping(stopping_rounds=10, verbose=False),
-                log_evaluation_callback(period=1)
-            ]
-        )
-
-        print("Training completed!")
-        
+        # Configure model
+        params = {**params_for_layout, **MODEL_PARAMS, "scale_pos_weight": scale_pos_weight}
+        num_boost_round = INCREMENTAL_BOOST_ROUND if plan is not None else NUM_BOOST_ROUND
+
+        sweep_info = None
+        if sweep_spec is not None:
+            # Candidates train in pool processes from the cached binned set;
+            # only the winner is refitted here
+            with span("sweep"), tempfile.TemporaryDirectory(prefix="sweep-", dir=dataset.cache_dir) as work_dir:
+                sweep_info = run_sweep(
+                    sweep_spec, bin_path, valid_set, params, params_for_layout, work_dir, progress_callback
+                )
+            params.update(sweep_info["best_params"])
+            num_boost_round = sweep_spec["max_rounds"]
+            logger.info(f"Best sweep parameters: {sweep_info['best_params']}")
+
+        # Train the model; the training set doubles as the first eval set
+        # without being rebuilt
+        logger.info("Starting model training...")
+        with span("fit", mode=incremental_mode):
+            booster = lgb.train(
+                params,
+                train_set,
+                num_boost_round=num_boost_round,
+                init_model=plan.init_model if plan is not None else None,
+                valid_sets=[train_set, valid_set],
+                valid_names=['training', 'valid_1'],
+                feval=lgb_accuracy,
+                callbacks=[
+                    lgb.early_stopping(stopping_rounds=10, verbose=False),
+                    log_evaluation_callback(period=1)
+                ]
+            )
+        model = BoosterClassifier(booster)
+
+        logger.info("Training completed!")
+
+        # Score the test window once; everything evaluated below reuses these scores
+        with span("evaluate"):
+            proba_test = model.predict_proba(X_test)
+            analysis = threshold_analysis(y_test, proba_test[:, 1])
+        with span("drift"):
+            drift = feature_drift(dataset, train_rows, test_rows)
+        decision_threshold = analysis["chosen"]["threshold"] if analysis["chosen"] else DEFAULT_THRESHOLD
+        logger.info(f"Decision threshold: {decision_threshold} (ROC AUC {analysis['roc_auc']}, "
+                    f"{drift.get('features_major_drift', 0)} features with major drift)")
+
+        # Flatten the trees for the compiled scoring backend and check it
+        # against the booster on the test window before shipping it
+        try:
+            with span("compile"):
+                compiled = CompiledForest.from_model(model)
+                verification = compiled.verify(model, X_test, expected=proba_test)
+            compiled_info = {**compiled.describe(), **verification}
+            logger.info(f"Compiled predictor identical to booster: {compiled.verified}")
+        except ValueError as e:
+            compiled = None
+            compiled_info = {"error": str(e)}
+            logger.warning(f"⚠️ Model cannot be compiled: {e}")
+
+        trees = model.best_iteration_ if model.best_iteration_ > 0 else booster.num_trees()
+        if plan is not None:
+            incremental_info = {
+                "mode": incremental_mode,
+                "previous_model_version": plan.previous_version,
+                "reused_rows": plan.reused_rows,
+                "new_rows": len(y_train),
+                "inherited_trees": plan.previous_trees,
+                "added_trees": trees - plan.previous_trees,
+                "imputer_reused": True,
+                "bin_boundaries_reused": reference is not None
+            }
+        else:
+            incremental_info = {"mode": incremental_mode, "reason": fallback_reason}
+
+        def write_artifacts(directory):
+            # The imputer is saved with the model so inference fills inputs the same way
+            if imputer is not None:
+                imputer.save(os.path.join(directory, IMPUTER_FILENAME))
+            if compiled is not None:
+                compiled.save(os.path.join(directory, COMPILED_FOREST_FILENAME))
+            if analysis["chosen"] is not None:
+                save_decision_threshold(directory, analysis)
+            # Lets the next incremental run find out what this model was trained on
+            save_training_state(directory, training_state(
+                dataset, train_start, train_end, total_pos, total_neg, trees, layout,
+                previous=plan.previous_state if plan is not None else None
+            ))
+
         # Save the trained model
-        model_path = os.path.join(storage_path, "model.pkl")
-        joblib.dump(model, model_path)
-        print(f"✅ Model saved to: {model_path}")
+        version = publish_model(model, model_path, write_artifacts=write_artifacts)
+        logger.info(f"✅ Model {version} saved to: {model_path}")
 
-        # Make predictions
-        y_pred_test = model.predict(X_test)
-        y_pred_train = model.predict(X_train)
+        # Predictions at the fixed 0.5 threshold, as model.predict makes them
+        y_pred_test = model.classes_[(proba_test[:, 1] > DEFAULT_THRESHOLD).astype(int)]
 
         # Calculate metrics
         test_accuracy = accuracy_score(y_test, y_pred_test)
@@ -164,13 +395,25 @@ def train_model(filepath: str, range_selection: dict, storage_path: str) -> dict
         # Prepare results
         results = {
             "training_info": {
-                "total_rows_used": len(df),
-                "train_rows": len(train_df),
-                "test_rows": len(test_df),
+                "total_rows_used": dataset.n_rows,
+                "train_rows": len(y_train),
+                "test_rows": len(y_test),
                 "positive_samples": pos,
                 "negative_samples": neg,
                 "scale_pos_weight": round(scale_pos_weight, 2),
-                "features_used": len(feature_cols)
+                "features_used": len(feature_cols),
+                "train_matrix_mb": train_matrix_mb,
+                "test_matrix_mb": test_matrix_mb,
+                "peak_rss_mb": peak_rss_mb(),
+                "binned_train_set": "cache_hit" if binned_cache_hit else "built",
+                "feature_layout": {
+                    "layout": layout,
+                    "requested": "incremental" if plan is not None else feature_layout,
+                    "density": None if density is None else round(density, 4),
+                    "missing_values": MISSING_VALUE_HANDLING[layout]
+                },
+                "compiled_predictor": compiled_info,
+                "incremental": incremental_info
             },
             "model_performance": {
                 "accuracy": round(test_accuracy * 100, 2),
@@ -191,22 +434,31 @@ def train_model(filepath: str, range_selection: dict, storage_path: str) -> dict
                 "valid_logloss_history": training_history['valid_logloss'],
                 "epochs_trained": len(training_history['train_accuracy'])
             },
+            "decision_threshold": decision_threshold,
+            "threshold_analysis": analysis,
+            "drift": drift,
             "date_ranges": range_selection,
+            "model_version": version,
             "status": "success",
             "message": "Model trained successfully"
         }
 
+        if sweep_info is not None:
+            results["sweep"] = sweep_info
+
         # Save results to JSON file
         output_dir = os.path.join(storage_path)
         os.makedirs(output_dir, exist_ok=True)
         metrics_path = os.path.join(output_dir, "metrics.json")
         
-        with open(metrics_path, "w") as f:
-            json.dump(results, f, indent=4)
+        atomic_write_json(metrics_path, results, indent=4)
+
+        metrics.inc("ml_training_runs_total", mode=incremental_mode)
+        metrics.inc("ml_rows_trained_total", len(y_train))
 
-        print(f"✅ Results saved to: {metrics_path}")
-        print(f"✅ Model Accuracy: {results['model_performance']['accuracy']}%")
-        print(f"✅ Model F1-Score: {results['model_performance']['f1_score']}%")
+        logger.info(f"✅ Results saved to: {metrics_path}")
+        logger.info(f"✅ Model Accuracy: {results['model_performance']['accuracy']}%")
+        logger.info(f"✅ Model F1-Score: {results['model_performance']['f1_score']}%")
 
         return results
 
@@ -222,10 +474,9 @@ def train_model(filepath: str, range_selection: dict, storage_path: str) -> dict
             output_dir = os.path.join(storage_path)
             os.makedirs(output_dir, exist_ok=True)
             metrics_path = os.path.join(output_dir, "metrics.json")
-            with open(metrics_path, "w") as f:
-                json.dump(error_result, f, indent=4)
+            atomic_write_json(metrics_path, error_result, indent=4)
         except:
             pass
             
-        print(f"❌ Training error: {e}")
+        logger.error(f"❌ Training error: {e}")
         raise e
\ No newline at end of file